@@ -0,0 +1,307 @@
+from util.library import Link, Filter, Album, AlbumCache, Library
+from util.ai import Provenance
+from screens.sync.sync_planner import ManifestEntry, SyncPlanner
+from collections.abc import Callable
+import statistics
+import tracemalloc
+import platform
+import argparse
+import tempfile
+import random
+import shutil
+import struct
+import json
+import time
+import zlib
+import os
+
+# Synthetic library (album folders with placeholder images & metadata files like the ones the app creates)
+class LibraryGenerator:
+
+    # Words used to create captions, labels & text
+    subjects: list[str] = ['a cat', 'a dog', 'two people', 'a child', 'a car', 'a bicycle', 'a plate of food', 'a cake', 'a building', 'a tree', 'a boat', 'a group of friends']
+    places: list[str] = ['on a sofa', 'in a park', 'on the beach', 'in a kitchen', 'on a street', 'at night', 'in the snow', 'next to a window', 'in a restaurant', 'on a table']
+    labels: list[str] = ['cat', 'dog', 'person', 'child', 'car', 'bicycle', 'food', 'cake', 'building', 'tree', 'boat', 'sea', 'sky', 'street', 'night', 'snow', 'window', 'table', 'sofa', 'grass', 'phone', 'book', 'cup', 'sign']
+    words: list[str] = ['open', 'exit', 'sale', 'menu', 'coffee', 'street', 'parking', 'ticket', 'total', 'price', 'welcome', 'station', 'monday', 'receipt', 'hello', 'world', 'no', 'entry', 'free', 'wifi']
+
+    # Date of the oldest item & seconds between items
+    first_date: int = 1_600_000_000
+    item_interval: int = 600
+
+
+    # Constructor
+    def __init__(self, folder: str, albums: int, items: int, placeholder: str = 'empty', metadata_rate: float = 0.8, deleted_rate: float = 0.05, seed: int = 0):
+        self.folder: str = folder
+        self.albums: int = albums
+        self.items: int = items
+        self.placeholder: str = placeholder
+        self.metadata_rate: float = metadata_rate
+        self.deleted_rate: float = deleted_rate
+        self.seed: int = seed
+
+    # Placeholders
+    @staticmethod
+    def create_png() -> bytes:
+        # Smallest valid image (1x1 white PNG)
+        def chunk(name: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + name + data + struct.pack('>I', zlib.crc32(name + data))
+        return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')) + chunk(b'IEND', b'')
+
+    # Metadata
+    def create_item_metadata(self, rng: random.Random, provenance: dict[str, list]) -> dict:
+        # Caption & labels (most items) & text lines (some items)
+        item_metadata: dict = { 'caption': f'{rng.choice(LibraryGenerator.subjects)} {rng.choice(LibraryGenerator.places)}'.capitalize() }
+        if rng.random() < 0.9: item_metadata['labels'] = rng.sample(LibraryGenerator.labels, rng.randrange(3, 9))
+        item_metadata['text'] = [' '.join(rng.choices(LibraryGenerator.words, k=rng.randrange(1, 6))) for _ in range(rng.randrange(0, 7) if rng.random() < 0.4 else 0)]
+        item_metadata['provenance'] = { field: provenance[field] for field in ('caption', 'labels', 'text') if field in item_metadata }
+        return item_metadata
+
+    # Library
+    def generate(self) -> list[Link]:
+        # Create albums (items are dated from oldest to newest, like photos taken over time)
+        rng: random.Random = random.Random(self.seed)
+        png: bytes = LibraryGenerator.create_png() if self.placeholder == 'tiny' else b''
+        provenance: dict[str, list] = Provenance.get_current()
+        links: list[Link] = []
+        for album_index in range(self.albums):
+            # Create items
+            album_path: str = os.path.join(self.folder, f'album{album_index:02d}')
+            os.makedirs(album_path)
+            metadata: dict = {}
+            for item_index in range(self.items):
+                item_name: str = f'IMG_{album_index:02d}_{item_index:06d}.png'
+                item_path: str = os.path.join(album_path, item_name)
+                with open(item_path, 'wb') as file:
+                    file.write(png)
+                item_date: int = LibraryGenerator.first_date + item_index * LibraryGenerator.item_interval
+                os.utime(item_path, (item_date, item_date))
+                if rng.random() < self.metadata_rate: metadata[item_name] = self.create_item_metadata(rng, provenance)
+
+            # Add metadata of items deleted since it was created (removed when cleaning)
+            for deleted_index in range(int(self.items * self.deleted_rate)):
+                metadata[f'IMG_{album_index:02d}_deleted{deleted_index:06d}.png'] = self.create_item_metadata(rng, provenance)
+
+            # Save metadata (not sorted, like metadata merged from the phone)
+            metadata_path: str = os.path.join(self.folder, f'metadata{album_index:02d}.json')
+            keys: list[str] = list(metadata.keys())
+            rng.shuffle(keys)
+            with open(metadata_path, 'w', encoding='utf-8') as file:
+                json.dump({ key: metadata[key] for key in keys }, file, ensure_ascii=False)
+            links.append(Link(album_path, metadata_path))
+        return links
+
+    def create_client_albums(self, albums: list[Album], changes: float) -> list[list]:
+        # Album lists the phone would send ([name, size, last modified] from newest to oldest), with some items deleted & added
+        rng: random.Random = random.Random(f'{self.seed}-client')
+        client_albums: list[list] = []
+        for album_index, album in enumerate(albums):
+            client_album: list[list] = []
+            for item in album.items:
+                if rng.random() < changes: continue
+                stat: os.stat_result = os.stat(item.path)
+                client_album.append([item.name, stat.st_size, int(stat.st_mtime)])
+            for new_index in range(int(len(album.items) * changes)):
+                client_album.insert(0, [f'IMG_{album_index:02d}_new{new_index:06d}.png', 2_000_000, LibraryGenerator.first_date + (self.items + new_index) * LibraryGenerator.item_interval])
+            client_albums.append(client_album)
+        return client_albums
+
+# Library benchmark (times the main library paths on a synthetic library)
+class LibraryBenchmark:
+
+    # Texts searched (in captions, in labels, in text lines & not found)
+    searches: list[str] = ['cat', 'tree', 'coffee', 'zebra']
+
+
+    # Constructor
+    def __init__(self, args: argparse.Namespace):
+        self.args: argparse.Namespace = args
+        self.generator: LibraryGenerator = None
+
+        # Benchmarks (name -> function that prepares a run & returns what is measured)
+        self.benchmarks: dict[str, Callable[[], Callable]] = {
+            'load-albums': self.prepare_load_albums,
+            'load-albums-cached': self.prepare_load_albums_cached,
+            'load-items': self.prepare_load_items,
+            'search': self.prepare_search,
+            'clean-metadata': self.prepare_clean_metadata,
+            'save-metadata': self.prepare_save_metadata,
+            'plan-download': self.prepare_plan_download,
+        }
+
+    # Helpers
+    @staticmethod
+    def load_albums(filter: list[str] = Filter.images, validate_metadata: bool = True) -> list[Album]:
+        (success, albums) = Library.load_albums(filter, validate_metadata)
+        if not success: raise RuntimeError('Failed to load the synthetic albums')
+        return albums
+
+    @staticmethod
+    def measure_memory(task: Callable) -> tuple[float, float]:
+        # Peak memory while running & memory still used by its result (MB, traced in a separate run because tracing is slow)
+        tracemalloc.start()
+        try:
+            start: int = tracemalloc.get_traced_memory()[0]
+            result = task()
+            (current, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del result
+        return ((peak - start) / 1_048_576, (current - start) / 1_048_576)
+
+    # Benchmarks (each one prepares a run without measuring it)
+    def prepare_load_albums(self) -> Callable:
+        # Parse every metadata file & scan every album folder
+        return lambda: LibraryBenchmark.load_albums()
+
+    def prepare_load_albums_cached(self) -> Callable:
+        # Load albums that didn't change since the last time (like opening the metadata menu again)
+        Library.load_albums(Filter.images, use_cache=True)
+        return lambda: Library.load_albums(Filter.images, use_cache=True)
+
+    def prepare_load_items(self) -> Callable:
+        # Scan every album folder again (metadata is already loaded)
+        albums: list[Album] = LibraryBenchmark.load_albums()
+        def run():
+            for album in albums: album.load_items(Filter.images)
+            return albums
+        return run
+
+    def prepare_search(self) -> Callable:
+        # Search every album for a few texts
+        albums: list[Album] = LibraryBenchmark.load_albums()
+        def run():
+            results: list = []
+            for search in LibraryBenchmark.searches:
+                for album in albums: album.search(search, lambda item, score: results.append((item, score)))
+            return results
+        return run
+
+    def prepare_clean_metadata(self) -> Callable:
+        # Sort & clean the metadata of every album (albums are loaded again each run so there is something to clean)
+        albums: list[Album] = LibraryBenchmark.load_albums()
+        def run():
+            for album in albums: album.clean_metadata()
+            return albums
+        return run
+
+    def prepare_save_metadata(self) -> Callable:
+        # Save the metadata of every album (without backups, so runs don't fill the folder)
+        albums: list[Album] = LibraryBenchmark.load_albums()
+        def run():
+            for album in albums: album.save_metadata(backup=False)
+            return albums
+        return run
+
+    def prepare_plan_download(self) -> Callable:
+        # Compare the host albums with the phone lists like when downloading albums (manifests are created from the lists the phone sent)
+        albums: list[Album] = LibraryBenchmark.load_albums(Filter.all, validate_metadata=False)
+        client_albums: list[list] = self.generator.create_client_albums(albums, self.args.changes)
+        def run():
+            manifests: list[dict[str, ManifestEntry]] = [SyncPlanner.create_client_manifest(client_album) for client_album in client_albums]
+            return SyncPlanner.plan(albums, manifests)
+        return run
+
+    # Runs
+    def get_names(self) -> list[str]:
+        return list(self.benchmarks.keys()) if self.args.only is None else self.args.only.split(',')
+
+    def run_benchmark(self, name: str) -> dict:
+        # Time runs
+        args: argparse.Namespace = self.args
+        prepare: Callable[[], Callable] = self.benchmarks[name]
+        seconds: list[float] = []
+        for _ in range(args.runs):
+            task: Callable = prepare()
+            start: float = time.perf_counter()
+            task()
+            seconds.append(time.perf_counter() - start)
+
+        # Measure memory
+        (peak, retained) = LibraryBenchmark.measure_memory(prepare())
+
+        # Create result
+        median: float = statistics.median(seconds)
+        items: int = args.albums * args.items
+        return {
+            'runs': [round(value, 6) for value in seconds],
+            'medianSeconds': round(median, 6),
+            'minSeconds': round(min(seconds), 6),
+            'itemsPerSecond': round(items / median, 1) if median > 0 else None,
+            'peakMB': round(peak, 3),
+            'retainedMB': round(retained, 3),
+        }
+
+    def run(self) -> dict:
+        # Benchmarks to run
+        args: argparse.Namespace = self.args
+        names: list[str] = self.get_names()
+
+        # Generate library
+        folder: str = tempfile.mkdtemp(prefix='coon-library-benchmark-')
+        results: dict[str, dict] = {}
+        try:
+            generate_start: float = time.perf_counter()
+            self.generator = LibraryGenerator(folder, args.albums, args.items, args.placeholder, args.metadata_rate, args.deleted_rate, args.seed)
+            Library.links = self.generator.generate()
+            metadata_bytes: int = sum(os.path.getsize(link.metadata_path) for link in Library.links)
+            print(f'Generated {args.albums} albums with {args.items} items ({metadata_bytes / 1_048_576:.2f} MB of metadata) in {time.perf_counter() - generate_start:.2f}s')
+
+            # Run benchmarks
+            for name in names:
+                results[name] = self.run_benchmark(name)
+                self.print_result(name, results[name])
+        finally:
+            # Forget cached albums & delete library
+            AlbumCache.remove_unlinked([])
+            if args.keep:
+                print(f'Library kept in "{folder}"')
+            else:
+                shutil.rmtree(folder, ignore_errors=True)
+
+        # Create report
+        return {
+            'label': args.label,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': { key: value for key, value in vars(args).items() if key not in ('json', 'keep', 'label') },
+            'library': { 'albums': args.albums, 'items': args.albums * args.items, 'metadataBytes': metadata_bytes },
+            'benchmarks': results,
+        }
+
+    # Output
+    def print_result(self, name: str, result: dict):
+        print(f'{name}: {result["medianSeconds"] * 1000:.1f} ms (min {result["minSeconds"] * 1000:.1f} ms), {result["itemsPerSecond"] or 0:.0f} items/s, peak {result["peakMB"]:.2f} MB, retained {result["retainedMB"]:.2f} MB')
+
+# Command
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Benchmarks the library paths (loading, searching, cleaning, saving & planning downloads) on a synthetic library')
+    parser.add_argument('--albums', type=int, default=5, help='Albums in the library')
+    parser.add_argument('--items', type=int, default=2000, help='Items in each album')
+    parser.add_argument('--placeholder', choices=['empty', 'tiny'], default='empty', help='Item files content (empty files or a tiny valid image)')
+    parser.add_argument('--metadata-rate', type=float, default=0.8, help='Fraction of items with metadata')
+    parser.add_argument('--deleted-rate', type=float, default=0.05, help='Metadata entries of deleted items (fraction of the items, removed when cleaning)')
+    parser.add_argument('--changes', type=float, default=0.05, help='Fraction of items added & deleted in the phone (plan-download)')
+    parser.add_argument('--only', help='Comma separated list of benchmarks to run (all by default)')
+    parser.add_argument('--runs', type=int, default=3, help='Times each benchmark is run')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic library')
+    parser.add_argument('--label', help='Name saved in the report (like the app version)')
+    parser.add_argument('--json', help='Save the report in this JSON file')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic library')
+    args = parser.parse_args()
+
+    # Check benchmarks
+    benchmark: LibraryBenchmark = LibraryBenchmark(args)
+    for name in benchmark.get_names():
+        if name not in benchmark.benchmarks: parser.error(f'unknown benchmark "{name}" (available: {", ".join(benchmark.benchmarks.keys())})')
+
+    # Run benchmark
+    report: dict = benchmark.run()
+
+    # Save report
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+
+if __name__ == '__main__':
+    main()
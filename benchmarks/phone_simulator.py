@@ -0,0 +1,480 @@
+from screens.sync.sync_protocol import Feature, Frame, Protocol
+from screens.sync.sync_metadata import MetadataDelta
+from dataclasses import dataclass, field
+import websockets
+import hashlib
+import asyncio
+import random
+import struct
+import json
+import time
+import zlib
+
+# Synthetic item (its data is a slice of the library data pool)
+@dataclass
+class SyntheticItem:
+    name: str
+    size: int
+    last_modified: int
+    offset: int
+    crc: int = None
+
+# Synthetic library (albums & metadata generated from a seed, so both sides can check what was sent)
+class SyntheticLibrary:
+
+    # Random data shared by all items (each one starts at a different offset)
+    pool_size: int = 8_388_608
+
+
+    # Constructor
+    def __init__(self, albums: int, items: int, size_kb: float, size_spread: float = 0, seed: int = 0):
+        # Create data pool
+        rng: random.Random = random.Random(seed)
+        self.pool: bytes = rng.randbytes(SyntheticLibrary.pool_size)
+
+        # Create albums (items sizes follow a log-normal distribution around the size, 0 spread makes them all equal)
+        self.albums: list[list[SyntheticItem]] = []
+        for album_index in range(albums):
+            album: list[SyntheticItem] = []
+            for item_index in range(items):
+                size: int = max(int(size_kb * 1024 * (rng.lognormvariate(0, size_spread) if size_spread > 0 else 1)), 0)
+                album.append(SyntheticItem(f'IMG_{album_index:02d}_{item_index:05d}.jpg', size, 1_700_000_000 + item_index * 60, rng.randrange(SyntheticLibrary.pool_size)))
+
+            # Albums are sorted from newest to oldest like in the phone
+            album.reverse()
+            self.albums.append(album)
+
+        # Metadata files (by album index)
+        self.metadata: dict[int, bytes] = {}
+        self.seed: int = seed
+
+        # Items replaced so far (new items are numbered with it)
+        self.changed_items: int = 0
+
+    # Items
+    def read(self, item: SyntheticItem, offset: int, length: int) -> bytes:
+        # Read item data (wrapping around the pool)
+        length = max(min(length, item.size - offset), 0)
+        start: int = (item.offset + offset) % SyntheticLibrary.pool_size
+        data: bytes = self.pool[start:start + length]
+        while len(data) < length:
+            data += self.pool[:length - len(data)]
+        return data
+
+    def get_crc(self, item: SyntheticItem) -> int:
+        # CRC32 of the whole item (cached)
+        if item.crc is None:
+            crc: int = 0
+            for offset in range(0, item.size, 1_048_576):
+                crc = zlib.crc32(self.read(item, offset, 1_048_576), crc)
+            item.crc = crc
+        return item.crc
+
+    def get_sampled_hash(self, item: SyntheticItem) -> str:
+        # Same as the protocol sampled hash (size, start, middle & end of the item)
+        sample_size: int = Protocol.hash_sample_size
+        hash = hashlib.sha256(item.size.to_bytes(8, 'big'))
+        if item.size <= sample_size * 3:
+            hash.update(self.read(item, 0, item.size))
+        else:
+            for offset in (0, (item.size - sample_size) // 2, item.size - sample_size):
+                hash.update(self.read(item, offset, sample_size))
+        return hash.hexdigest()
+
+    def count_bytes(self) -> int:
+        return sum(item.size for album in self.albums for item in album)
+
+    def change_items(self, count: int):
+        # Replace the oldest items of each album with new ones (like taking photos & deleting old ones)
+        rng: random.Random = random.Random(f'{self.seed}-changes-{self.changed_items}')
+        for change_index in range(count):
+            album_index: int = change_index % len(self.albums)
+            album: list[SyntheticItem] = self.albums[album_index]
+            size: int = album.pop().size if len(album) > 0 else 1024
+            newest: int = album[0].last_modified if len(album) > 0 else 1_700_000_000
+            album.insert(0, SyntheticItem(f'IMG_{album_index:02d}_new{self.changed_items:05d}.jpg', size, newest + 60, rng.randrange(SyntheticLibrary.pool_size)))
+            self.changed_items += 1
+
+    # Metadata
+    def create_metadata(self, album_index: int, tag: str) -> dict:
+        # Create item metadata (some items don't have every field)
+        rng: random.Random = random.Random(f'{self.seed}-{album_index}-{tag}')
+        metadata: dict = {}
+        for item in self.albums[album_index]:
+            item_metadata: dict = { 'caption': f'A {tag} photo of {rng.choice(["a cat", "a dog", "the sea", "a street", "some friends"])} number {item.name}' }
+            if rng.random() < 0.8: item_metadata['labels'] = rng.sample(['cat', 'dog', 'sea', 'street', 'people', 'night', 'food', 'car'], 3)
+            if rng.random() < 0.3: item_metadata['text'] = [f'{tag} text {rng.randrange(1_000_000)}' for _ in range(rng.randrange(1, 6))]
+            metadata[item.name] = item_metadata
+        return metadata
+
+    def get_metadata(self, album_index: int) -> bytes:
+        # Metadata file of the phone (cached)
+        if album_index not in self.metadata:
+            self.metadata[album_index] = json.dumps(self.create_metadata(album_index, 'phone'), ensure_ascii=False).encode('utf-8')
+        return self.metadata[album_index]
+
+# Phone simulator options
+@dataclass
+class SimulatorOptions:
+    # Protocol version, features (None sends no hello, like old phone app versions) & device id
+    protocol: int = Protocol.version
+    features: list[str] = field(default_factory=lambda: list(Protocol.features))
+    device_id: str = 'phone-simulator'
+
+    # Parts (item & metadata part size, bundle chunk size)
+    part_size: int = 524_288
+    chunk_size: int = 65_536
+
+    # Network (seconds added to every sent message, chance of a message being lost & seconds until it is sent again)
+    latency: float = 0
+    drop_rate: float = 0
+    drop_delay: float = 0.2
+
+    # Chance of a part arriving corrupted (only detected with checksums)
+    corrupt_rate: float = 0
+
+    # Seed of drops & corruption
+    seed: int = 0
+
+# Phone simulator (websocket client that answers the sync server like the phone app)
+class PhoneSimulator:
+
+    # Constructor
+    def __init__(self, library: SyntheticLibrary, options: SimulatorOptions):
+        # Info
+        self.library: SyntheticLibrary = library
+        self.options: SimulatorOptions = options
+        self.rng: random.Random = random.Random(options.seed)
+        self.protocol: int = 1
+        self.features: set[str] = set()
+
+        # Connection & messages waiting to be sent (due time & data)
+        self.websocket: websockets.ClientConnection = None
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.last_due: float = 0
+
+        # Sync state (set when the server ends a sync)
+        self.finished: asyncio.Event = asyncio.Event()
+        self.is_connected: asyncio.Event = asyncio.Event()
+        self.legacy_parts: dict[tuple[int, int], int] = {}
+
+        # Albums list accepted by the server & its sync token (kept between connections, set when the server accepts a list)
+        self.sync_token: str = None
+        self.synced_albums: list[list] = None
+        self.sent_albums: list[list] = None
+        self.albums_accepted: asyncio.Event = asyncio.Event()
+
+        # Uploaded metadata (current info, received parts & received files by album index)
+        self.upload_info: dict = None
+        self.upload_parts: dict[int, bytes] = {}
+        self.uploaded: dict[int, bytes] = {}
+
+        # Merged metadata items sent by the server (by album index)
+        self.merged: dict[int, dict] = {}
+
+        # Counters & timings (metadata parts requested by the phone, metadata sent by album)
+        self.messages_sent: int = 0
+        self.bytes_sent: int = 0
+        self.drops: int = 0
+        self.corruptions: int = 0
+        self.part_requests: dict[tuple[int, int], float] = {}
+        self.part_round_trips: list[float] = []
+        self.album_times: list[float] = []
+        self.album_start: float = None
+
+    # Connection
+    async def run(self, url: str):
+        async with websockets.connect(url, max_size=None) as websocket:
+            self.websocket = websocket
+            sender: asyncio.Task = asyncio.create_task(self.run_sender())
+            try:
+                # Send hello (the albums list is sent after the answer) or the albums list (old phone app versions)
+                self.albums_accepted.clear()
+                if self.options.features is not None:
+                    await websocket.send(json.dumps({ 'action': 'hello', 'protocol': self.options.protocol, 'features': self.options.features, 'deviceId': self.options.device_id }))
+                else:
+                    await self.send_albums()
+
+                # Answer messages
+                async for message in websocket:
+                    if isinstance(message, str):
+                        await self.on_received_string(json.loads(message))
+                    else:
+                        await self.on_received_binary(message)
+            finally:
+                sender.cancel()
+
+    async def run_sender(self):
+        # Send messages in order once they are due (a lost message delays the ones after it, like TCP)
+        while True:
+            (due, data) = await self.outbox.get()
+            delay: float = due - time.perf_counter()
+            if delay > 0: await asyncio.sleep(delay)
+            await self.websocket.send(data)
+
+    async def send(self, data):
+        # Add latency & simulate lost messages being sent again
+        due: float = time.perf_counter() + self.options.latency
+        if self.options.drop_rate > 0 and self.rng.random() < self.options.drop_rate:
+            self.drops += 1
+            due += self.options.drop_delay
+        self.last_due = max(due, self.last_due)
+
+        # Add message
+        self.messages_sent += 1
+        self.bytes_sent += len(data)
+        await self.outbox.put((self.last_due, data))
+
+    def has_feature(self, feature: str) -> bool:
+        return feature in self.features
+
+    def get_albums_list(self) -> list[list]:
+        # Old phone app versions only send item names
+        if self.options.features is not None and Feature.ALBUM_ITEM_INFO in self.options.features:
+            return [[[item.name, item.size, item.last_modified] for item in album] for album in self.library.albums]
+        return [[item.name for item in album] for album in self.library.albums]
+
+    def get_albums_delta(self, albums: list[list]) -> list[dict]:
+        # Changes since the albums list the server accepted (None if albums were added or removed)
+        if self.synced_albums is None or len(albums) != len(self.synced_albums): return None
+        delta: list[dict] = []
+        for album, synced_album in zip(albums, self.synced_albums):
+            # Changed items are removed & added again on their index
+            synced_items: dict[str, list] = { item[0]: item for item in synced_album }
+            album_items: dict[str, list] = { item[0]: item for item in album }
+            delta.append({
+                'removed': [name for name, item in synced_items.items() if album_items.get(name) != item],
+                'added': [[index, *item] for index, item in enumerate(album) if synced_items.get(item[0]) != item],
+                'count': len(album),
+            })
+        return delta
+
+    async def send_albums(self, full: bool = False):
+        # Send only the changes if the server accepted a list before (& the whole list if they can't be sent or it asks for it)
+        albums: list[list] = self.get_albums_list()
+        self.sent_albums = albums
+        delta: list[dict] = None
+        if not full and self.sync_token is not None and self.has_feature(Feature.INCREMENTAL_ALBUMS): delta = self.get_albums_delta(albums)
+        if delta is not None:
+            await self.send(json.dumps({ 'action': 'albumsDelta', 'token': self.sync_token, 'albums': delta }))
+        else:
+            await self.send(json.dumps({ 'action': 'albums', 'albums': albums }))
+
+        # Old servers don't accept lists, so the phone is ready once it is sent
+        if not self.has_feature(Feature.INCREMENTAL_ALBUMS): self.albums_accepted.set()
+        self.is_connected.set()
+
+    def corrupt(self, data: bytes) -> bytes:
+        # Flip the first byte of some parts
+        if self.options.corrupt_rate <= 0 or len(data) == 0 or self.rng.random() >= self.options.corrupt_rate: return data
+        self.corruptions += 1
+        return bytes([data[0] ^ 0xFF]) + data[1:]
+
+    # Messages
+    async def on_received_string(self, message: dict):
+        match message.get('action'):
+            case 'hello':
+                self.protocol = message.get('protocol', 1)
+                self.features = set(message.get('features', []))
+                await self.send_albums()
+            case 'albumsToken':
+                self.sync_token = message['token']
+                self.synced_albums = self.sent_albums
+                self.albums_accepted.set()
+            case 'requestAlbums':
+                await self.send_albums(True)
+            case 'requestItemInfo':
+                await self.send_item_info(message)
+            case 'requestItemData':
+                await self.send_item_part(message['albumIndex'], message['itemIndex'], message['part'], message.get('requestId'))
+            case 'requestItemHash':
+                item: SyntheticItem = self.library.albums[message['albumIndex']][message['itemIndex']]
+                await self.send(json.dumps({ 'action': 'itemHash', 'albumIndex': message['albumIndex'], 'itemIndex': message['itemIndex'], 'hash': self.library.get_sampled_hash(item) }))
+            case 'requestItemBundle':
+                await self.send_bundle(message['bundleId'], message['items'])
+            case 'requestMetadataInfo':
+                await self.send_metadata_info(message['albumIndex'])
+            case 'requestMetadataData':
+                await self.send_metadata_part(message['albumIndex'], message.get('part'))
+            case 'startMetadataRequest':
+                await self.request_upload(0)
+            case 'metadataInfo':
+                await self.on_received_metadata_info(message)
+            case 'requestMetadataDigest':
+                metadata: dict = json.loads(self.library.get_metadata(message['albumIndex']))
+                await self.send(json.dumps({ 'action': 'metadataDigest', 'albumIndex': message['albumIndex'], 'digest': MetadataDelta.get_digest(metadata) }))
+            case 'requestMetadataItems':
+                metadata: dict = json.loads(self.library.get_metadata(message['albumIndex']))
+                await self.send(json.dumps({ 'action': 'metadataItems', 'albumIndex': message['albumIndex'], 'items': { item_name: metadata[item_name] for item_name in message['items'] } }))
+            case 'metadataItems':
+                self.merged.setdefault(message['albumIndex'], {}).update(message['items'])
+            case 'endSync':
+                self.finish_album()
+                self.finished.set()
+
+    async def on_received_binary(self, data: bytes):
+        # Check if data is a binary frame
+        if self.protocol >= 2:
+            match data[0]:
+                case Frame.REQUEST_ITEM_PART:
+                    (_, request_id, album_index, item_index, part_index, _) = Protocol.frame_request_item_part.unpack(data)
+                    await self.send_item_part(album_index, item_index, part_index, request_id)
+                case Frame.REQUEST_METADATA_PART:
+                    (album_index, part_index, _) = Protocol.unpack_metadata_part(data)
+                    await self.send_metadata_part(album_index, part_index)
+                case Frame.METADATA_PART:
+                    (_, part_index, part) = Protocol.unpack_metadata_part(data)
+                    await self.on_received_metadata_part(part_index, bytes(part))
+            return
+
+        # Metadata parts have a header (old versions send the whole file)
+        if self.has_feature(Feature.CHUNKED_METADATA):
+            (_, part_index, part) = Protocol.unpack_part(data)
+            await self.on_received_metadata_part(part_index, bytes(part))
+        else:
+            await self.on_received_metadata_part(0, data)
+
+    # Items
+    async def send_item_info(self, message: dict):
+        # Create info
+        item: SyntheticItem = self.library.albums[message['albumIndex']][message['itemIndex']]
+        info: dict = {
+            'action': 'itemInfo',
+            'albumIndex': message['albumIndex'],
+            'itemIndex': message['itemIndex'],
+            'lastModified': item.last_modified,
+            'size': item.size,
+            'maxPartSize': self.options.part_size,
+            'parts': Protocol.count_parts(item.size, self.options.part_size)
+        }
+        if 'requestId' in message: info['requestId'] = message['requestId']
+        if self.has_feature(Feature.CHECKSUMS): info['crc32'] = self.library.get_crc(item)
+
+        # Send info
+        await self.send(json.dumps(info))
+
+    async def send_item_part(self, album_index: int, item_index: int, part_index: int, request_id: int):
+        # Old versions keep their own part counter
+        if not self.has_feature(Feature.WINDOWED_PARTS) and not self.has_feature(Feature.CONCURRENT_ITEMS):
+            part_index = self.legacy_parts.get((album_index, item_index), 0)
+            self.legacy_parts[(album_index, item_index)] = part_index + 1
+
+        # Read part
+        item: SyntheticItem = self.library.albums[album_index][item_index]
+        data: bytes = self.library.read(item, part_index * self.options.part_size, self.options.part_size)
+        crc: int = zlib.crc32(data)
+        data = self.corrupt(data)
+
+        # Send it with the header the server expects
+        if self.protocol >= 2:
+            await self.send(Protocol.frame_item_part.pack(Frame.ITEM_PART, request_id, part_index, crc if self.has_feature(Feature.CHECKSUMS) else 0) + data)
+        elif self.has_feature(Feature.CHECKSUMS):
+            await self.send(Protocol.part_header_crc.pack(request_id, part_index, crc) + data)
+        elif self.has_feature(Feature.CONCURRENT_ITEMS):
+            await self.send(Protocol.pack_part(request_id, part_index, data))
+        else:
+            await self.send(data)
+
+    async def send_bundle(self, bundle_id: int, items: list[list[int]]):
+        # Send items back to back in chunks
+        stream: bytearray = bytearray()
+        chunk_index: int = 0
+        for position, (album_index, item_index) in enumerate(items):
+            item: SyntheticItem = self.library.albums[album_index][item_index]
+            stream += Protocol.bundle_entry.pack(position, Protocol.bundle_status_ok, item.size, item.last_modified, self.library.get_crc(item))
+            for offset in range(0, item.size, self.options.chunk_size):
+                stream += self.corrupt(self.library.read(item, offset, self.options.chunk_size))
+
+                # Send full chunks
+                while len(stream) >= self.options.chunk_size:
+                    await self.send(Protocol.frame_bundle_data.pack(Frame.BUNDLE_DATA, bundle_id, chunk_index) + stream[:self.options.chunk_size])
+                    del stream[:self.options.chunk_size]
+                    chunk_index += 1
+
+        # Send last chunk
+        if len(stream) > 0: await self.send(Protocol.frame_bundle_data.pack(Frame.BUNDLE_DATA, bundle_id, chunk_index) + stream)
+
+    # Metadata (download)
+    async def send_metadata_info(self, album_index: int):
+        # Create info
+        self.finish_album()
+        data: bytes = self.library.get_metadata(album_index)
+        info: dict = { 'action': 'metadataInfo', 'albumIndex': album_index, 'lastModified': 1_700_000_000 }
+        if self.has_feature(Feature.CHUNKED_METADATA):
+            info['size'] = len(data)
+            info['maxPartSize'] = self.options.part_size
+            info['parts'] = Protocol.count_parts(len(data), self.options.part_size)
+            info['compression'] = Protocol.compression_zlib
+
+        # Send info
+        self.album_start = time.perf_counter()
+        await self.send(json.dumps(info))
+
+    async def send_metadata_part(self, album_index: int, part_index: int):
+        # Send whole file (old versions)
+        data: bytes = self.library.get_metadata(album_index)
+        if part_index is None:
+            await self.send(data)
+            return
+
+        # Send compressed part
+        part: bytes = zlib.compress(data[part_index * self.options.part_size:(part_index + 1) * self.options.part_size])
+        if self.protocol >= 2:
+            await self.send(Protocol.pack_metadata_part(album_index, part_index, part))
+        else:
+            await self.send(Protocol.pack_part(album_index, part_index, part))
+
+    def finish_album(self):
+        # Save time spent sending the previous album metadata
+        if self.album_start is None: return
+        self.album_times.append(time.perf_counter() - self.album_start)
+        self.album_start = None
+
+    # Metadata (upload)
+    async def request_upload(self, album_index: int):
+        # Check if all albums were received
+        if album_index >= len(self.library.albums):
+            self.finish_album()
+            await self.send(json.dumps({ 'action': 'endSync' }))
+            self.finished.set()
+            return
+
+        # Request album metadata info
+        self.finish_album()
+        self.album_start = time.perf_counter()
+        await self.send(json.dumps({ 'action': 'requestMetadataInfo', 'albumIndex': album_index }))
+
+    async def on_received_metadata_info(self, info: dict):
+        # Save info
+        self.upload_info = info
+        self.upload_parts = {}
+        album_index: int = info['albumIndex']
+
+        # Request whole file (old versions)
+        if 'parts' not in info:
+            self.part_requests[(album_index, 0)] = time.perf_counter()
+            await self.send(json.dumps({ 'action': 'requestMetadataData', 'albumIndex': album_index }))
+            return
+
+        # Request all parts
+        for part_index in range(info['parts']):
+            self.part_requests[(album_index, part_index)] = time.perf_counter()
+            if self.protocol >= 2:
+                await self.send(Protocol.pack_request_metadata_part(album_index, part_index))
+            else:
+                await self.send(json.dumps({ 'action': 'requestMetadataData', 'albumIndex': album_index, 'part': part_index }))
+
+    async def on_received_metadata_part(self, part_index: int, data: bytes):
+        # Save part & its round trip
+        info: dict = self.upload_info
+        album_index: int = info['albumIndex']
+        requested: float = self.part_requests.pop((album_index, part_index), None)
+        if requested is not None: self.part_round_trips.append(time.perf_counter() - requested)
+        self.upload_parts[part_index] = Protocol.decompress_part(data, info.get('compression', Protocol.compression_none))
+
+        # Check if all parts were received
+        if len(self.upload_parts) < info.get('parts', 1): return
+        self.uploaded[album_index] = b''.join(self.upload_parts[index] for index in range(len(self.upload_parts)))
+
+        # Request next album
+        await self.request_upload(album_index + 1)
@@ -0,0 +1,211 @@
+import statistics
+import subprocess
+import argparse
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+# Startup benchmark (measures the time until the app shows its first frame & fails when it goes over a budget)
+class StartupBenchmark:
+
+    # Default budgets (milliseconds, the median of the runs is checked)
+    first_frame_budget: float = 1500
+    import_budget: float = 400
+
+    # Modules that must not be imported before the first frame (they are loaded when first used)
+    lazy_modules: list[str] = [
+        'tkinter',
+        'PIL',
+        'websockets',
+        'torch',
+        'transformers',
+        'doctr',
+        'util.ai',
+        'screens.settings',
+        'screens.metadata',
+        'screens.sync',
+    ]
+
+    # Seconds to wait for the app before failing
+    timeout: float = 60
+
+    # Folder with main.py
+    root_path: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+    # Constructor
+    def __init__(self, args: argparse.Namespace):
+        self.args: argparse.Namespace = args
+
+    # Helpers
+    def create_env(self) -> dict:
+        # Let the app be imported from another folder (so it starts with a clean data folder)
+        env: dict = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(path for path in [StartupBenchmark.root_path, env.get('PYTHONPATH')] if path)
+        return env
+
+    @staticmethod
+    def is_lazy_module(name: str) -> bool:
+        return any(name == lazy or name.startswith(f'{lazy}.') for lazy in StartupBenchmark.lazy_modules)
+
+    # Runs
+    def run_first_frame(self, folder: str) -> dict:
+        # Start the app in another process & wait until it shows its first frame
+        result_path: str = os.path.join(folder, 'result.json')
+        started: float = time.time()
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup_benchmark', '--child', result_path],
+            cwd=folder,
+            env=self.create_env(),
+            timeout=StartupBenchmark.timeout,
+            check=True,
+        )
+
+        # Read result (written by the app when its first frame was shown)
+        if not os.path.exists(result_path): raise RuntimeError('App closed before showing its first frame')
+        with open(result_path, 'r', encoding='utf-8') as file:
+            result: dict = json.load(file)
+        os.remove(result_path)
+        return {
+            'firstFrameMs': round((result['readyTime'] - started) * 1000, 3),
+            'lazyModules': result['lazyModules'],
+        }
+
+    def run_import_time(self, folder: str) -> dict:
+        # Import the app with -X importtime (times are in microseconds)
+        process: subprocess.CompletedProcess = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import main'],
+            cwd=folder,
+            env=self.create_env(),
+            timeout=StartupBenchmark.timeout,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        # Parse lines ("import time: self | cumulative | name", nested imports are indented)
+        imports: list[dict] = []
+        for line in process.stderr.splitlines():
+            if not line.startswith('import time:'): continue
+            parts: list[str] = line.removeprefix('import time:').split('|')
+            if len(parts) != 3 or not parts[0].strip().isdigit(): continue
+            imports.append({
+                'name': parts[2].strip(),
+                'selfMs': int(parts[0]) / 1000,
+                'cumulativeMs': int(parts[1]) / 1000,
+            })
+
+        # Time of the app imports (main includes everything it imports)
+        main: dict = next((module for module in imports if module['name'] == 'main'), None)
+        slowest: list[dict] = sorted(imports, key=lambda module: module['selfMs'], reverse=True)[:self.args.top]
+        return {
+            'importMs': main['cumulativeMs'] if main is not None else 0,
+            'slowest': slowest,
+        }
+
+    def run(self) -> dict:
+        # Run app (each run in the same empty folder, so config & links are the defaults)
+        args: argparse.Namespace = self.args
+        folder: str = tempfile.mkdtemp(prefix='coon-startup-benchmark-')
+        runs: list[dict] = []
+        try:
+            for run_index in range(args.runs):
+                result: dict = self.run_first_frame(folder)
+                result['run'] = run_index + 1
+                result['importMs'] = self.run_import_time(folder)['importMs']
+                runs.append(result)
+                print(f'Run {result["run"]}: first frame {result["firstFrameMs"]:.1f} ms, imports {result["importMs"]:.1f} ms')
+            import_time: dict = self.run_import_time(folder)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        # Check budgets
+        first_frame: float = statistics.median(run['firstFrameMs'] for run in runs)
+        imports: float = statistics.median(run['importMs'] for run in runs)
+        lazy_modules: list[str] = sorted(set(name for run in runs for name in run['lazyModules']))
+        failures: list[str] = []
+        if first_frame > args.budget_ms: failures.append(f'First frame took {first_frame:.1f} ms (budget is {args.budget_ms:.0f} ms)')
+        if imports > args.import_budget_ms: failures.append(f'Imports took {imports:.1f} ms (budget is {args.import_budget_ms:.0f} ms)')
+        if len(lazy_modules) > 0: failures.append(f'Imported before the first frame: {", ".join(lazy_modules)}')
+
+        # Create report
+        return {
+            'options': { key: value for key, value in vars(args).items() if key not in ('json', 'child') },
+            'runs': runs,
+            'medianFirstFrameMs': round(first_frame, 3),
+            'medianImportMs': round(imports, 3),
+            'slowestImports': import_time['slowest'],
+            'lazyModules': lazy_modules,
+            'failures': failures,
+        }
+
+    # Output
+    def print_report(self, report: dict):
+        print(f'Median: first frame {report["medianFirstFrameMs"]:.1f} ms, imports {report["medianImportMs"]:.1f} ms')
+        print('Slowest imports (self time):')
+        for module in report['slowestImports']:
+            print(f'  {module["selfMs"]:8.2f} ms  {module["name"]} ({module["cumulativeMs"]:.2f} ms with its imports)')
+        for failure in report['failures']: print(f'FAILED: {failure}')
+        if len(report['failures']) == 0: print('Startup is within budget')
+
+# App process (started by the benchmark)
+def run_child(result_path: str):
+    # Imported here so the benchmark process doesn't load the app
+    from main import CoonGallery
+
+    # App that saves when its first frame was shown & closes
+    class StartupApp(CoonGallery):
+
+        # Style (relative paths are read from the folder of the class, so the app one is used)
+        CSS_PATH = os.path.join(StartupBenchmark.root_path, CoonGallery.CSS_PATH)
+
+        def on_ready(self, event):
+            # Save result
+            result: dict = {
+                'readyTime': time.time(),
+                'lazyModules': sorted(name for name in sys.modules if StartupBenchmark.is_lazy_module(name)),
+            }
+            with open(result_path, 'w', encoding='utf-8') as file:
+                json.dump(result, file)
+
+            # Don't start the server (it isn't needed to show the app) & close
+            event.prevent_default()
+            self.exit()
+
+    StartupApp().run(headless=True)
+
+# Command
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Benchmarks the time until the app shows its first frame')
+    parser.add_argument('--runs', type=int, default=5, help='Times the app is started')
+    parser.add_argument('--budget-ms', type=float, default=StartupBenchmark.first_frame_budget, help='Median time until the first frame that fails the benchmark')
+    parser.add_argument('--import-budget-ms', type=float, default=StartupBenchmark.import_budget, help='Median time importing the app that fails the benchmark')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports shown')
+    parser.add_argument('--json', help='Save the report in this JSON file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Run app only (started by the benchmark)
+    if args.child is not None:
+        run_child(args.child)
+        return
+
+    # Run benchmark
+    benchmark: StartupBenchmark = StartupBenchmark(args)
+    report: dict = benchmark.run()
+    benchmark.print_report(report)
+
+    # Save report
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+
+    # Fail when over budget
+    if len(report['failures']) > 0: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
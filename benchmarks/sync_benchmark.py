@@ -0,0 +1,346 @@
+from util.library import Link, Library
+from util.config import Config
+from util.logs import LogLevel, LogStore
+from util.timings import TimingReport
+from screens.sync.sync_server import SyncServer
+from screens.sync.sync_session import SyncSession
+from screens.sync.sync_manifests import SyncManifests
+from screens.sync.sync_stats import SyncStats
+from screens.sync.sync_metadata import MetadataDelta
+from screens.sync.sync_protocol import Protocol, Feature
+from benchmarks.phone_simulator import SyntheticLibrary, SimulatorOptions, PhoneSimulator
+import statistics
+import os
+import argparse
+import tempfile
+import asyncio
+import random
+import shutil
+import json
+import time
+import sys
+
+# Sync benchmark (runs a sync between a local server & a phone simulator)
+class SyncBenchmark:
+
+    # Actions (name -> server function, the albums list is sent by the phone when it connects)
+    actions: dict[str, str] = {
+        'albums': 'download_albums',
+        'metadata-download': 'download_metadata',
+        'metadata-upload': 'upload_metadata',
+        'metadata-merge': 'merge_metadata',
+        'albums-list': None,
+    }
+
+    # Features the phone needs for each action (the server doesn't start the sync without them)
+    required_features: dict[str, str] = {
+        'metadata-merge': Feature.DELTA_METADATA,
+    }
+
+    # Seconds to wait for a sync before failing
+    timeout: float = 600
+
+    # Seconds between connections when measuring the albums list (so the server finishes saving the first one)
+    reconnect_delay: float = 1
+
+
+    # Constructor
+    def __init__(self, args: argparse.Namespace):
+        self.args: argparse.Namespace = args
+
+    # Helpers
+    @staticmethod
+    def get_percentile(values: list[float], percent: float) -> float:
+        if len(values) == 0: return 0
+        values = sorted(values)
+        return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+    @staticmethod
+    def summarize(values: list[float]) -> dict:
+        # Latency summary (milliseconds)
+        return {
+            'count': len(values),
+            'p50': round(SyncBenchmark.get_percentile(values, 50) * 1000, 3),
+            'p95': round(SyncBenchmark.get_percentile(values, 95) * 1000, 3),
+            'p99': round(SyncBenchmark.get_percentile(values, 99) * 1000, 3),
+            'max': round(max(values, default=0) * 1000, 3),
+        }
+
+    def create_options(self) -> SimulatorOptions:
+        # Parse features (legacy sends no hello)
+        args: argparse.Namespace = self.args
+        features: list[str] = None
+        if args.features == 'all':
+            features = list(Protocol.features)
+        elif args.features != 'legacy':
+            features = [feature for feature in args.features.split(',') if feature != '']
+
+        # Create options
+        return SimulatorOptions(
+            protocol=args.protocol,
+            features=features,
+            part_size=int(args.part_size_kb * 1024),
+            chunk_size=int(args.chunk_size_kb * 1024),
+            latency=args.latency_ms / 1000,
+            drop_rate=args.drop_rate,
+            drop_delay=args.drop_delay_ms / 1000,
+            corrupt_rate=args.corrupt_rate,
+            seed=args.seed,
+        )
+
+    # Running
+    async def run_once(self, run_index: int, folder: str) -> dict:
+        # Create library & host links (host metadata files exist so metadata can be synced)
+        args: argparse.Namespace = self.args
+        library: SyntheticLibrary = SyntheticLibrary(args.albums, args.items, args.size_kb, args.size_spread, args.seed)
+        Library.links = []
+        for album_index in range(args.albums):
+            album_path: str = os.path.join(folder, f'album{album_index}')
+            metadata_path: str = os.path.join(folder, f'metadata{album_index}.json')
+            os.makedirs(album_path, exist_ok=True)
+            with open(metadata_path, 'w', encoding='utf-8') as file:
+                json.dump(library.create_metadata(album_index, 'pc') if args.action in ('metadata-upload', 'metadata-merge') else {}, file)
+            Library.links.append(Link(album_path, metadata_path))
+
+        # Start server
+        server: SyncServer = SyncServer()
+        SyncServer.current = server
+        port: int = random.randint(20000, 60000)
+        server_task: asyncio.Task = asyncio.create_task(server.start(HOST='127.0.0.1', PORT=port))
+        while not server.is_running:
+            if server_task.done(): raise RuntimeError('Server failed to start')
+            await asyncio.sleep(0.01)
+
+        # Connect phone & wait for its albums list
+        phone: PhoneSimulator = PhoneSimulator(library, self.create_options())
+        phone_task: asyncio.Task = await self.connect_phone(server, phone, port)
+        session: SyncSession = next(iter(server.sessions.values()))
+
+        # Check if measuring the albums list
+        if args.action == 'albums-list':
+            try:
+                return await self.run_albums_list(run_index, server, phone, phone_task, port)
+            finally:
+                server_task.cancel()
+                await asyncio.gather(server_task, return_exceptions=True)
+
+        # Check if the phone supports the sync (it would wait for it until the timeout otherwise)
+        required: str = SyncBenchmark.required_features.get(args.action)
+        if required is not None and not session.client.has_feature(required):
+            phone_task.cancel()
+            server_task.cancel()
+            await asyncio.gather(phone_task, server_task, return_exceptions=True)
+            return { 'run': run_index + 1, 'error': f'{args.action} is not supported by the phone (it needs the "{required}" feature)' }
+
+        # Run sync (only messages of the sync are counted)
+        phone.messages_sent = 0
+        phone.bytes_sent = 0
+        try:
+            start: float = time.perf_counter()
+            await getattr(server, SyncBenchmark.actions[args.action])()
+            await asyncio.wait_for(phone.finished.wait(), SyncBenchmark.timeout)
+            elapsed: float = time.perf_counter() - start
+        finally:
+            phone_task.cancel()
+            server_task.cancel()
+            await asyncio.gather(phone_task, server_task, return_exceptions=True)
+
+        # Get transferred bytes & latencies
+        result: dict = { 'run': run_index + 1, 'seconds': round(elapsed, 4) }
+        if args.action == 'albums':
+            # Albums -> Item data & part round trips measured by the server
+            stats: SyncStats = session.stats
+            transferred: int = stats.bytes_received if stats is not None else 0
+            result['items'] = stats.items_done if stats is not None else 0
+            result['itemsFailed'] = stats.items_failed if stats is not None else 0
+            result['parts'] = stats.parts_received if stats is not None else 0
+            result['latency'] = SyncBenchmark.summarize(list(stats.round_trips.samples) if stats is not None else [])
+            result['diskBusy'] = round(stats.get_disk_busy(), 2) if stats is not None else 0
+        elif args.action == 'metadata-upload':
+            # Upload -> Metadata parts requested by the phone
+            transferred = sum(len(data) for data in phone.uploaded.values())
+            result['latency'] = SyncBenchmark.summarize(phone.part_round_trips)
+        elif args.action == 'metadata-download':
+            # Download -> Time spent sending each album
+            transferred = sum(len(library.get_metadata(album_index)) for album_index in range(args.albums))
+            result['latency'] = SyncBenchmark.summarize(phone.album_times)
+        else:
+            # Merge -> Digests & items sent by the phone
+            transferred = phone.bytes_sent
+            result['latency'] = SyncBenchmark.summarize([])
+            result['conflicts'] = session.host.merge_conflicts_total
+        result['bytes'] = transferred
+        result['throughputMBs'] = round(transferred / elapsed / 1_048_576, 3) if elapsed > 0 else 0
+        result['messagesSent'] = phone.messages_sent
+        result['drops'] = phone.drops
+        result['corruptions'] = phone.corruptions
+
+        # Check received data
+        if args.verify: result['verified'] = self.verify(library, phone, result)
+        return result
+
+    async def connect_phone(self, server: SyncServer, phone: PhoneSimulator, port: int) -> asyncio.Task:
+        # Connect phone & wait until the server has its albums list
+        phone_task: asyncio.Task = asyncio.create_task(phone.run(f'ws://127.0.0.1:{port}'))
+        while not phone.albums_accepted.is_set() or len(server.sessions) == 0 or len(next(iter(server.sessions.values())).client.albums) < self.args.albums:
+            if phone_task.done(): raise RuntimeError('Phone failed to connect')
+            await asyncio.sleep(0.001)
+        return phone_task
+
+    async def run_albums_list(self, run_index: int, server: SyncServer, phone: PhoneSimulator, phone_task: asyncio.Task, port: int) -> dict:
+        # Disconnect, change some items & connect again (the phone sends only the changes if the server accepted the first list)
+        args: argparse.Namespace = self.args
+        phone_task.cancel()
+        await asyncio.gather(phone_task, return_exceptions=True)
+        while len(server.sessions) > 0: await asyncio.sleep(0.001)
+        await asyncio.sleep(SyncBenchmark.reconnect_delay)
+        phone.library.change_items(args.changes)
+        phone.messages_sent = 0
+        phone.bytes_sent = 0
+        start: float = time.perf_counter()
+        phone_task = await self.connect_phone(server, phone, port)
+        elapsed: float = time.perf_counter() - start
+        session: SyncSession = next(iter(server.sessions.values()))
+        phone_task.cancel()
+        await asyncio.gather(phone_task, return_exceptions=True)
+
+        # Create result (time from connecting until the server has the list)
+        result: dict = { 'run': run_index + 1, 'seconds': round(elapsed, 4), 'bytes': phone.bytes_sent, 'latency': SyncBenchmark.summarize([elapsed]) }
+        result['throughputMBs'] = round(phone.bytes_sent / elapsed / 1_048_576, 3) if elapsed > 0 else 0
+        result['messagesSent'] = phone.messages_sent
+        result['drops'] = phone.drops
+        result['corruptions'] = phone.corruptions
+        if args.verify: result['verified'] = session.client.albums == [[item.name for item in album] for album in phone.library.albums]
+        return result
+
+    def verify(self, library: SyntheticLibrary, phone: PhoneSimulator, result: dict) -> bool:
+        # Check synced files match the phone ones
+        match self.args.action:
+            case 'albums':
+                for album_index, album in enumerate(library.albums):
+                    for item in album:
+                        path: str = os.path.join(Library.links[album_index].album_path, item.name)
+                        if not os.path.exists(path) or os.path.getsize(path) != item.size: return False
+                        with open(path, 'rb') as file:
+                            if file.read() != library.read(item, 0, item.size): return False
+                return True
+            case 'metadata-download':
+                for album_index in range(len(library.albums)):
+                    with open(Library.links[album_index].metadata_path, 'rb') as file:
+                        if file.read() != library.get_metadata(album_index): return False
+                return True
+            case 'metadata-upload':
+                for album_index in range(len(library.albums)):
+                    with open(Library.links[album_index].metadata_path, 'rb') as file:
+                        if phone.uploaded.get(album_index) != file.read(): return False
+                return True
+            case 'metadata-merge':
+                # Both devices end with the more complete items (the computer ones when both have the same fields) & every conflict is counted
+                conflicts: int = 0
+                for album_index in range(len(library.albums)):
+                    host_metadata: dict = library.create_metadata(album_index, 'pc')
+                    phone_metadata: dict = json.loads(library.get_metadata(album_index))
+                    expected: dict = dict(host_metadata)
+                    for item_name, phone_item in phone_metadata.items():
+                        expected[item_name] = MetadataDelta.merge_item(host_metadata.get(item_name), phone_item)
+                        if MetadataDelta.is_conflict(host_metadata.get(item_name), phone_item): conflicts += 1
+                    with open(Library.links[album_index].metadata_path, 'r', encoding='utf-8') as file:
+                        if json.load(file) != expected: return False
+                    if phone_metadata | phone.merged.get(album_index, {}) != expected: return False
+                return conflicts == result['conflicts']
+        return True
+
+    async def run(self) -> dict:
+        # Apply config overrides
+        args: argparse.Namespace = self.args
+        for override in args.set:
+            (key, value) = override.split('=', 1)
+            Config.values[key] = json.loads(value)
+
+        # Keep logs & stats out of the app data (logs are only printed when asked)
+        LogStore.min_level = LogLevel.DEBUG if args.logs else LogLevel.ERROR
+        SyncStats.samples = 10_000_000
+        folder: str = tempfile.mkdtemp(prefix='coon-sync-benchmark-')
+        TimingReport.folder_path = os.path.join(folder, 'timings')
+        SyncManifests.folder_path = os.path.join(folder, 'manifests')
+
+        # Run syncs (each one in a new folder so all items are downloaded)
+        runs: list[dict] = []
+        try:
+            for run_index in range(args.runs):
+                run_folder: str = os.path.join(folder, f'run{run_index}')
+                os.makedirs(run_folder)
+                result: dict = await self.run_once(run_index, run_folder)
+                if 'error' in result:
+                    # Not supported -> Stop (other runs would fail the same way)
+                    print(f'Run {result["run"]}: {result["error"]}')
+                    return { 'action': args.action, 'runs': [], 'error': result['error'] }
+                runs.append(result)
+                self.print_run(result)
+                if args.logs:
+                    (entries, _) = SyncServer.current.logs.get_since(0)
+                    for entry in entries: print(f'  | {entry.message}')
+        finally:
+            if not args.keep: shutil.rmtree(folder, ignore_errors=True)
+
+        # Create report
+        return {
+            'action': args.action,
+            'options': { key: value for key, value in vars(args).items() if key not in ('json', 'keep', 'logs') },
+            'runs': runs,
+            'medianSeconds': round(statistics.median(run['seconds'] for run in runs), 4),
+            'medianThroughputMBs': round(statistics.median(run['throughputMBs'] for run in runs), 3),
+            'verifyFailed': any(not run.get('verified', True) for run in runs),
+        }
+
+    # Output
+    def print_run(self, result: dict):
+        latency: dict = result['latency']
+        line: str = f'Run {result["run"]}: {result["seconds"]:.3f}s, {result["bytes"] / 1_048_576:.2f} MB, {result["throughputMBs"]:.2f} MB/s'
+        line += f', latency p50 {latency["p50"]:.1f} ms, p95 {latency["p95"]:.1f} ms, p99 {latency["p99"]:.1f} ms, max {latency["max"]:.1f} ms ({latency["count"]} samples)'
+        if 'items' in result: line += f', {result["items"]} items ({result["itemsFailed"]} failed)'
+        if 'conflicts' in result: line += f', {result["conflicts"]} conflicts'
+        if 'verified' in result: line += ', verified' if result['verified'] else ', VERIFY FAILED'
+        print(line)
+
+# Command
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Benchmarks a sync between a local sync server & a simulated phone')
+    parser.add_argument('action', choices=list(SyncBenchmark.actions.keys()), help='Sync to run')
+    parser.add_argument('--albums', type=int, default=2, help='Albums in the phone')
+    parser.add_argument('--items', type=int, default=100, help='Items in each album')
+    parser.add_argument('--size-kb', type=float, default=3000, help='Median item size')
+    parser.add_argument('--changes', type=int, default=10, help='Items replaced in the phone before it connects again (albums-list)')
+    parser.add_argument('--size-spread', type=float, default=0.5, help='Spread of item sizes (log-normal sigma, 0 = all the same size)')
+    parser.add_argument('--part-size-kb', type=float, default=512, help='Size of the parts the phone sends')
+    parser.add_argument('--chunk-size-kb', type=float, default=64, help='Size of the bundle chunks the phone sends')
+    parser.add_argument('--protocol', type=int, default=Protocol.version, help='Protocol version the phone supports')
+    parser.add_argument('--features', default='all', help='Features the phone supports ("all", "legacy" for no hello or a comma separated list)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every message the phone sends')
+    parser.add_argument('--drop-rate', type=float, default=0, help='Chance of a message being lost & sent again')
+    parser.add_argument('--drop-delay-ms', type=float, default=200, help='Delay until a lost message is sent again')
+    parser.add_argument('--corrupt-rate', type=float, default=0, help='Chance of a part arriving corrupted')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='Config value used by the server (JSON value, can be repeated)')
+    parser.add_argument('--runs', type=int, default=1, help='Times the sync is run')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic library & network')
+    parser.add_argument('--verify', action='store_true', help='Check synced files match the phone ones')
+    parser.add_argument('--json', help='Save the report in this JSON file')
+    parser.add_argument('--logs', action='store_true', help='Print server logs after each run')
+    parser.add_argument('--keep', action='store_true', help='Keep the synced files')
+    args = parser.parse_args()
+
+    # Run benchmark
+    report: dict = asyncio.run(SyncBenchmark(args).run())
+    if 'error' not in report: print(f'Median: {report["medianSeconds"]:.3f}s, {report["medianThroughputMBs"]:.2f} MB/s')
+
+    # Save report
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+
+    # Fail if the sync isn't supported or synced files don't match the phone ones
+    if 'error' in report or report['verifyFailed']: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
 from util.library import Library
+from util.config import Config
 from util.util import Util
+from util.logs import LogLevel, LogStore
 from textual.app import App
 from screens.home.home_screen import HomeScreen
-from screens.sync.sync_server import SyncServer
 
 class CoonGallery(App):
 
@@ -26,16 +27,23 @@ class CoonGallery(App):
         # Use rose-pine as default theme
         self.theme = "rose-pine"
 
-        # Load links
+        # Load config & links
+        Config.load_config()
         Library.load_links()
 
-        # Init & start server
-        SyncServer.current = SyncServer()
-        self.run_worker(SyncServer.current.start(), thread=True)
+        # Apply logs config
+        LogStore.min_level = LogLevel.parse(Config.get('log_level'))
+        LogStore.max_entries = max(int(Config.get('log_max_lines')), 100)
 
         # Start app in home
         self.push_screen(HomeScreen())
 
+    def on_ready(self):
+        # Init & start server (after the first frame is shown, so its imports don't delay startup)
+        from screens.sync.sync_server import SyncServer
+        SyncServer.current = SyncServer()
+        self.run_worker(SyncServer.current.start(), thread=True)
+
 # Run app
 if __name__ == "__main__":
     app = CoonGallery()
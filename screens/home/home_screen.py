@@ -1,9 +1,5 @@
 from textual.screen import Screen
 from textual.widgets import Header, Label, Button
-from screens.settings.settings_screen import SettingsScreen
-from screens.sync.sync_screen import SyncScreen
-from screens.sync.sync_server import SyncServer
-from screens.metadata.metadata_screen import MetadataScreen
 
 class HomeScreen(Screen):
 
@@ -31,19 +27,28 @@ class HomeScreen(Screen):
 
     # Events
     def on_button_pressed(self, event: Button.Pressed):
+        # Menus are imported when first opened (so they don't slow down startup)
         match event.button.id:
             # Exit
             case 'exit':
                 self.app.exit()
             # Settings menu
             case 'settings':
+                from screens.settings.settings_screen import SettingsScreen
                 self.app.push_screen(SettingsScreen())
             # Metadata menu
             case 'metadata':
-                if SyncServer.current.is_syncing: 
+                from screens.sync.sync_server import SyncServer
+                if SyncServer.current is not None and SyncServer.current.is_syncing(): 
                     self.app.notify('Can\'t open metadata menu while syncing with phone')
                 else:
+                    from screens.metadata.metadata_screen import MetadataScreen
                     self.app.push_screen(MetadataScreen())
             # Sync menu
             case 'sync':
-                self.app.push_screen(SyncScreen())
\ No newline at end of file
+                from screens.sync.sync_server import SyncServer
+                if SyncServer.current is None:
+                    self.app.notify('Server is still starting')
+                else:
+                    from screens.sync.sync_screen import SyncScreen
+                    self.app.push_screen(SyncScreen())
\ No newline at end of file
@@ -0,0 +1,191 @@
+from util.util import Util
+from util.library import MetadataUtil, Item, Album
+from util.ai import Provenance
+from dataclasses import dataclass
+import os
+
+# Fix job entry (an item that needs fixing)
+@dataclass
+class FixEntry:
+    album_index: int = -1
+    item_name: str = ''
+    fix_caption: bool = False
+    fix_labels: bool = False
+    fix_text: bool = False
+
+    # Saving
+    def to_save(self) -> list:
+        return [self.album_index, self.item_name, self.fix_caption, self.fix_labels, self.fix_text]
+
+    @staticmethod
+    def from_save(save: list) -> "FixEntry":
+        return FixEntry(save[0], save[1], save[2], save[3], save[4])
+
+# Fix job (persisted work queue & progress cursor)
+class FixJob:
+
+    # Modes
+    MODE_MISSING: str = 'missing' # Fix fields that don't exist
+    MODE_STALE: str = 'stale'     # Fix fields that don't exist or were generated with an older config
+
+    # Paths (each mode has its own job, so starting one doesn't replace a paused job of the other)
+    folder_path: str = Util.join_path(Util.get_data_path(), 'fix_job')
+    legacy_queue_path: str = Util.join_path(folder_path, 'queue.json')
+    legacy_state_path: str = Util.join_path(folder_path, 'state.json')
+
+
+    # Constructor
+    def __init__(self, signature: list[list[str]], queue: list[FixEntry], cursor: int = 0, mode: str = MODE_MISSING):
+        # Albums & mode the job was planned for
+        self.signature: list[list[str]] = signature
+        self.mode: str = mode
+
+        # Work queue & index of the first entry whose result has not been saved yet
+        self.queue: list[FixEntry] = queue
+        self.cursor: int = cursor
+
+        # Entries after the cursor that finished out of order
+        self.completed: set[int] = set()
+
+    # Paths
+    @staticmethod
+    def get_queue_path(mode: str) -> str:
+        return Util.join_path(FixJob.folder_path, f'queue_{mode}.json')
+
+    @staticmethod
+    def get_state_path(mode: str) -> str:
+        return Util.join_path(FixJob.folder_path, f'state_{mode}.json')
+
+    @staticmethod
+    def migrate_legacy():
+        # Check if there is a job saved before modes had their own files
+        if not Util.exists_path(FixJob.legacy_queue_path): return
+
+        # Move it to the files of its mode (unless that mode already has a job)
+        mode: str = Util.load_json(FixJob.legacy_queue_path).get('mode', FixJob.MODE_MISSING)
+        if not Util.exists_path(FixJob.get_queue_path(mode)) and Util.exists_path(FixJob.legacy_state_path):
+            os.replace(FixJob.legacy_queue_path, FixJob.get_queue_path(mode))
+            os.replace(FixJob.legacy_state_path, FixJob.get_state_path(mode))
+
+        # Delete what is left
+        Util.delete_path(FixJob.legacy_queue_path)
+        Util.delete_path(FixJob.legacy_state_path)
+
+    # Planning
+    @staticmethod
+    def create_signature(albums: list[Album]) -> list[list[str]]:
+        return [ [album.album_path, album.metadata_path] for album in albums ]
+
+    @staticmethod
+    def needs_fix(item_metadata: dict, field: str, mode: str, provenance: dict[str, list]) -> bool:
+        # Missing fields always need fixing
+        if not MetadataUtil.has_valid_field(item_metadata, field): return True
+
+        # Stale fields only need fixing when refreshing
+        return mode == FixJob.MODE_STALE and MetadataUtil.is_stale(item_metadata, field, provenance[field])
+
+    @staticmethod
+    def get_entry(album_index: int, album: Album, item: Item, mode: str, provenance: dict[str, list]) -> FixEntry:
+        # Get item metadata
+        item_metadata: dict = album.get_item_metadata(item.name)
+
+        # Check which fields need fixing
+        return FixEntry(
+            album_index,
+            item.name,
+            FixJob.needs_fix(item_metadata, 'caption', mode, provenance),
+            FixJob.needs_fix(item_metadata, 'labels', mode, provenance),
+            FixJob.needs_fix(item_metadata, 'text', mode, provenance)
+        )
+
+    @staticmethod
+    def plan(albums: list[Album], mode: str = MODE_MISSING) -> "FixJob":
+        # Create empty queue
+        queue: list[FixEntry] = []
+        provenance: dict[str, list] = Provenance.get_current()
+
+        # Check every item of every album (album by album so their files are saved once they finish, items are sorted from newest to oldest)
+        album: Album
+        for album_index, album in enumerate(albums):
+            item: Item
+            for item in album.items:
+                # Check if item needs fixing
+                entry = FixJob.get_entry(album_index, album, item, mode, provenance)
+                if not entry.fix_caption and not entry.fix_labels and not entry.fix_text: continue
+
+                # Add entry to the queue
+                queue.append(entry)
+
+        # Create job
+        return FixJob(FixJob.create_signature(albums), queue, mode=mode)
+
+    # Progress
+    def is_finished(self) -> bool:
+        return self.cursor >= len(self.queue)
+
+    def remaining(self) -> int:
+        return max(len(self.queue) - self.cursor, 0)
+
+    def complete(self, index: int):
+        # Mark entry as completed
+        self.completed.add(index)
+
+        # Move cursor to the first entry that has not been completed
+        while self.cursor in self.completed:
+            self.completed.remove(self.cursor)
+            self.cursor += 1
+
+    # Saving
+    def save(self):
+        # Create folder
+        Util.create_folder(FixJob.folder_path)
+
+        # Save queue (only once, it does not change) & progress
+        Util.save_json(FixJob.get_queue_path(self.mode), {
+            'signature': self.signature,
+            'mode': self.mode,
+            'queue': [ entry.to_save() for entry in self.queue ]
+        })
+        self.save_cursor()
+
+    def save_cursor(self):
+        # Save progress (small file so it can be saved often)
+        Util.save_json(FixJob.get_state_path(self.mode), {
+            'cursor': self.cursor,
+            'size': len(self.queue)
+        })
+
+    @staticmethod
+    def load(albums: list[Album], mode: str = MODE_MISSING) -> "FixJob":
+        # Check if there is a saved job of this mode
+        FixJob.migrate_legacy()
+        queue_path: str = FixJob.get_queue_path(mode)
+        state_path: str = FixJob.get_state_path(mode)
+        if not Util.exists_path(queue_path) or not Util.exists_path(state_path): return None
+
+        # Load saved job
+        queue_save: dict = Util.load_json(queue_path)
+        state_save: dict = Util.load_json(state_path)
+        if 'queue' not in queue_save or 'cursor' not in state_save: return None
+
+        # Check if job was planned for the same albums
+        if queue_save.get('signature') != FixJob.create_signature(albums): return None
+
+        # Check if the state belongs to this queue
+        queue: list[FixEntry] = [ FixEntry.from_save(save) for save in queue_save['queue'] ]
+        if state_save.get('size') != len(queue): return None
+
+        # Create job
+        return FixJob(queue_save['signature'], queue, state_save['cursor'], mode)
+
+    @staticmethod
+    def exists(mode: str) -> bool:
+        # Check if a job of this mode is saved (finished jobs are deleted)
+        FixJob.migrate_legacy()
+        return Util.exists_path(FixJob.get_queue_path(mode))
+
+    @staticmethod
+    def clear(mode: str):
+        # Delete saved job of this mode
+        Util.delete_path(FixJob.get_queue_path(mode))
+        Util.delete_path(FixJob.get_state_path(mode))
@@ -0,0 +1,66 @@
+from util.library import Item
+from util.timings import StageTimer
+from screens.metadata.fix_job import FixEntry
+from dataclasses import dataclass, field
+from collections.abc import Callable
+import threading
+import queue
+
+# Fix work (an item going through the fix stages)
+@dataclass
+class FixWork:
+    # Job
+    index: int = -1
+    entry: FixEntry = None
+    item: Item = None
+
+    # Fields to fix
+    fix_caption: bool = False
+    fix_labels: bool = False
+    fix_text: bool = False
+
+    # Results (field -> value), stages that haven't finished & errors
+    results: dict = field(default_factory=dict)
+    pending: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    # Timings
+    timer: StageTimer = field(default_factory=StageTimer)
+
+# Fix stage (a worker with its own input queue)
+class FixStage:
+
+    # Constructor
+    def __init__(self, name: str, process: Callable[[FixWork], None], output: queue.Queue, queue_size: int):
+        # Info
+        self.name: str = name
+        self.process: Callable[[FixWork], None] = process
+        self.output: queue.Queue = output
+
+        # Worker
+        self.input: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.thread: threading.Thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Worker
+    def run(self):
+        while True:
+            # Wait for work (None stops the worker)
+            work: FixWork = self.input.get()
+            if work is None: break
+
+            # Process work (errors only fail this item)
+            try:
+                self.process(work)
+            except Exception as e:
+                work.errors.append(f'{self.name}: {e}')
+
+            # Send to merge
+            self.output.put(work)
+
+    def add(self, work: FixWork):
+        self.input.put(work)
+
+    def stop(self):
+        self.input.put(None)
+        self.thread.join()
@@ -1,16 +1,30 @@
-from util.ai import DescriptionModel, TextModel
+from util.util import Util
+from util.ai import DescriptionModel, TextModel, ModelManager, Provenance
+from util.config import Config
 from util.dialogs import InputDialog
+from util.logs import LogLevel, LogStore
+from util.log_view import LogView
 from util.library import MetadataUtil, Item, Filter, Album, Library
+from util.timings import StageTimer, TimingReport
+from screens.metadata.fix_job import FixEntry, FixJob
+from screens.metadata.fix_pipeline import FixWork, FixStage
+from screens.metadata.search_results import SearchResult, SearchResults
 from textual.screen import Screen
 from textual.widgets import Header, Button, Label
-from textual.containers import Vertical, Horizontal, VerticalScroll
-from PIL import Image, ImageFile
+from textual.containers import Vertical, Horizontal
+from pathlib import Path
+import threading
+import queue
+import time
 
 class MetadataScreen(Screen):
 
     # Info
     TITLE = 'Metadata'
 
+    # Seconds between album loading progress logs
+    progress_seconds: float = 0.5
+
 
     # Constructor
     def __init__(self):
@@ -18,16 +32,21 @@ class MetadataScreen(Screen):
         self.w_content = None
         self.w_info = None
         self.w_logs = None
+        self.w_pause = None
+        self.info_text = ''
 
         # Albums
         self.albums: list[Album] = []
 
         # Logs
-        self.logs_count = 0
+        self.logs: LogStore = LogStore()
 
         # Options
         self.is_working = False
 
+        # Fixing
+        self.fix_resume: threading.Event = None
+
         # Init parent
         super().__init__()
 
@@ -41,7 +60,9 @@ class MetadataScreen(Screen):
         # Create widgets
         self.w_content = Vertical()
         self.w_info = Label(classes='box')
-        self.w_logs = VerticalScroll(classes='box')
+        self.w_logs = LogView(self.logs, classes='box')
+        self.w_pause = Button(classes='menu_button', id='pause', label='Pause fix', tooltip='Pauses or resumes the current fix (progress is saved so it can also be resumed later)')
+        self.w_pause.display = False
 
         # Create layout
         yield Header()
@@ -53,6 +74,8 @@ class MetadataScreen(Screen):
                     yield Button(classes='menu_button', id='search', label='Search albums', tooltip='Searches for items whose metadata contains a specified input')
                     yield Button(classes='menu_button', id='clean', label='Clean metadata', tooltip='Removes metadata keys whose file does not exist & sorts the remaining by modified date')
                     yield Button(classes='menu_button', id='fix', label='Fix metadata', tooltip='Creates metadata for all missing files or fields')
+                    yield Button(classes='menu_button', id='refresh', label='Refresh stale metadata', tooltip='Regenerates fields created with an older model or config (newest items first)')
+                    yield self.w_pause
             yield self.w_logs
 
     def toggle_content(self, show: bool):
@@ -61,7 +84,12 @@ class MetadataScreen(Screen):
 
     def update_info(self, items_with_metadata, items_without_metadata):
         # Update info text
-        self.w_info.content = f'· Items with metadata: {items_with_metadata}\n· Items without metadata: {items_without_metadata}'
+        self.info_text = f'· Items with metadata: {items_with_metadata}\n· Items without metadata: {items_without_metadata}'
+        self.w_info.content = self.info_text
+
+    def update_fix_info(self, summary: str):
+        # Update info text with fix progress
+        self.w_info.content = f'{self.info_text}\n· Fixing: {summary}'
 
     # Events
     async def on_button_pressed(self, event: Button.Pressed):
@@ -89,22 +117,61 @@ class MetadataScreen(Screen):
                 if self.is_working: 
                     self.app.notify('Wait until the current action finishes')
                 else:
-                    await self.option_fix()
+                    await self.option_fix(FixJob.MODE_MISSING)
+            # Refresh stale metadata
+            case 'refresh':
+                if self.is_working: 
+                    self.app.notify('Wait until the current action finishes')
+                else:
+                    await self.option_fix(FixJob.MODE_STALE)
+            # Pause/resume fix
+            case 'pause':
+                self.option_pause()
 
     # Albums
     def load_albums(self):
-        # Load albums
-        success: bool
-        (success, self.albums) = Library.load_albums(Filter.images)
+        # Hide options until albums are loaded
+        self.toggle_content(False)
+        self.log_message('Loading albums...')
+
+        # Execute in another thread to not block UI
+        self.run_worker(self.execute_load_albums, thread=True)
+
+    async def execute_load_albums(self):
+        # Report progress (at most every few tenths of a second, so big libraries don't flood the logs)
+        last_progress: list[float] = [time.monotonic()]
+        def on_progress(loaded: int, total: int):
+            if loaded >= total or time.monotonic() - last_progress[0] < MetadataScreen.progress_seconds: return
+            last_progress[0] = time.monotonic()
+            self.log_message_async(f'Loading albums ({loaded}/{total})...')
+
+        # Load albums (albums whose folder & metadata didn't change since they were last loaded are reused)
+        (success, albums) = Library.load_albums(Filter.images, use_cache=True, on_progress=on_progress)
+
+        # Show albums
+        self.app.call_from_thread(self.on_albums_loaded, success, albums)
+
+    def on_albums_loaded(self, success: bool, albums: list[Album]):
+        # Check if screen was closed while loading
+        if not self.is_attached: return
 
         # Check if success
+        self.albums = albums
         if success:
             self.log_message(f'Loaded {len(self.albums)} albums successfully')
         else:
-            self.log_message('Failed to load albums (please check all links in settings have existing paths)')
+            self.log_message('Failed to load albums (please check all links in settings have existing paths)', LogLevel.ERROR)
         self.toggle_content(success)
 
         # Update albums info
+        self.refresh_info()
+
+        # Warm up models in the background so fixing starts faster
+        if success and Config.get('model_preload'):
+            ModelManager.preload(['description', 'text'], self.log_message_async)
+
+    def refresh_info(self):
+        # Sum albums stats
         items_with_metadata: int = 0
         items_without_metadata: int = 0
         for album in self.albums:
@@ -113,21 +180,13 @@ class MetadataScreen(Screen):
         self.update_info(items_with_metadata, items_without_metadata)
 
     # Logs
-    def log_message(self, message: str) -> Label:
-        # Create label
-        label = Label(message, classes='zebra_even' if self.logs_count % 2 == 0 else 'zebra_odd')
-        self.logs_count += 1
-
-        # Max logs
-        if len(self.w_logs.children) >= 1000: self.w_logs.children[0].remove()
-
-        # Add new log
-        self.w_logs.mount(label)
-        self.w_logs.scroll_end(animate=False)
-        return label
+    def log_message(self, message: str, level: int = LogLevel.INFO):
+        # Add log (shown by the logs view in the next batch)
+        self.logs.add(message, level)
 
-    def log_message_async(self, message: str):
-        self.app.call_from_thread(self.log_message, message)
+    def log_message_async(self, message: str, level: int = LogLevel.INFO):
+        # Logs can be added from any thread
+        self.log_message(message, level)
 
     # Options
     def set_working(self, working: bool, message: str):
@@ -159,22 +218,27 @@ class MetadataScreen(Screen):
         self.app.push_screen(InputDialog(placeholder='What do you want to search?', confirm='Search'), on_result)
 
     async def execute_option_search(self, value: str):
-        # Create found items count
-        items_found: int = 0
-
-        # Create item found event
-        def on_item_found(path):
-            nonlocal items_found
-            items_found += 1
-            self.log_message_async(path)
+        # Create results
+        results: SearchResults = SearchResults(value)
 
         # Search albums
-        for album in self.albums:
+        for album_index, album in enumerate(self.albums):
+            # Create item found event
+            album_name: str = Path(album.album_path).name
+            def on_item_found(item: Item, score: int):
+                results.results.append(SearchResult(album_index, album_name, item, Util.get_last_modified(item.path), score))
+
             # Search album
             album.search(value, on_item_found)
 
         # Finish search
-        self.set_working_async(False, f'Found {items_found} items')
+        results.sort_by(SearchResults.SORT_SCORE)
+        self.set_working_async(False, f'Found {len(results.results)} items')
+
+        # Show results (results screen is imported when first shown)
+        if len(results.results) > 0:
+            from screens.metadata.search_screen import SearchScreen
+            self.app.call_from_thread(self.app.push_screen, SearchScreen(results))
 
     async def option_clean(self):
         # Start cleaning
@@ -195,139 +259,283 @@ class MetadataScreen(Screen):
         # Finish cleaning
         self.set_working_async(False, 'Finished cleaning albums metadata')
 
-    async def option_fix(self):
+    async def option_fix(self, mode: str):
         # Start fixing
-        self.set_working(True, 'Fixing albums metadata...')
+        if mode == FixJob.MODE_STALE:
+            self.set_working(True, 'Refreshing stale albums metadata...')
+        else:
+            self.set_working(True, 'Fixing albums metadata...')
+        self.toggle_pause(True)
 
         # Execute in another thread to not block UI
-        self.run_worker(self.execute_option_fix, thread=True)
+        self.run_worker(self.execute_option_fix(mode), thread=True)
+
+    def option_pause(self):
+        # Check if fixing
+        if self.fix_resume is None: return
+
+        # Toggle pause
+        if self.fix_resume.is_set():
+            # Running -> Pause after the current item
+            self.fix_resume.clear()
+            self.w_pause.label = 'Resume fix'
+            self.log_message('Pausing after the current item...')
+        else:
+            # Paused -> Resume
+            self.fix_resume.set()
+            self.w_pause.label = 'Pause fix'
+            self.log_message('Resuming...')
 
-    async def execute_option_fix(self):
-        # Stats
-        total_items_count: int = 0
-        total_items_fixed: int = 0
+    def toggle_pause(self, show: bool):
+        # Toggle pause button
+        self.w_pause.label = 'Pause fix'
+        self.w_pause.display = show
+
+    async def execute_option_fix(self, mode: str):
+        # Pausing
+        self.fix_resume = threading.Event()
+        self.fix_resume.set()
 
         # Saving
         save_every: int = 5
 
-        # Models
-        description_model: DescriptionModel = None
-        text_model: TextModel = None
-
-        def init_description_model():
-            # Check if is init
-            nonlocal description_model
-            if description_model != None: return
-
-            # Load
-            self.log_message_async('Loading description model (this may take a while)...')
-            description_model = DescriptionModel()
-
-        def init_text_model():
-            # Check if is init
-            nonlocal text_model
-            if text_model != None: return
-
-            # Load
-            self.log_message_async('Loading text model...')
-            text_model = TextModel()
-
-        # Loop albums
-        album: Album
-        for album_index, album in enumerate(self.albums):
-            self.log_message_async(f'Album {album_index}: Checking...')
-
-            # Stats
-            album_items_count: int = len(album.items)
-            album_items_fixed: int = 0
-            total_items_count += album_items_count
-
-            # Saving
-            was_album_modified: bool = False
-            was_album_saved: bool = False
-
-            # Loop album items
-            item: Item
-            for item_index, item in enumerate(album.items):
-                # Metadata
-                was_item_modified: bool = False
-                item_metadata: dict = album.get_item_metadata(item.name)
-
-                # Check if item needs fixing
-                fix_caption: bool = not MetadataUtil.has_valid_caption(item_metadata)
-                fix_labels: bool = not MetadataUtil.has_valid_labels(item_metadata)
-                fix_text: bool = not MetadataUtil.has_valid_text(item_metadata)
-
-                if not fix_caption and not fix_labels and not fix_text: continue
-
-                # Log fixing
-                self.log_message_async(f'- Fixing "{item.name}"...')
-
-                # Check if description model is needed
-                if fix_caption or fix_labels:
-                    # Is needed -> Make sure its init
-                    init_description_model()
-
-                    # Load image
-                    item_image: ImageFile = Image.open(item.path).convert("RGB")
-
-                    # Fix caption
-                    if fix_caption:
-                        # Generate caption
-                        self.log_message_async('Generating caption...')
-                        item_metadata['caption'] = description_model.generate_caption(item_image)
-
-                    # Fix labels
-                    if fix_labels:
-                        # Generate labels
-                        self.log_message_async('Generating labels...')
-                        item_metadata['labels'] = description_model.generate_labels(item_image)
-
-                    # Mark item as modified
-                    was_item_modified = True
-
-                # Check if text model is needed
-                if fix_text:
-                    # Is needed -> Make sure its init
-                    init_text_model()
-
-                    # Generate text
-                    self.log_message_async('Generating text...')
-                    item_metadata['text'] = text_model.detect_text(item.path)
-
-                    # Mark item as modified
-                    was_item_modified = True
-
-                # Check if item was modified
-                if was_item_modified:
-                    # Update item metadata
-                    album.set_item_metadata(item.name, item_metadata)
-
-                    # Mark item as fixed
-                    album_items_fixed += 1
-                    total_items_fixed += 1
-
-                    # Mark album as modified
-                    was_album_modified = True
-
-                    # Save every x items and if item isn't the last of the album
-                    if (album_items_fixed % save_every == 0) and (item_index < album_items_count - 1):
-                        # Save album metadata
+        # Stages (items in each stage queue & items being fixed at the same time)
+        stage_queue_size: int = 4
+        max_in_flight: int = stage_queue_size * 2
+
+        # Models (kept loaded by the manager between runs)
+        ModelManager.acquire()
+        description_stage: FixStage = None
+        text_stage: FixStage = None
+        failed: bool = True
+        try:
+            def init_description_model() -> DescriptionModel:
+                # Check if is init
+                if not ModelManager.is_loaded('description'):
+                    self.log_message_async('Loading description model (this may take a while)...')
+
+                # Load
+                return ModelManager.get_description_model(run_timer)
+
+            def init_text_model() -> TextModel:
+                # Check if is init
+                if not ModelManager.is_loaded('text'):
+                    self.log_message_async('Loading text model...')
+
+                # Load
+                return ModelManager.get_text_model(run_timer)
+
+            # Load previous job or plan a new one
+            job: FixJob = FixJob.load(self.albums, mode)
+            if job != None and not job.is_finished():
+                # Has unfinished job -> Resume it
+                self.log_message_async(f'Resuming previous fix job ({job.cursor}/{len(job.queue)} items done)...')
+            else:
+                # No job -> Plan a new one
+                self.log_message_async('Planning fix job...')
+                job = FixJob.plan(self.albums, mode)
+                job.save()
+                self.log_message_async(f'Planned fix job ({len(job.queue)} items to fix)')
+
+            # Let the user know a paused job of the other mode is kept
+            other_mode: str = FixJob.MODE_MISSING if mode == FixJob.MODE_STALE else FixJob.MODE_STALE
+            if FixJob.exists(other_mode): self.log_message_async(f'A paused {other_mode} fix job is kept, it continues next time that fix is started')
+
+            # Provenance of the generated fields
+            provenance: dict[str, list] = Provenance.get_current()
+
+            # Timings (run timer measures stages that don't belong to an item)
+            report: TimingReport = TimingReport('fix', job.remaining())
+            run_timer: StageTimer = StageTimer()
+
+            # Album items by name (queue entries only store names)
+            album_items: list[dict[str, Item]] = [ { item.name: item for item in album.items } for album in self.albums ]
+
+            # Saving state
+            saved_albums: set[int] = set() # Albums that already made a backup this run
+            modified_albums: set[int] = set() # Albums with changes that were not saved yet
+            touched_albums: set[int] = { entry.album_index for entry in job.queue[:job.cursor] } # Albums with changes in this job (a resumed job may have only fast saved them)
+            cleaned_albums: set[int] = set() # Albums cleaned after their last change
+            total_items_fixed: int = 0
+
+            # Last queue entry of each album (albums are cleaned once the job gets past it)
+            album_last_entries: dict[int, int] = { entry.album_index: index for index, entry in enumerate(job.queue) }
+
+            def save_album(album_index: int, clean: bool):
+                # Clean (cleaning sorts the keys too) & save album metadata
+                album: Album = self.albums[album_index]
+                with run_timer.measure('save'):
+                    if clean:
+                        self.log_message_async(f'Album {album_index}: Cleaning & saving...')
+                        album.clean_metadata()
+                    else:
                         self.log_message_async(f'Album {album_index}: Saving (fast save)...')
-                        album.save_metadata(backup=not was_album_saved) # Create backup only first save
-
-                        # Mark album as saved
-                        was_album_saved = True
-
-            # Check if album was modified
-            if was_album_modified:
-                # Clean & save album metadata
-                self.log_message_async(f'Album {album_index}: Cleaning & saving...')
-                album.clean_metadata() # Cleaning sorts the keys too
-                album.save_metadata(backup=not was_album_saved) # Create backup only first save
+                    album.save_metadata(backup=album_index not in saved_albums) # Create backup only first save
+
+                # Mark album as saved
+                saved_albums.add(album_index)
+                modified_albums.discard(album_index)
+                if clean: cleaned_albums.add(album_index)
+
+            def save_progress(finished: bool = False):
+                # Clean & save changed albums whose entries are all done (all of them when finished)
+                for album_index in sorted(touched_albums - cleaned_albums):
+                    if finished or album_last_entries.get(album_index, -1) < job.cursor: save_album(album_index, True)
+
+                # Save the rest of modified albums (fast save)
+                for album_index in sorted(modified_albums):
+                    save_album(album_index, False)
+
+                # Save job cursor (only after its results are on disk)
+                job.save_cursor()
+
+            # Description stage (caption & labels)
+            def process_description(work: FixWork):
+                # Make sure model is init
+                description_model: DescriptionModel = init_description_model()
+
+                # Load image (PIL is imported when first used)
+                from PIL import Image, ImageFile
+                with work.timer.measure('image_decode'):
+                    item_image: ImageFile = Image.open(work.item.path).convert("RGB")
+
+                # Generate caption & labels
+                if work.fix_caption: work.results['caption'] = description_model.generate_caption(item_image, work.timer)
+                if work.fix_labels: work.results['labels'] = description_model.generate_labels(item_image, work.timer)
+
+            # Text stage (OCR)
+            def process_text(work: FixWork):
+                # Make sure model is init & generate text
+                text_model: TextModel = init_text_model()
+                work.results['text'] = text_model.detect_text(work.item.path, work.timer)
+
+            # Start stages (finished work goes to the merge queue)
+            merge_queue: queue.Queue = queue.Queue()
+            description_stage = FixStage('description', process_description, merge_queue, stage_queue_size)
+            text_stage = FixStage('text', process_text, merge_queue, stage_queue_size)
+
+            # Loop job queue
+            dispatch_index: int = job.cursor
+            in_flight: int = 0
+            while not job.is_finished():
+                # Send items to the stages that they need
+                while in_flight < max_in_flight and dispatch_index < len(job.queue) and self.fix_resume.is_set():
+                    # Get entry
+                    index: int = dispatch_index
+                    entry: FixEntry = job.queue[index]
+                    dispatch_index += 1
+
+                    # Get item (it may have been deleted since the job was planned)
+                    album: Album = self.albums[entry.album_index]
+                    item: Item = album_items[entry.album_index].get(entry.item_name)
+                    if item == None:
+                        job.complete(index)
+                        continue
+
+                    # Check which fields still need fixing (cheap, only this item)
+                    item_metadata: dict = album.get_item_metadata(item.name)
+                    work: FixWork = FixWork(
+                        index, entry, item,
+                        entry.fix_caption and FixJob.needs_fix(item_metadata, 'caption', mode, provenance),
+                        entry.fix_labels and FixJob.needs_fix(item_metadata, 'labels', mode, provenance),
+                        entry.fix_text and FixJob.needs_fix(item_metadata, 'text', mode, provenance)
+                    )
+                    if not work.fix_caption and not work.fix_labels and not work.fix_text:
+                        job.complete(index)
+                        continue
+
+                    # Log fixing
+                    self.log_message_async(f'- Fixing "{item.name}"...')
+
+                    # Dispatch to stages
+                    stages: list[FixStage] = []
+                    if work.fix_caption or work.fix_labels: stages.append(description_stage)
+                    if work.fix_text: stages.append(text_stage)
+                    work.pending = len(stages)
+                    in_flight += 1
+                    for stage in stages: stage.add(work)
+
+                # Check if nothing is being fixed
+                if in_flight <= 0:
+                    # Check if paused
+                    if not self.fix_resume.is_set():
+                        # Paused -> Save progress & wait (models stay loaded)
+                        save_progress()
+                        self.log_message_async(f'Paused ({job.cursor}/{len(job.queue)} items done)')
+                        report.pause()
+                        self.fix_resume.wait()
+                        report.resume()
+                    continue
+
+                # Wait for a stage to finish
+                work: FixWork = merge_queue.get()
+                work.pending -= 1
+                if work.pending > 0: continue
+                in_flight -= 1
+
+                # All stages finished -> Check for errors
+                if len(work.errors) > 0:
+                    # Failed -> Skip item
+                    self.log_message_async(f'Failed to fix "{work.item.name}" ({", ".join(work.errors)})', LogLevel.ERROR)
+                    job.complete(work.index)
+                    continue
+
+                # Merge results into item metadata
+                album: Album = self.albums[work.entry.album_index]
+                item_metadata: dict = album.get_item_metadata(work.item.name)
+                item_metadata.update(work.results)
+                for field in work.results: MetadataUtil.set_provenance(item_metadata, field, provenance[field])
+                album.set_item_metadata(work.item.name, item_metadata)
+                modified_albums.add(work.entry.album_index)
+                touched_albums.add(work.entry.album_index)
+                cleaned_albums.discard(work.entry.album_index)
+
+                # Mark item as fixed
+                job.complete(work.index)
+                total_items_fixed += 1
+
+                # Save timings & show live summary
+                report.add_item(work.entry.album_index, work.item.name, work.timer)
+                self.app.call_from_thread(self.update_fix_info, report.get_summary())
+
+                # Save every x items
+                if total_items_fixed % save_every == 0: save_progress()
+
+            # Save remaining changes
+            save_progress(finished=True)
+
+            # Job finished -> Delete it
+            FixJob.clear(mode)
+            failed = False
+        except Exception as error:
+            # Failed -> Log error (the saved job continues next time)
+            self.log_message_async(f'Fix failed: {error}', LogLevel.ERROR)
+        finally:
+            # Stop stages (sends them the stop signal & waits for their threads)
+            if description_stage is not None: description_stage.stop()
+            if text_stage is not None: text_stage.stop()
+
+            # Let models unload when idle
+            self.fix_resume = None
+            ModelManager.release()
+
+            # Unlock the screen if the fix failed
+            if failed:
+                self.app.call_from_thread(self.toggle_pause, False)
+                self.set_working_async(False, 'Fix stopped, start it again to continue where it stopped')
+        if failed: return
+
+        # Show timings report
+        report.add_stages(run_timer)
+        report.close()
+        self.log_message_async('Fix report:')
+        for line in report.get_report(): self.log_message_async(line)
+        self.log_message_async(f'Raw timings saved in "{report.path}"')
 
         # Update albums info
-        self.update_info(total_items_count, 0)
+        for album in self.albums: album.refresh_items_stats()
+        self.app.call_from_thread(self.refresh_info)
+        self.app.call_from_thread(self.toggle_pause, False)
 
         # Finish fixing
-        self.set_working_async(False, f'Finished fixing albums metadata (fixed {total_items_fixed})')
\ No newline at end of file
+        self.set_working_async(False, f'Finished fixing albums metadata (fixed {total_items_fixed})')
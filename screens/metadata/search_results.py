@@ -0,0 +1,62 @@
+from util.library import Item
+from dataclasses import dataclass, field
+from datetime import datetime
+
+# Search result
+@dataclass
+class SearchResult:
+    album_index: int
+    album_name: str
+    item: Item
+    last_modified: float
+    score: int
+
+    def get_date(self) -> str:
+        return datetime.fromtimestamp(self.last_modified).strftime('%Y-%m-%d %H:%M')
+
+# Search results (kept in memory so they can be sorted & paged without searching again)
+@dataclass
+class SearchResults:
+
+    # Sort modes
+    SORT_SCORE = 'score'
+    SORT_DATE = 'date'
+    SORT_ALBUM = 'album'
+
+    # Info
+    search: str = ''
+    results: list[SearchResult] = field(default_factory=list)
+    sort: str = SORT_SCORE
+
+    # Pages
+    page_size: int = 500
+    page: int = 0
+
+    # Sorting
+    def sort_by(self, sort: str):
+        # Sort results (sorts are stable, so results with the same key stay newest first)
+        self.results.sort(key=lambda result: result.last_modified, reverse=True)
+        match sort:
+            case SearchResults.SORT_SCORE:
+                self.results.sort(key=lambda result: result.score, reverse=True)
+            case SearchResults.SORT_ALBUM:
+                self.results.sort(key=lambda result: result.album_index)
+        self.sort = sort
+
+        # Go back to the first page
+        self.page = 0
+
+    # Pages
+    def count_pages(self) -> int:
+        return max((len(self.results) + self.page_size - 1) // self.page_size, 1)
+
+    def set_page(self, page: int) -> bool:
+        # Change page (returns if it changed)
+        page = min(max(page, 0), self.count_pages() - 1)
+        if page == self.page: return False
+        self.page = page
+        return True
+
+    def get_page(self) -> list[SearchResult]:
+        start: int = self.page * self.page_size
+        return self.results[start:start + self.page_size]
@@ -0,0 +1,90 @@
+from screens.metadata.search_results import SearchResult, SearchResults
+from textual.screen import Screen
+from textual.widgets import Header, Button, Label, DataTable
+from textual.containers import Vertical, Horizontal
+
+class SearchScreen(Screen):
+
+    # Info
+    TITLE = 'Search'
+
+
+    # Constructor
+    def __init__(self, results: SearchResults):
+        # Widgets
+        self.w_info = None
+        self.w_table = None
+
+        # Results
+        self.results: SearchResults = results
+
+        # Init parent
+        super().__init__()
+
+    # State
+    def on_mount(self):
+        # Create table columns & show first page
+        self.w_table.add_columns('Score', 'Date', 'Album', 'Item', 'Path')
+        self.show_page()
+
+    # Widgets
+    def compose(self):
+        # Create widgets
+        self.w_info = Label(classes='box')
+        self.w_table = DataTable(classes='box', cursor_type='row', zebra_stripes=True)
+
+        # Create layout
+        yield Header()
+        with Horizontal():
+            with Vertical():
+                yield Button(classes='menu_button', id='back', label='Back', variant='error')
+                with Vertical():
+                    yield self.w_info
+                    with Horizontal(classes='search_pages'):
+                        yield Button(classes='search_page_button', id='previous-page', label='<', tooltip='Shows the previous page of results')
+                        yield Button(classes='search_page_button', id='next-page', label='>', tooltip='Shows the next page of results')
+                    yield Button(classes='menu_button', id='sort-score', label='Sort by score', tooltip='Shows items where the search was found in more places first')
+                    yield Button(classes='menu_button', id='sort-date', label='Sort by date', tooltip='Shows the newest items first')
+                    yield Button(classes='menu_button', id='sort-album', label='Sort by album', tooltip='Shows items grouped by album (newest first)')
+            yield self.w_table
+
+    def update_info(self):
+        # Update info text
+        self.w_info.content = (
+            f'· Search: "{self.results.search}"\n'
+            f'· Results: {len(self.results.results)}\n'
+            f'· Sorted by: {self.results.sort}\n'
+            f'· Page: {self.results.page + 1}/{self.results.count_pages()}'
+        )
+
+    # Events
+    def on_button_pressed(self, event: Button.Pressed):
+        match event.button.id:
+            # Back
+            case 'back':
+                self.app.pop_screen()
+            # Pages
+            case 'previous-page':
+                if self.results.set_page(self.results.page - 1): self.show_page()
+            case 'next-page':
+                if self.results.set_page(self.results.page + 1): self.show_page()
+            # Sorting
+            case 'sort-score':
+                self.sort_results(SearchResults.SORT_SCORE)
+            case 'sort-date':
+                self.sort_results(SearchResults.SORT_DATE)
+            case 'sort-album':
+                self.sort_results(SearchResults.SORT_ALBUM)
+
+    # Results
+    def sort_results(self, sort: str):
+        self.results.sort_by(sort)
+        self.show_page()
+
+    def show_page(self):
+        # Replace table rows with the current page (the table only renders visible rows)
+        result: SearchResult
+        self.w_table.clear()
+        self.w_table.add_rows([(result.score, result.get_date(), result.album_name, result.item.name, result.item.path) for result in self.results.get_page()])
+        self.w_table.move_cursor(row=0, animate=False)
+        self.update_info()
@@ -0,0 +1,34 @@
+import asyncio
+
+# Sync locks (paths being written by a session, other sessions wait until they are released)
+class SyncLocks:
+
+    # Constructor
+    def __init__(self):
+        # Owner of each locked path
+        self.owners: dict[str, object] = {}
+
+        # Set when paths are released
+        self.released: asyncio.Event = None
+
+    # Locks
+    def is_free(self, paths: set[str], owner: object) -> bool:
+        return all(self.owners.get(path, owner) is owner for path in paths)
+
+    async def acquire(self, paths: set[str], owner: object) -> bool:
+        # Lock paths (all at once so sessions never wait for each other) & return if it had to wait
+        if self.released is None: self.released = asyncio.Event()
+        waited: bool = False
+        while not self.is_free(paths, owner):
+            waited = True
+            self.released.clear()
+            await self.released.wait()
+        for path in paths: self.owners[path] = owner
+        return waited
+
+    def release(self, owner: object):
+        # Unlock all paths of an owner
+        paths: list[str] = [path for path, path_owner in self.owners.items() if path_owner is owner]
+        if len(paths) == 0: return
+        for path in paths: self.owners.pop(path)
+        if self.released is not None: self.released.set()
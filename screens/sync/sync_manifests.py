@@ -0,0 +1,38 @@
+from util.util import Util
+import hashlib
+import secrets
+
+# Sync manifests (last album lists accepted from each client device & their sync token, so clients can send only what changed)
+class SyncManifests:
+
+    # Folder with a file for each device
+    folder_path: str = Util.join_path(Util.get_data_path(), 'sync_manifests')
+
+    # Manifests loaded or saved while the app runs (device id -> token & album lists)
+    cache: dict[str, tuple[str, list[list]]] = {}
+
+
+    # Files (device ids come from the client, so their hash is used as the file name)
+    @staticmethod
+    def get_path(device_id: str) -> str:
+        return Util.join_path(SyncManifests.folder_path, f'{hashlib.sha1(device_id.encode('utf-8')).hexdigest()}.json')
+
+    # Manifests
+    @staticmethod
+    def create_token() -> str:
+        return secrets.token_hex(16)
+
+    @staticmethod
+    def load(device_id: str) -> tuple[str, list[list]]:
+        # Get token & album lists (None if the device has none)
+        if device_id in SyncManifests.cache: return SyncManifests.cache[device_id]
+        saved: dict = Util.load_json(SyncManifests.get_path(device_id))
+        SyncManifests.cache[device_id] = (saved.get('token'), saved.get('albums'))
+        return SyncManifests.cache[device_id]
+
+    @staticmethod
+    def save(device_id: str, token: str, albums: list[list]):
+        # Save token & album lists (if saving fails the token won't match the file, so the client sends the whole list next time)
+        SyncManifests.cache[device_id] = (token, albums)
+        Util.create_folder(SyncManifests.folder_path)
+        Util.save_json(SyncManifests.get_path(device_id), { 'deviceId': device_id, 'token': token, 'albums': albums })
@@ -0,0 +1,126 @@
+from util.library import MetadataUtil
+import hashlib
+import decimal
+import json
+import math
+
+# Metadata delta (compares metadata files by item so only changed items are sent)
+class MetadataDelta:
+
+    # Fields used to check which item metadata is more complete
+    fields: list[str] = ['caption', 'labels', 'text']
+
+    # Max size of the items sent in a message (bytes of JSON)
+    max_message_size: int = 2_097_152
+
+    # Canonical JSON (RFC 8785, so other apps create the same text without copying how Python writes JSON)
+    @staticmethod
+    def to_canonical_json(value) -> str:
+        # Objects (no whitespace & keys sorted by their UTF-16 code units)
+        if type(value) is dict:
+            items: list = sorted(value.items(), key=lambda item: item[0].encode('utf-16-be'))
+            return '{' + ','.join(f'{MetadataDelta.to_canonical_json(key)}:{MetadataDelta.to_canonical_json(item)}' for key, item in items) + '}'
+
+        # Arrays
+        if type(value) is list: return '[' + ','.join(MetadataDelta.to_canonical_json(item) for item in value) + ']'
+
+        # Strings (only quotes, backslashes & control characters are escaped, with the same escapes as JSON.stringify)
+        if type(value) is str: return json.dumps(value, ensure_ascii=False)
+
+        # Literals
+        if value is None: return 'null'
+        if value is True: return 'true'
+        if value is False: return 'false'
+
+        # Numbers
+        if type(value) in (int, float): return MetadataDelta.to_canonical_number(value)
+        raise TypeError(f'{type(value).__name__} is not JSON')
+
+    @staticmethod
+    def to_canonical_number(value: int | float) -> str:
+        # Numbers are written like JavaScript writes doubles (shortest digits that read back the same number)
+        number: float = float(value)
+        if not math.isfinite(number): raise ValueError('NaN & infinity are not JSON')
+        if number == 0: return '0'
+
+        # Get digits & position of the decimal point (digits 123 & point 1 is 1.23)
+        (sign, digits, exponent) = decimal.Decimal(repr(number)).normalize().as_tuple()
+        text: str = ''.join(str(digit) for digit in digits)
+        point: int = len(text) + exponent
+        prefix: str = '-' if sign else ''
+
+        # Integers & decimals (up to 21 digits), small decimals (up to 6 zeros) & exponents
+        if len(text) <= point <= 21: return prefix + text + '0' * (point - len(text))
+        if 0 < point <= 21: return prefix + text[:point] + '.' + text[point:]
+        if -6 < point <= 0: return prefix + '0.' + '0' * -point + text
+        mantissa: str = text[0] + ('.' + text[1:] if len(text) > 1 else '')
+        return prefix + mantissa + 'e' + ('+' if point - 1 >= 0 else '-') + str(abs(point - 1))
+
+    # Digests (item name -> item metadata hash)
+    @staticmethod
+    def hash_item(item_metadata) -> str:
+        # Hash item metadata as canonical JSON in UTF-8 (first 8 bytes of BLAKE2b in hex)
+        text: str = MetadataDelta.to_canonical_json(item_metadata)
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+    @staticmethod
+    def get_digest(metadata: dict) -> dict[str, str]:
+        return { item_name: MetadataDelta.hash_item(item_metadata) for item_name, item_metadata in metadata.items() }
+
+    @staticmethod
+    def compare_digests(host_digest: dict[str, str], client_digest: dict[str, str]) -> tuple[list[str], list[str]]:
+        # Items the host needs from the client (only in the client or different)
+        needed: list[str] = [item_name for item_name, item_hash in client_digest.items() if host_digest.get(item_name) != item_hash]
+
+        # Items only in the host
+        missing: list[str] = [item_name for item_name in host_digest.keys() - client_digest.keys()]
+        return (needed, missing)
+
+    # Merging
+    @staticmethod
+    def count_fields(item_metadata) -> int:
+        if type(item_metadata) is not dict: return -1
+        return sum(1 for field in MetadataDelta.fields if MetadataUtil.has_valid_field(item_metadata, field))
+
+    @staticmethod
+    def merge_item(host_item, client_item):
+        # Keep the more complete item metadata (the host one if both are as complete)
+        if host_item is None: return client_item
+        if MetadataDelta.count_fields(client_item) > MetadataDelta.count_fields(host_item): return client_item
+        return host_item
+
+    @staticmethod
+    def is_conflict(host_item, client_item) -> bool:
+        # Items are different but as complete in both (items don't save when they were modified, so the host one is kept)
+        if host_item is None or host_item == client_item: return False
+        return MetadataDelta.count_fields(client_item) == MetadataDelta.count_fields(host_item)
+
+    # Messages
+    @staticmethod
+    def split_items(metadata: dict, item_names: list[str]) -> list[dict]:
+        # Split items into batches so messages stay small
+        batches: list[dict] = []
+        batch: dict = {}
+        batch_size: int = 0
+        for item_name in item_names:
+            # Get item size
+            item_metadata = metadata[item_name]
+            item_size: int = len(json.dumps(item_metadata, ensure_ascii=False).encode('utf-8')) + len(item_name)
+
+            # Check if batch is full
+            if len(batch) > 0 and batch_size + item_size > MetadataDelta.max_message_size:
+                batches.append(batch)
+                batch = {}
+                batch_size = 0
+
+            # Add item to batch
+            batch[item_name] = item_metadata
+            batch_size += item_size
+
+        # Add last batch
+        if len(batch) > 0: batches.append(batch)
+        return batches
+
+    @staticmethod
+    def split_names(item_names: list[str], batch_size: int = 250) -> list[list[str]]:
+        return [item_names[index:index + batch_size] for index in range(0, len(item_names), batch_size)]
@@ -0,0 +1,148 @@
+from util.util import Util
+from util.library import Album
+from screens.sync.sync_writer import SyncWriter
+from dataclasses import dataclass, field
+import os
+
+# Sync manifest entry (item info used to find changes, unknown info is None)
+@dataclass
+class ManifestEntry:
+    index: int = -1
+    size: int = None
+    last_modified: int = None
+
+# Sync plan of an album
+@dataclass
+class AlbumPlan:
+    album_index: int = -1
+
+    # Client item indexes to download (from oldest to newest)
+    adds: list[int] = field(default_factory=list)
+    changes: list[int] = field(default_factory=list)
+
+    # Client item indexes with the same size but a different date (content may be the same)
+    suspects: list[int] = field(default_factory=list)
+
+    # Host item names to delete & partial files of deleted items
+    deletes: list[str] = field(default_factory=list)
+    partials: list[str] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return len(self.adds) == 0 and len(self.changes) == 0 and len(self.suspects) == 0 and len(self.deletes) == 0
+
+# Sync plan
+@dataclass
+class SyncPlan:
+    albums: list[AlbumPlan] = field(default_factory=list)
+
+    def count_adds(self) -> int:
+        return sum(len(album.adds) for album in self.albums)
+
+    def count_changes(self) -> int:
+        return sum(len(album.changes) for album in self.albums)
+
+    def count_suspects(self) -> int:
+        return sum(len(album.suspects) for album in self.albums)
+
+    def count_deletes(self) -> int:
+        return sum(len(album.deletes) for album in self.albums)
+
+    def get_summary(self) -> str:
+        return f'{self.count_adds()} new, {self.count_changes()} changed, {self.count_suspects()} with a different date & {self.count_deletes()} deleted'
+
+# Sync planner (compares host & client albums using manifests)
+class SyncPlanner:
+
+    # Manifests (item name -> entry)
+    @staticmethod
+    def create_host_manifest(album: Album) -> dict[str, ManifestEntry]:
+        manifest: dict[str, ManifestEntry] = {}
+        for index, item in enumerate(album.items):
+            stat: os.stat_result = os.stat(item.path)
+            manifest[item.name] = ManifestEntry(index, stat.st_size, int(stat.st_mtime))
+        return manifest
+
+    @staticmethod
+    def create_client_manifest(client_album: list) -> dict[str, ManifestEntry]:
+        manifest: dict[str, ManifestEntry] = {}
+        for index, item in enumerate(client_album):
+            if isinstance(item, str):
+                # Old clients only send item names
+                manifest[item] = ManifestEntry(index)
+            else:
+                # New clients send [name, size, last modified]
+                (item_name, size, last_modified) = item
+                manifest[item_name] = ManifestEntry(index, size, int(last_modified))
+        return manifest
+
+    # Album changes
+    @staticmethod
+    def apply_delta(albums: list[list], delta: list[dict]) -> list[list]:
+        # Apply the changes a client sent since its last album lists (returns None if they don't match them)
+        if len(delta) != len(albums): return None
+        new_albums: list[list] = []
+        for album, album_delta in zip(albums, delta):
+            # Remove deleted & changed items (the rest keep their order)
+            removed: set[str] = set(album_delta.get('removed', []))
+            kept: list[list] = [item for item in album if item[0] not in removed]
+
+            # Insert new & changed items on their index ([index, name, size, last modified])
+            added: list[list] = sorted(album_delta.get('added', []), key=lambda item: item[0])
+            count: int = album_delta.get('count', len(kept) + len(added))
+            if len(kept) + len(added) != count: return None
+            new_album: list[list] = []
+            kept_index: int = 0
+            added_index: int = 0
+            for index in range(count):
+                if added_index < len(added) and added[added_index][0] == index:
+                    new_album.append(added[added_index][1:])
+                    added_index += 1
+                elif kept_index < len(kept):
+                    new_album.append(kept[kept_index])
+                    kept_index += 1
+
+            # Check if all new items were inserted (their indexes are valid)
+            if added_index < len(added): return None
+            new_albums.append(new_album)
+        return new_albums
+
+    # Planning
+    @staticmethod
+    def plan_album(album_index: int, host_album: Album, client_manifest: dict[str, ManifestEntry]) -> AlbumPlan:
+        # Create host manifest
+        host_manifest: dict[str, ManifestEntry] = SyncPlanner.create_host_manifest(host_album)
+        plan: AlbumPlan = AlbumPlan(album_index)
+
+        # Check for deleted files
+        for item_name in host_manifest.keys() - client_manifest.keys():
+            plan.deletes.append(item_name)
+
+        # Check for partial files of deleted items
+        if Util.exists_path(host_album.album_path):
+            for file_name in os.listdir(host_album.album_path):
+                # Check if file is a partial file of a deleted item
+                if not file_name.endswith(SyncWriter.temp_extension): continue
+                if file_name.removesuffix(SyncWriter.temp_extension) in client_manifest: continue
+                plan.partials.append(file_name.removesuffix(SyncWriter.temp_extension))
+
+        # Check for missing & changed files (client albums are sorted from newest to oldest)
+        for item_name, client_entry in reversed(client_manifest.items()):
+            host_entry: ManifestEntry = host_manifest.get(item_name)
+            if host_entry is None:
+                # Item is missing -> It needs to be downloaded
+                plan.adds.append(client_entry.index)
+            elif client_entry.size is not None and client_entry.size != host_entry.size:
+                # Item size changed (edited or not fully downloaded) -> It needs to be downloaded again
+                plan.changes.append(client_entry.index)
+            elif client_entry.last_modified is not None and client_entry.last_modified != host_entry.last_modified:
+                # Item date changed -> Its content may have changed
+                plan.suspects.append(client_entry.index)
+
+        return plan
+
+    @staticmethod
+    def plan(host_albums: list[Album], client_manifests: list[dict[str, ManifestEntry]]) -> SyncPlan:
+        plan: SyncPlan = SyncPlan()
+        for album_index, host_album in enumerate(host_albums):
+            plan.albums.append(SyncPlanner.plan_album(album_index, host_album, client_manifests[album_index]))
+        return plan
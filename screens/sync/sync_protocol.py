@@ -0,0 +1,242 @@
+import hashlib
+import struct
+import zlib
+import os
+
+# Sync protocol features (negotiated with a "hello" message, old clients don't send it & use none)
+class Feature:
+    # Several item parts can be requested at once & arrive in the order they were requested
+    WINDOWED_PARTS: str = 'windowedParts'
+
+    # Several items can be requested at once, their messages have a request id & their parts start with a part header
+    CONCURRENT_ITEMS: str = 'concurrentItems'
+
+    # Album lists have the size & last modified date of each item ([name, size, lastModified] instead of name)
+    ALBUM_ITEM_INFO: str = 'albumItemInfo'
+
+    # Sampled hashes of items can be requested to check if their content changed
+    SAMPLED_HASHES: str = 'sampledHashes'
+
+    # Metadata files are sent in parts like items (their info has the parts & compression, their parts start with a part header)
+    CHUNKED_METADATA: str = 'chunkedMetadata'
+
+    # Metadata can be merged by exchanging item digests & only the items that changed (the digest of an item is the first 8 bytes of
+    # BLAKE2b, in hex, of its metadata as RFC 8785 canonical JSON in UTF-8)
+    DELTA_METADATA: str = 'deltaMetadata'
+
+    # Item parts have a part header with a CRC32 of the part & item info can have a CRC32 of the whole file (needs windowed parts or concurrent items to request parts again)
+    CHECKSUMS: str = 'checksums'
+
+    # Small items can be requested in bundles & are sent back to back in one stream of binary frames (needs album item info & protocol 2)
+    BUNDLES: str = 'bundles'
+
+    # Album lists can be sent as the changes since the last list the server accepted, identified by a sync token (needs album item info & a device id)
+    INCREMENTAL_ALBUMS: str = 'incrementalAlbums'
+
+# Binary frame types (protocol 2, the first byte of every binary frame)
+class Frame:
+    # Host -> client: request id, album index, item index, part index & request count
+    REQUEST_ITEM_PART: int = 1
+
+    # Client -> host: request id, part index & CRC32 (0 without checksums), followed by the part data
+    ITEM_PART: int = 2
+
+    # Both ways: album index & part index
+    REQUEST_METADATA_PART: int = 3
+
+    # Both ways: album index & part index, followed by the part data
+    METADATA_PART: int = 4
+
+    # Client -> host: bundle id & chunk index, followed by the next bytes of the bundle stream
+    BUNDLE_DATA: int = 5
+
+# Sync protocol info
+class Protocol:
+
+    # Version & features supported by this server (version 1 sends the messages of each part as JSON, version 2 as binary frames)
+    version: int = 2
+    features: list[str] = [
+        Feature.WINDOWED_PARTS,
+        Feature.CONCURRENT_ITEMS,
+        Feature.ALBUM_ITEM_INFO,
+        Feature.SAMPLED_HASHES,
+        Feature.CHUNKED_METADATA,
+        Feature.DELTA_METADATA,
+        Feature.CHECKSUMS,
+        Feature.BUNDLES,
+        Feature.INCREMENTAL_ALBUMS,
+    ]
+
+    # Part header (request id & part index) & part header with checksum (request id, part index & CRC32)
+    part_header: struct.Struct = struct.Struct('>II')
+    part_header_crc: struct.Struct = struct.Struct('>III')
+
+    # Binary frames (type & header)
+    frame_type: struct.Struct = struct.Struct('>B')
+    frame_request_item_part: struct.Struct = struct.Struct('>BIIIII')
+    frame_item_part: struct.Struct = struct.Struct('>BIII')
+    frame_metadata_part: struct.Struct = struct.Struct('>BII')
+    frame_bundle_data: struct.Struct = struct.Struct('>BII')
+
+    # Bundle streams (each item starts with its position in the bundle, status, size, last modified & CRC32, followed by its data)
+    bundle_entry: struct.Struct = struct.Struct('>IBQqI')
+    bundle_status_ok: int = 0
+    bundle_status_error: int = 1
+
+    # Metadata parts (each part is compressed on its own so they can be requested in any order)
+    metadata_part_size: int = 1_048_576
+    compression_none: str = 'none'
+    compression_zlib: str = 'zlib'
+
+    # Sampled hashes (size, start, middle & end of a file)
+    hash_sample_size: int = 65536
+
+    @staticmethod
+    def negotiate(client_features: list[str]) -> set[str]:
+        # Use features supported by both sides
+        features: set[str] = set(client_features) & set(Protocol.features)
+
+        # Checksums need to request specific parts again
+        if Feature.WINDOWED_PARTS not in features and Feature.CONCURRENT_ITEMS not in features: features.discard(Feature.CHECKSUMS)
+
+        # Bundles need item sizes to choose which items fit in them & album changes need them to find changed items
+        if Feature.ALBUM_ITEM_INFO not in features:
+            features.discard(Feature.BUNDLES)
+            features.discard(Feature.INCREMENTAL_ALBUMS)
+        return features
+
+    @staticmethod
+    def negotiate_version(client_version: int, features: set[str]) -> int:
+        # Use the newest version supported by both sides (old clients don't send it & use 1)
+        version: int = min(int(client_version), Protocol.version)
+
+        # Binary frames always have a part index, so parts are tracked like windowed parts
+        if version >= 2 and (Feature.WINDOWED_PARTS not in features or Feature.CHUNKED_METADATA not in features): version = 1
+        return max(version, 1)
+
+    # Parts
+    @staticmethod
+    def pack_part(request_id: int, part_index: int, data: bytes) -> bytes:
+        return Protocol.part_header.pack(request_id, part_index) + data
+
+    @staticmethod
+    def unpack_part(data: bytes) -> tuple[int, int, memoryview]:
+        (request_id, part_index) = Protocol.part_header.unpack_from(data)
+        return (request_id, part_index, memoryview(data)[Protocol.part_header.size:])
+
+    @staticmethod
+    def unpack_part_crc(data: bytes) -> tuple[int, int, int, memoryview]:
+        (request_id, part_index, crc) = Protocol.part_header_crc.unpack_from(data)
+        return (request_id, part_index, crc, memoryview(data)[Protocol.part_header_crc.size:])
+
+    # Frames
+    @staticmethod
+    def get_frame_type(data: bytes) -> int:
+        return data[0] if len(data) > 0 else 0
+
+    @staticmethod
+    def pack_request_item_part(request_id: int, album_index: int, item_index: int, part_index: int, request_count: int) -> bytes:
+        return Protocol.frame_request_item_part.pack(Frame.REQUEST_ITEM_PART, request_id, album_index, item_index, part_index, request_count)
+
+    @staticmethod
+    def unpack_item_part(data: bytes) -> tuple[int, int, int, memoryview]:
+        (_, request_id, part_index, crc) = Protocol.frame_item_part.unpack_from(data)
+        return (request_id, part_index, crc, memoryview(data)[Protocol.frame_item_part.size:])
+
+    @staticmethod
+    def pack_request_metadata_part(album_index: int, part_index: int) -> bytes:
+        return Protocol.frame_metadata_part.pack(Frame.REQUEST_METADATA_PART, album_index, part_index)
+
+    @staticmethod
+    def pack_metadata_part(album_index: int, part_index: int, data: bytes) -> bytes:
+        return Protocol.frame_metadata_part.pack(Frame.METADATA_PART, album_index, part_index) + data
+
+    @staticmethod
+    def unpack_metadata_part(data: bytes) -> tuple[int, int, memoryview]:
+        # Also used for metadata part requests (their data is empty)
+        (_, album_index, part_index) = Protocol.frame_metadata_part.unpack_from(data)
+        return (album_index, part_index, memoryview(data)[Protocol.frame_metadata_part.size:])
+
+    @staticmethod
+    def unpack_bundle_data(data: bytes) -> tuple[int, int, memoryview]:
+        (_, bundle_id, chunk_index) = Protocol.frame_bundle_data.unpack_from(data)
+        return (bundle_id, chunk_index, memoryview(data)[Protocol.frame_bundle_data.size:])
+
+    @staticmethod
+    def count_parts(size: int, part_size: int) -> int:
+        return max((size + part_size - 1) // part_size, 1)
+
+    @staticmethod
+    def read_part(path: str, part_index: int, part_size: int, compression: str) -> bytes:
+        # Read part from disk
+        with open(path, 'rb') as file:
+            file.seek(part_index * part_size)
+            data: bytes = file.read(part_size)
+
+        # Compress it
+        if compression == Protocol.compression_zlib: data = zlib.compress(data)
+        return data
+
+    @staticmethod
+    def decompress_part(data: bytes, compression: str) -> bytes:
+        # Decompress part (invalid data returns an empty part)
+        if compression != Protocol.compression_zlib: return data
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return b''
+
+    # Hashes
+    @staticmethod
+    def get_sampled_hash(path: str) -> str:
+        # Hash size
+        size: int = os.path.getsize(path)
+        sample_size: int = Protocol.hash_sample_size
+        hash = hashlib.sha256(size.to_bytes(8, 'big'))
+
+        # Hash samples (small files are hashed whole)
+        with open(path, 'rb') as file:
+            if size <= sample_size * 3:
+                hash.update(file.read())
+            else:
+                for offset in (0, (size - sample_size) // 2, size - sample_size):
+                    file.seek(offset)
+                    hash.update(file.read(sample_size))
+        return hash.hexdigest()
+
+    # Checksums (CRC32 of parts can be combined into the CRC32 of the whole file without reading it again)
+    crc_polynomial: int = 0xEDB88320
+    crc_shifts: dict[int, int] = {}
+
+    @staticmethod
+    def multiply_mod_crc(a: int, b: int) -> int:
+        # Multiply two polynomials modulo the CRC32 polynomial (reflected)
+        result: int = 0
+        mask: int = 1 << 31
+        while mask > 0:
+            if a & mask: result ^= b
+            mask >>= 1
+            b = (b >> 1) ^ Protocol.crc_polynomial if b & 1 else b >> 1
+        return result
+
+    @staticmethod
+    def get_crc_shift(length: int) -> int:
+        # Check if shift was already calculated (parts usually have the same length)
+        shift: int = Protocol.crc_shifts.get(length)
+        if shift is not None: return shift
+
+        # Get x^(8 * length) modulo the CRC32 polynomial by squaring
+        shift = 1 << 31 # x^0
+        square: int = 1 << 23 # x^8 (one byte)
+        remaining: int = length
+        while remaining > 0:
+            if remaining & 1: shift = Protocol.multiply_mod_crc(square, shift)
+            remaining >>= 1
+            if remaining > 0: square = Protocol.multiply_mod_crc(square, square)
+        Protocol.crc_shifts[length] = shift
+        return shift
+
+    @staticmethod
+    def combine_crc(crc1: int, crc2: int, length2: int) -> int:
+        # Shift the first CRC by the length of the second data & add the second CRC
+        return Protocol.multiply_mod_crc(Protocol.get_crc_shift(length2), crc1) ^ crc2
@@ -0,0 +1,55 @@
+from collections.abc import Callable
+from collections import deque
+import asyncio
+import threading
+
+# Sync scheduler (one thread runs the disk writes & hashes of all sessions, taking turns between them)
+class SyncScheduler:
+
+    # Constructor
+    def __init__(self):
+        # Tasks of each owner (in the order they were added) & owners with tasks in the order they take turns
+        self.tasks: dict[object, deque[tuple]] = {}
+        self.turns: deque[object] = deque()
+
+        # Lock (tasks are added from the event loop & run in the scheduler thread)
+        self.has_tasks: threading.Condition = threading.Condition()
+
+        # Scheduler thread
+        self.thread: threading.Thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Scheduler thread
+    def run(self):
+        while True:
+            # Wait for a task & take it from the owner whose turn it is (one task per turn)
+            with self.has_tasks:
+                while len(self.turns) == 0: self.has_tasks.wait()
+                owner: object = self.turns.popleft()
+                owner_tasks: deque[tuple] = self.tasks[owner]
+                (task, args, loop, callback) = owner_tasks.popleft()
+                if len(owner_tasks) > 0:
+                    self.turns.append(owner)
+                else:
+                    self.tasks.pop(owner)
+
+            # Run task
+            result = None
+            error: Exception = None
+            try:
+                result = task(*args)
+            except Exception as e:
+                error = e
+
+            # Send result to the event loop
+            if callback is not None: loop.call_soon_threadsafe(callback, result, error)
+
+    # Tasks
+    def add_task(self, owner: object, task: Callable, args: tuple, loop: asyncio.AbstractEventLoop = None, callback: Callable = None):
+        # Add task (tasks of the same owner run in order)
+        with self.has_tasks:
+            if owner not in self.tasks:
+                self.tasks[owner] = deque()
+                self.turns.append(owner)
+            self.tasks[owner].append((task, args, loop, callback))
+            self.has_tasks.notify()
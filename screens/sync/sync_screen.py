@@ -1,8 +1,9 @@
 from util.dialogs import ConfirmDialog
+from util.log_view import LogView
 from screens.sync.sync_server import SyncServer
 from textual.screen import Screen
 from textual.widgets import Header, Button, Label
-from textual.containers import Vertical, Horizontal, VerticalScroll
+from textual.containers import Vertical, Horizontal
 
 class SyncScreen(Screen):
 
@@ -16,24 +17,17 @@ class SyncScreen(Screen):
         self.w_info = None
         self.w_logs = None
 
-        # Logs
-        self.logs_count = 0
-
         # Init parent
         super().__init__()
 
     # State
     def on_mount(self):
-        # Update server info
+        # Update server info (& download stats while syncing)
         self.update_info()
-
-        # Show previous server logs
-        for log in SyncServer.current.logs:
-            self.log_message(log)
+        self.set_interval(0.5, self.update_info)
 
         # Register server events
         SyncServer.current.register_events(
-            log_message=self.on_log_message, 
             server_state_changed=self.on_server_state_changed, 
             connection_state_changed=self.on_connection_state_changed
         )
@@ -41,7 +35,6 @@ class SyncScreen(Screen):
     def on_unmount(self):
         # Unregister server events
         SyncServer.current.unregister_events(
-            log_message=self.on_log_message, 
             server_state_changed=self.on_server_state_changed, 
             connection_state_changed=self.on_connection_state_changed
         )
@@ -50,7 +43,7 @@ class SyncScreen(Screen):
     def compose(self):
         # Create widgets
         self.w_info = Label(classes='box')
-        self.w_logs = VerticalScroll(classes='box')
+        self.w_logs = LogView(SyncServer.current.logs, classes='box')
 
         # Create layout
         yield Header()
@@ -62,16 +55,20 @@ class SyncScreen(Screen):
                     yield Button(classes='menu_button', id='start-server', label='Start server', tooltip='Starts the sync server if it\'s not running')
                     yield Button(classes='menu_button', id='sync-albums', label='Sync albums', tooltip='Updates the albums in this system with the albums in the client')
                     yield Button(classes='menu_button', id='sync-metadata', label='Sync metadata', tooltip='Updates the metadata in one system with the metadata in the other system')
+                    yield Button(classes='menu_button', id='merge-metadata', label='Merge metadata', tooltip='Exchanges only the metadata that changed & keeps the most complete metadata of each item in both systems')
             yield self.w_logs
 
     def update_info(self):
         # Get info
         is_running = '🟢' if SyncServer.current.is_running else '🔴'
-        is_connected = '🟢' if SyncServer.current.is_connected else '🔴'
+        clients = len(SyncServer.current.sessions)
         connection_code = SyncServer.current.connection_code
 
-        # Update info text
-        self.w_info.content = f'· Server running: {is_running}\n· Client connected: {is_connected}\n· Code: {connection_code}'
+        # Update info text (& stats of the last download of each client)
+        info: str = f'· Server running: {is_running}\n· Clients connected: {clients}\n· Code: {connection_code}'
+        for session in list(SyncServer.current.sessions.values()):
+            if session.stats is not None: info += f'\n\n{session.name}\n{session.stats.get_info()}'
+        self.w_info.content = info
 
     # Events
     def on_button_pressed(self, event: Button.Pressed):
@@ -88,10 +85,9 @@ class SyncScreen(Screen):
             # Sync metadata
             case 'sync-metadata':
                 self.option_sync_metadata()
-
-    def on_log_message(self, error: str):
-        # Log
-        self.log_message_async(error)
+            # Merge metadata
+            case 'merge-metadata':
+                self.run_worker(SyncServer.current.merge_metadata, thread=True)
 
     def on_server_state_changed(self, is_running: bool):
         self.update_info()
@@ -99,23 +95,6 @@ class SyncScreen(Screen):
     def on_connection_state_changed(self, is_open: bool, client_ip: str):
         self.update_info()
 
-    # Logs
-    def log_message(self, message: str) -> Label:
-        # Create label
-        label = Label(message, classes='zebra_even' if self.logs_count % 2 == 0 else 'zebra_odd')
-        self.logs_count += 1
-
-        # Max logs
-        if len(self.w_logs.children) >= 1000: self.w_logs.children[0].remove()
-
-        # Add new log
-        self.w_logs.mount(label)
-        self.w_logs.scroll_end(animate=False)
-        return label
-
-    def log_message_async(self, message: str):
-        self.app.call_from_thread(self.log_message, message)
-
     # Options
     def option_sync_metadata(self):
         # Create result event
@@ -0,0 +1,1558 @@
+from util.library import Link, Album, Filter, Library
+from util.util import Util
+from util.config import Config
+from util.logs import LogLevel
+from screens.sync.sync_protocol import Feature, Frame, Protocol
+from screens.sync.sync_window import SyncWindow
+from screens.sync.sync_writer import SyncWriter
+from screens.sync.sync_planner import SyncPlanner, SyncPlan, AlbumPlan, ManifestEntry
+from screens.sync.sync_manifests import SyncManifests
+from screens.sync.sync_metadata import MetadataDelta
+from screens.sync.sync_stats import SyncStats
+from dataclasses import dataclass, field
+from collections import deque
+from pathlib import Path
+import websockets
+import asyncio
+import time
+import json
+import zlib
+
+# Sync info (requests)
+@dataclass
+class Request:
+    # Id (queue index)
+    request_id: int = -1
+
+    # Album
+    album_index: int = -1
+    item_index: int = -1
+
+    # File info
+    last_modified: int = 0
+    size: int = 0
+    compression: str = None
+
+    # Parts info
+    part_index: int = 0
+    part_max_size: int = 0
+    parts: int = 1
+
+    # Parts requested but not received yet (windowed, in the order they were requested) & received
+    parts_in_flight: deque[int] = field(default_factory=deque)
+    parts_received: set[int] = field(default_factory=set)
+    failed: bool = False
+
+    # Parts to request again (corrupted) & times each part was requested again
+    parts_retry: deque[int] = field(default_factory=deque)
+    parts_retries: dict[int, int] = field(default_factory=dict)
+
+    # Checksums (whole file, parts received in order combined & parts received after them)
+    crc: int = None
+    crc_prefix: int = 0
+    crc_prefix_parts: int = 0
+    crc_pending: dict[int, int] = field(default_factory=dict)
+    crc_unknown: bool = False
+
+    def is_complete(self) -> bool:
+        return not self.failed and len(self.parts_received) >= self.parts
+
+    def get_part_size(self, part_index: int) -> int:
+        return min(self.part_max_size, self.size - part_index * self.part_max_size)
+
+    def add_part_crc(self, part_index: int, crc: int):
+        # Combine part checksums in order (without reading the parts again)
+        self.crc_pending[part_index] = crc
+        while self.crc_prefix_parts in self.crc_pending:
+            self.crc_prefix = Protocol.combine_crc(self.crc_prefix, self.crc_pending.pop(self.crc_prefix_parts), self.get_part_size(self.crc_prefix_parts))
+            self.crc_prefix_parts += 1
+
+    def can_verify(self) -> bool:
+        return self.crc is not None and not self.crc_unknown
+
+    def is_crc_valid(self) -> bool:
+        return self.crc_prefix_parts >= self.parts and self.crc_prefix == self.crc
+
+# Sync info (bundles of small items sent back to back in one stream)
+@dataclass
+class Bundle:
+    # Id (queue index of the first item)
+    bundle_id: int = -1
+
+    # Item requests (in the order they are sent)
+    items: list[Request] = field(default_factory=list)
+
+    # Stream position (next chunk, current item, bytes of its entry header & bytes of its data left, None while reading the header)
+    chunk_index: int = 0
+    position: int = 0
+    header: bytearray = field(default_factory=bytearray)
+    remaining: int = None
+
+    # Current item data (bytes written & their checksum)
+    offset: int = 0
+    crc: int = 0
+
+    def get_current(self) -> Request:
+        return self.items[self.position]
+
+# Sync info (queue items)
+@dataclass
+class QueueItem:
+    album_index: int = -1
+    item_index: int = -1
+
+# Sync info (host)
+@dataclass
+class HostInfo:
+    # Albums
+    albums: list[Album] = field(default_factory=list)
+
+    # Metadata request
+    request: Request = None
+
+    # Item requests & bundles (by id)
+    requests: dict[int, Request] = field(default_factory=dict)
+    bundles: dict[int, Bundle] = field(default_factory=dict)
+
+    # Queue info
+    queue_index: int = -1
+    queue: list[QueueItem] = field(default_factory=list)
+    queue_done: int = 0
+    queue_failed: int = 0
+
+    # Items to request again on their own (queue indexes of bundle items that were corrupted or lost) & times each one was requested again
+    queue_retry: deque[int] = field(default_factory=deque)
+    queue_retries: dict[int, int] = field(default_factory=dict)
+
+    # Items waiting for their hash to be checked (album index, item index) & items that changed
+    hash_checks: set[tuple[int, int]] = field(default_factory=set)
+    hash_changed: int = 0
+
+    # Hashes being compared, time of the last hash received & task that downloads items whose hash doesn't arrive
+    hash_comparing: int = 0
+    hash_last_time: float = 0
+    hash_watch: asyncio.Task = None
+
+    # Checksum verification (verified parts & items, corrupted parts requested again & items that failed)
+    verified_parts: int = 0
+    verified_items: int = 0
+    corrupted_parts: int = 0
+    corrupted_items: int = 0
+
+    # Metadata merge (item batches requested to the client, items to send to it & counts)
+    merge_batches: int = 0
+    merge_send: set[str] = field(default_factory=set)
+    merge_received: int = 0
+    merge_changed: int = 0
+    merge_conflicts: int = 0
+    merge_conflicts_total: int = 0
+
+    # Parts window
+    window: SyncWindow = None
+
+# Sync info (client)
+@dataclass
+class ClientInfo:
+    # Albums (item names) & their manifests
+    albums: list[list[str]] = field(default_factory=list)
+    manifests: list[dict[str, ManifestEntry]] = field(default_factory=list)
+
+    # Protocol version, features & device id (sent by clients that support album changes)
+    protocol: int = 1
+    features: set[str] = field(default_factory=set)
+    device_id: str = None
+
+    def has_feature(self, feature: str) -> bool:
+        return feature in self.features
+
+    def has_frames(self) -> bool:
+        # Messages of each part are sent as binary frames
+        return self.protocol >= 2
+
+# Sync session (sync state & actions of one connected client)
+class SyncSession:
+
+    # Times a corrupted part is requested again before its item fails
+    max_part_retries: int = 3
+
+    # Items requested at once in a bundle
+    max_bundle_items: int = 256
+
+    # Seconds without receiving a requested item hash before the items left are downloaded
+    hash_timeout: float = 30
+
+
+    # Constructor
+    def __init__(self, server: "SyncServer", connection: websockets.ServerConnection, session_id: int):
+        # Server & connection
+        self.server: "SyncServer" = server
+        self.connection: websockets.ServerConnection = connection
+        self.is_connected: bool = True
+
+        # Info (name shown in logs)
+        self.session_id: int = session_id
+        self.name: str = f'{connection.remote_address[0]}:{connection.remote_address[1]}'
+        self.is_syncing: bool = False
+
+        # Host info (this pc) & client info (the connected phone)
+        self.host: HostInfo = HostInfo()
+        self.client: ClientInfo = ClientInfo()
+
+        # Disk writer (shares the server scheduler with other sessions)
+        self.writer: SyncWriter = SyncWriter(Config.get('sync_write_buffer') * 1024 * 1024, server.scheduler)
+        self.writer.on_write = self.on_disk_write
+
+        # Stats of the last album download
+        self.stats: SyncStats = None
+
+    # State
+    def close(self):
+        # Stop syncing & close files
+        self.is_connected = False
+        self.set_syncing(False)
+        self.writer.abort_all()
+        if self.host.hash_watch is not None: self.host.hash_watch.cancel()
+
+    # Logs
+    def log_message(self, message: str, level: int = LogLevel.INFO):
+        # Log with the client name (logs of all sessions are shown together)
+        self.server.log_message(f'[{self.name}] {message}', level)
+
+    # Data
+    async def send(self, data):
+        # Send data to client
+        await self.server.send(self.connection, data)
+
+    async def on_received_string(self, string: str):
+        # Parse JSON from string
+        try:
+            # Parse JSON
+            message = json.loads(string)
+
+            # Check if message has action
+            if not 'action' in message: 
+                # No action -> Show error
+                self.log_message(f'Missing JSON message action', LogLevel.WARNING)
+            else:
+                # Has action -> Check it
+                match message['action']:
+                    # Protocol handshake
+                    case 'hello': await self.action_hello(message)
+
+                    # End sync
+                    case 'endSync': self.action_end_sync(message)
+
+                    # Received client albums
+                    case 'albums': await self.action_received_albums(message)
+
+                    # Received client albums changes
+                    case 'albumsDelta': await self.action_received_albums_delta(message)
+
+                    # Received item info
+                    case 'itemInfo': await self.action_received_item_info(message)
+
+                    # Received item error
+                    case 'itemError': await self.action_received_item_error(message)
+
+                    # Received item hash
+                    case 'itemHash': await self.action_received_item_hash(message)
+
+                    # Received metadata info
+                    case 'metadataInfo': await self.action_received_metadata_info(message)
+
+                    # Send metadata info
+                    case 'requestMetadataInfo': await self.action_send_metadata_info(message)
+
+                    # Send metadata data
+                    case 'requestMetadataData': await self.action_send_metadata_data(message)
+
+                    # Received metadata digest (merge)
+                    case 'metadataDigest': await self.action_received_metadata_digest(message)
+
+                    # Received metadata items (merge)
+                    case 'metadataItems': await self.action_received_metadata_items(message)
+
+        except json.JSONDecodeError as e:
+            # Failed to parse json
+            self.log_message(f'Failed to parse JSON: {e}', LogLevel.ERROR)
+
+    async def on_received_binary(self, data: bytes):
+        # Check if data is a binary frame
+        if self.client.has_frames():
+            await self.on_received_frame(data)
+            return
+
+        # Check request type
+        if len(self.host.requests) > 0:
+            # Has item requests -> Is a file request
+            if self.client.has_feature(Feature.CHECKSUMS):
+                # Parts have a header with a checksum -> Get request from it (parts of finished requests are ignored)
+                (request_id, part_index, crc, data) = Protocol.unpack_part_crc(data)
+                request = self.host.requests.get(request_id)
+                if request is not None: await self.action_received_item_data(request, data, part_index, crc)
+            elif self.client.has_feature(Feature.CONCURRENT_ITEMS):
+                # Parts have a header -> Get request from it (parts of finished requests are ignored)
+                (request_id, part_index, data) = Protocol.unpack_part(data)
+                request = self.host.requests.get(request_id)
+                if request is not None: await self.action_received_item_data(request, data, part_index)
+            else:
+                # No header -> Only one item is requested at a time
+                await self.action_received_item_data(next(iter(self.host.requests.values())), data)
+        elif self.client.has_feature(Feature.CHUNKED_METADATA):
+            # Metadata parts have a header -> Check if it belongs to the current request
+            (album_index, part_index, data) = Protocol.unpack_part(data)
+            request: Request = self.host.request
+            if request is not None and request.album_index == album_index: await self.action_received_metadata_data(request, data, part_index)
+        else:
+            # No item requests -> Is a metadata request
+            await self.action_received_metadata_data(self.host.request, data)
+
+    async def on_received_frame(self, data: bytes):
+        # Check frame type
+        match Protocol.get_frame_type(data):
+            # Received item part (parts of finished requests are ignored)
+            case Frame.ITEM_PART:
+                (request_id, part_index, crc, data) = Protocol.unpack_item_part(data)
+                request: Request = self.host.requests.get(request_id)
+                if request is not None: await self.action_received_item_data(request, data, part_index, crc if self.client.has_feature(Feature.CHECKSUMS) else None)
+
+            # Received metadata part (ignored if it doesn't belong to the current request)
+            case Frame.METADATA_PART:
+                (album_index, part_index, data) = Protocol.unpack_metadata_part(data)
+                request: Request = self.host.request
+                if request is not None and request.album_index == album_index: await self.action_received_metadata_data(request, data, part_index)
+
+            # Received bundle data (data of finished or failed bundles is ignored)
+            case Frame.BUNDLE_DATA:
+                (bundle_id, chunk_index, data) = Protocol.unpack_bundle_data(data)
+                bundle: Bundle = self.host.bundles.get(bundle_id)
+                if bundle is not None: await self.action_received_bundle_data(bundle, chunk_index, data)
+
+            # Send metadata part
+            case Frame.REQUEST_METADATA_PART:
+                (album_index, part_index, _) = Protocol.unpack_metadata_part(data)
+                await self.send_metadata_part(album_index, part_index)
+
+            # Unknown frame
+            case frame_type:
+                self.log_message(f'Unknown binary frame type: {frame_type}', LogLevel.WARNING)
+
+    # Syncing
+    def set_syncing(self, new_syncing: bool):
+        # Paths locked by the sync are free again once it finishes
+        self.is_syncing = new_syncing
+        if not new_syncing: self.server.locks.release(self)
+
+    async def lock_paths(self, paths: set[str]) -> bool:
+        # Lock paths written by the sync (waits while another session writes them, returns if still connected)
+        if not self.server.locks.is_free(paths, self): self.log_message('Waiting for another client to finish writing the same albums...')
+        await self.server.locks.acquire(paths, self)
+        if not self.is_connected: self.server.locks.release(self)
+        return self.is_connected
+
+    # Actions
+    async def action_hello(self, message: dict):
+        # Save features supported by both sides
+        self.client.features = Protocol.negotiate(message.get('features', []))
+        self.client.protocol = Protocol.negotiate_version(message.get('protocol', 1), self.client.features)
+
+        # Bundles are sent as binary frames
+        if not self.client.has_frames(): self.client.features.discard(Feature.BUNDLES)
+
+        # Album changes are saved for each device
+        self.client.device_id = message.get('deviceId')
+        if not isinstance(self.client.device_id, str) or self.client.device_id == '': self.client.features.discard(Feature.INCREMENTAL_ALBUMS)
+
+        # Log
+        self.log_message(f'Client protocol {self.client.protocol}, features: {", ".join(sorted(self.client.features)) or "none"}')
+
+        # Answer with the version & features that will be used
+        await self.send(json.dumps({
+            'action': 'hello',
+            'protocol': self.client.protocol,
+            'features': sorted(self.client.features)
+        }))
+
+    def action_end_sync(self, message: dict):
+        # Stop syncing
+        self.set_syncing(False)
+
+        # Log
+        self.log_message('Finished sync')
+
+    async def action_received_albums(self, message: dict):
+        # Save albums list
+        albums: list[list] = message['albums']
+        self.set_client_albums(albums)
+
+        # Log
+        self.log_message('Received client albums list')
+
+        # Save it so next time the client only sends what changed
+        if self.client.has_feature(Feature.INCREMENTAL_ALBUMS): await self.save_client_albums(albums)
+
+    async def action_received_albums_delta(self, message: dict):
+        # Get saved albums list of the device (loaded in the writer thread if it isn't cached) & apply the changes if they are based on it
+        (token, albums) = (None, None)
+        if self.client.has_feature(Feature.INCREMENTAL_ALBUMS):
+            (token, albums) = SyncManifests.cache.get(self.client.device_id, (None, None))
+            if token is None: (token, albums) = await self.writer.run_task(SyncManifests.load, self.client.device_id)
+        delta: list[dict] = message['albums']
+        if token is None or token != message.get('token'): albums = None
+        if albums is not None: albums = SyncPlanner.apply_delta(albums, delta)
+
+        # Check if changes were applied
+        if albums is None:
+            # Not applied -> Request the whole list
+            self.log_message('Client albums changes are not based on the saved list, requesting the whole list')
+            await self.send(json.dumps({
+                'action': 'requestAlbums'
+            }))
+            return
+
+        # Save albums list
+        self.set_client_albums(albums)
+
+        # Log
+        added: int = sum(len(album_delta.get('added', [])) for album_delta in delta)
+        removed: int = sum(len(album_delta.get('removed', [])) for album_delta in delta)
+        self.log_message(f'Received client albums changes ({added} added & {removed} removed)')
+
+        # Save it with a new token
+        await self.save_client_albums(albums)
+
+    def set_client_albums(self, albums: list[list]):
+        # Save item names & manifests (new clients send [name, size, last modified] instead of the name)
+        self.client.albums = [[item if isinstance(item, str) else item[0] for item in album] for album in albums]
+        self.client.manifests = [SyncPlanner.create_client_manifest(album) for album in albums]
+
+    async def save_client_albums(self, albums: list[list]):
+        # Save albums list of the device with a new token (written in the writer thread without waiting for it)
+        token: str = SyncManifests.create_token()
+        SyncManifests.cache[self.client.device_id] = (token, albums)
+        def on_saved(result, error: Exception):
+            if error is not None: self.log_message(f'Failed to save client albums list: {error}', LogLevel.ERROR)
+        self.writer.add_task(SyncManifests.save, (self.client.device_id, token, albums), on_saved)
+
+        # Send the token the next changes should be based on
+        await self.send(json.dumps({
+            'action': 'albumsToken',
+            'token': token
+        }))
+
+    # Actions (receive item)
+    async def action_received_item_info(self, message: dict):
+        # Get request
+        request: Request = self.get_request(message)
+        if request is None: return
+
+        # Update request info
+        request.last_modified = message['lastModified']
+        request.size = message['size']
+        request.part_max_size = message['maxPartSize']
+        request.parts = message['parts']
+        if self.client.has_feature(Feature.CHECKSUMS): request.crc = message.get('crc32')
+
+        # Check if client can request specific parts (old clients keep their own part counter)
+        item_path: str = self.get_item_path(request.album_index, request.item_index)
+        can_resume: bool = self.client.has_feature(Feature.WINDOWED_PARTS) or self.client.has_feature(Feature.CONCURRENT_ITEMS)
+
+        # Get parts already on disk from a previous sync (& their checksums)
+        received: dict[int, int] = await self.writer.resume(item_path, request.size, request.last_modified, request.part_max_size, request.parts, can_resume)
+        if len(received) > 0:
+            request.parts_received = set(received)
+            for part_index, crc in received.items():
+                if crc is None:
+                    request.crc_unknown = True
+                else:
+                    request.add_part_crc(part_index, crc)
+            self.log_message(f'Resuming item ({len(received)}/{request.parts} parts already received)')
+
+        # Check if client supports windowed parts or concurrent items
+        if can_resume:
+            # Check if all parts were already received
+            if request.is_complete():
+                # Received -> Finish item
+                await self.finish_item_file(request, item_path)
+                await self.finish_item(request, request.is_complete())
+                return
+
+            # Supported -> Request parts (windows are measured per item if only one is requested at a time)
+            if not self.client.has_feature(Feature.CONCURRENT_ITEMS): self.host.window.start_round()
+            await self.request_item_parts(request)
+            return
+
+        # Request data
+        if self.stats is not None: self.stats.on_part_requested(request.request_id, request.part_index)
+        await self.send(json.dumps({
+            'action': 'requestItemData',
+            'albumIndex': request.album_index,
+            'itemIndex': request.item_index,
+            'part': request.part_index,
+            'requestIndex': request.request_id,
+            'requestCount': len(self.host.queue)
+        }))
+
+    async def action_received_item_error(self, message: dict):
+        # Get request
+        request: Request = self.get_request(message)
+        if request is None: return
+
+        # Log error & request next
+        self.log_message(f'Client failed to send item: {message.get('error', 'unknown error')}', LogLevel.ERROR)
+        await self.finish_item(request, False)
+
+    async def action_received_item_hash(self, message: dict):
+        # Check if item hash was requested
+        album_index: int = message['albumIndex']
+        item_index: int = message['itemIndex']
+        if (album_index, item_index) not in self.host.hash_checks: return
+        self.host.hash_checks.remove((album_index, item_index))
+        self.host.hash_comparing += 1
+        self.host.hash_last_time = time.monotonic()
+
+        # Get host hash (in the writer thread so the server doesn't wait for the disk)
+        item_path: str = self.get_item_path(album_index, item_index)
+        host_hash: str = None
+        try:
+            host_hash = await self.writer.run_task(Protocol.get_sampled_hash, item_path)
+        except OSError as e:
+            self.log_message(f'Failed to hash "{item_path}": {e}', LogLevel.ERROR)
+
+        # Compare hashes
+        client_hash: str = message.get('hash')
+        same: bool = client_hash is not None and client_hash == host_hash
+        if same:
+            # Same content -> Only update its date (download it if that fails)
+            client_entry: ManifestEntry = self.client.manifests[album_index][self.client.albums[album_index][item_index]]
+            try:
+                await self.writer.run_task(Util.set_last_modified, item_path, client_entry.last_modified)
+            except OSError as e:
+                self.log_message(f'Failed to update the date of "{item_path}": {e}', LogLevel.ERROR)
+                same = False
+        if not same:
+            # Content changed -> Add it to the queue
+            self.add_hash_changed(album_index, item_index)
+        self.host.hash_comparing -= 1
+        self.host.hash_last_time = time.monotonic()
+
+        # Check if all hashes were compared
+        await self.finish_hash_checks()
+
+    async def watch_hash_checks(self):
+        # Wait until all hashes are compared or none arrives for too long
+        while len(self.host.hash_checks) > 0:
+            waited: float = time.monotonic() - self.host.hash_last_time
+            if self.host.hash_comparing <= 0 and waited >= SyncSession.hash_timeout: break
+            await asyncio.sleep(max(SyncSession.hash_timeout - waited, 0.1))
+
+        # Check if hashes are still missing
+        if not self.is_connected or len(self.host.hash_checks) <= 0: return
+
+        # Timed out -> Download items left (like items whose hash doesn't match)
+        self.log_message(f'{len(self.host.hash_checks)} item hashes were not received, downloading them', LogLevel.WARNING)
+        for (album_index, item_index) in sorted(self.host.hash_checks):
+            self.add_hash_changed(album_index, item_index)
+        self.host.hash_checks = set()
+        await self.finish_hash_checks()
+
+    def add_hash_changed(self, album_index: int, item_index: int):
+        item = QueueItem()
+        item.album_index = album_index
+        item.item_index = item_index
+        self.host.queue.append(item)
+        self.host.hash_changed += 1
+
+    async def finish_hash_checks(self):
+        # Check if all hashes were compared
+        if len(self.host.hash_checks) > 0 or self.host.hash_comparing > 0: return
+
+        # Start queue
+        self.log_message(f'Compared hashes, {self.host.hash_changed} items changed')
+        await self.start_download_queue()
+
+    async def request_item_parts(self, request: Request):
+        # Get window size (one part at a time if client doesn't support windows)
+        window_size: int = self.host.window.size if self.client.has_feature(Feature.WINDOWED_PARTS) else 1
+
+        # Request parts until the window is full
+        while len(request.parts_in_flight) < window_size and (len(request.parts_retry) > 0 or request.part_index < request.parts):
+            # Get next part (corrupted parts first)
+            if len(request.parts_retry) > 0:
+                part_index: int = request.parts_retry.popleft()
+            else:
+                # Skip parts received in a previous sync
+                part_index: int = request.part_index
+                request.part_index += 1
+                if part_index in request.parts_received: continue
+
+            # Mark part as requested
+            request.parts_in_flight.append(part_index)
+            if self.stats is not None: self.stats.on_part_requested(request.request_id, part_index)
+
+            # Request part with a binary frame
+            if self.client.has_frames():
+                await self.send(Protocol.pack_request_item_part(request.request_id, request.album_index, request.item_index, part_index, len(self.host.queue)))
+                continue
+
+            # Create message
+            message: dict = {
+                'action': 'requestItemData',
+                'albumIndex': request.album_index,
+                'itemIndex': request.item_index,
+                'part': part_index,
+                'requestIndex': request.request_id,
+                'requestCount': len(self.host.queue)
+            }
+            if self.has_part_header(): message['requestId'] = request.request_id
+
+            # Request part
+            await self.send(json.dumps(message))
+
+    async def action_received_item_data(self, request: Request, data: bytes, part_index: int = None, crc: int = None):
+        # Get info
+        album_index: int = request.album_index
+        item_index: int = request.item_index
+        item_path: str = self.get_item_path(album_index, item_index)
+
+        # Update stats (parts without header are the oldest requested or the next one for old clients)
+        if self.stats is not None:
+            received_index: int = part_index
+            if received_index is None: received_index = request.parts_in_flight[0] if len(request.parts_in_flight) > 0 else request.part_index
+            self.stats.on_part_received(request.request_id, received_index, len(data))
+
+        # Check if part index is known
+        if part_index is not None:
+            # Sent in part header
+            if part_index in request.parts_in_flight: request.parts_in_flight.remove(part_index)
+
+            # Check part checksum
+            if crc is not None and not request.failed:
+                if zlib.crc32(data) != crc:
+                    # Corrupted -> Request it again (the item fails after too many retries)
+                    self.host.corrupted_parts += 1
+                    request.parts_retries[part_index] = request.parts_retries.get(part_index, 0) + 1
+                    self.log_message(f'Part {part_index + 1}/{request.parts} is corrupted', LogLevel.WARNING)
+                    if request.parts_retries[part_index] <= SyncSession.max_part_retries:
+                        request.parts_retry.append(part_index)
+                        await self.request_item_parts(request)
+                        return
+
+                    # Too many retries -> Fail item once all requested parts arrived
+                    self.log_message('Too many corrupted parts', LogLevel.ERROR)
+                    request.failed = True
+                    await self.writer.abort(item_path)
+                    if len(request.parts_in_flight) <= 0: await self.finish_item(request, False)
+                    return
+
+                # Valid -> Combine part checksum
+                self.host.verified_parts += 1
+                request.add_part_crc(part_index, crc)
+
+            # Manage part
+            await self.action_received_item_part(request, part_index, data, item_path, crc)
+            return
+        elif self.client.has_feature(Feature.WINDOWED_PARTS):
+            # Windowed -> Parts arrive in the order they were requested
+            await self.action_received_item_part(request, request.parts_in_flight.popleft(), data, item_path)
+            return
+
+        # Manage write data
+        part_index = request.part_index
+        finished: bool = await self.manage_write_data(request, part_index, data, item_path)
+        request.part_index += 1
+
+        # Check if finished
+        if finished:
+            # Finished -> Request next
+            await self.finish_item(request, request.is_complete())
+        else:
+            # Not finished -> Request next part (old clients keep their own part counter)
+            if self.stats is not None: self.stats.on_part_requested(request.request_id, request.part_index)
+            await self.send(json.dumps({
+                'action': 'requestItemData',
+                'albumIndex': album_index,
+                'itemIndex': item_index,
+                'part': part_index,
+                'requestIndex': request.request_id,
+                'requestCount': len(self.host.queue)
+            }))
+
+    async def action_received_item_part(self, request: Request, part_index: int, data: bytes, item_path: str, crc: int = None):
+        # Write part (parts of a failed item are ignored until none are in flight)
+        if not request.failed:
+            # Update window
+            self.host.window.on_part_received(len(data))
+
+            # Manage write data
+            finished: bool = await self.manage_write_data(request, part_index, data, item_path, crc)
+            if finished and not request.is_complete(): request.failed = True
+            if finished and not request.failed:
+                # Finished -> Request next
+                await self.finish_item(request, True)
+                return
+
+        # Check if failed
+        if request.failed:
+            # Failed -> Request next once all requested parts arrived
+            if len(request.parts_in_flight) <= 0: await self.finish_item(request, False)
+            return
+
+        # Not finished -> Request more parts
+        await self.request_item_parts(request)
+
+    async def finish_item(self, request: Request, success: bool):
+        # Remove request
+        self.host.requests.pop(request.request_id, None)
+
+        # Update progress & request next
+        self.count_finished_item(success)
+        await self.request_next_queue_item()
+
+    def count_finished_item(self, success: bool):
+        # Update progress
+        self.host.queue_done += 1
+        if not success: self.host.queue_failed += 1
+        if self.stats is not None: self.stats.on_item_finished(success)
+        self.log_progress(self.host.queue_done, len(self.host.queue), success)
+
+    # Actions (receive bundles)
+    async def action_received_bundle_data(self, bundle: Bundle, chunk_index: int, data: memoryview):
+        # Update stats
+        if self.stats is not None: self.stats.on_part_received(bundle.bundle_id, chunk_index, len(data))
+
+        # Check if chunk is the next one (chunks arrive in the order they were sent)
+        if chunk_index != bundle.chunk_index:
+            self.log_message(f'Bundle chunk {chunk_index} arrived out of order', LogLevel.ERROR)
+            await self.fail_bundle(bundle)
+            return
+        bundle.chunk_index += 1
+
+        # Split data into items
+        entry_size: int = Protocol.bundle_entry.size
+        while len(data) > 0:
+            # Check if reading an item header or its data
+            if bundle.remaining is None:
+                # Header -> Add bytes until it's complete (it may be split between chunks)
+                needed: int = entry_size - len(bundle.header)
+                bundle.header += data[:needed]
+                data = data[needed:]
+                if len(bundle.header) < entry_size: return
+
+                # Read header
+                (position, status, size, last_modified, crc) = Protocol.bundle_entry.unpack(bundle.header)
+                bundle.header.clear()
+                if position != bundle.position:
+                    self.log_message(f'Bundle item {position} arrived out of order', LogLevel.ERROR)
+                    await self.fail_bundle(bundle)
+                    return
+
+                # Check if client could send the item
+                request: Request = bundle.get_current()
+                if status != Protocol.bundle_status_ok:
+                    self.log_message(f'Client failed to send item "{self.client.albums[request.album_index][request.item_index]}"', LogLevel.ERROR)
+                    if await self.finish_bundle_item(bundle, False): return
+                    continue
+
+                # Start item
+                request.size = size
+                request.last_modified = last_modified
+                request.crc = crc if self.client.has_feature(Feature.CHECKSUMS) else None
+                bundle.remaining = size
+                bundle.offset = 0
+                bundle.crc = 0
+
+                # Create empty files (they have no data to write)
+                if size == 0: await self.writer.write(self.get_item_path(request.album_index, request.item_index), 0, 0, b'')
+            else:
+                # Data -> Write it on the item offset (in the writer thread)
+                request: Request = bundle.get_current()
+                item_data: memoryview = data[:bundle.remaining]
+                data = data[len(item_data):]
+                await self.writer.write(self.get_item_path(request.album_index, request.item_index), request.size, bundle.offset, item_data)
+                bundle.offset += len(item_data)
+                bundle.remaining -= len(item_data)
+                if request.crc is not None: bundle.crc = zlib.crc32(item_data, bundle.crc)
+
+            # Check if item finished
+            if bundle.remaining == 0 and await self.finish_bundle_item(bundle, True): return
+
+    async def finish_bundle_item(self, bundle: Bundle, success: bool) -> bool:
+        # Get item
+        request: Request = bundle.get_current()
+        item_path: str = self.get_item_path(request.album_index, request.item_index)
+
+        # Check if item was received
+        retried: bool = False
+        if success:
+            # Check whole file checksum
+            if request.crc is not None:
+                if bundle.crc != request.crc:
+                    # Corrupted -> Delete file & request it again on its own (the item fails after too many retries)
+                    self.host.corrupted_items += 1
+                    await self.writer.abort(item_path, False)
+                    retried = self.retry_bundle_item(request)
+                    self.log_message('File checksum does not match, requesting it again' if retried else 'File checksum does not match', LogLevel.WARNING if retried else LogLevel.ERROR)
+                    success = False
+                else:
+                    self.host.verified_items += 1
+
+            # Rename file & update last modified timestamp
+            if success:
+                error: str = await self.writer.finish(item_path, request.last_modified)
+                if error is not None:
+                    self.log_message(f'Failed to write file: {error}', LogLevel.ERROR)
+                    success = False
+
+        # Update progress & move to the next item (items requested again are counted when they finish)
+        if not retried: self.count_finished_item(success)
+        bundle.position += 1
+        bundle.remaining = None
+        if bundle.position < len(bundle.items): return False
+
+        # Finished bundle -> Request next (returns True so the rest of the data is ignored)
+        self.host.bundles.pop(bundle.bundle_id, None)
+        await self.request_next_queue_item()
+        return True
+
+    async def fail_bundle(self, bundle: Bundle):
+        # Remove bundle (its remaining data is ignored)
+        self.host.bundles.pop(bundle.bundle_id, None)
+
+        # Delete item being received
+        if bundle.remaining is not None:
+            request: Request = bundle.get_current()
+            await self.writer.abort(self.get_item_path(request.album_index, request.item_index), False)
+
+        # Request remaining items again on their own (items that were requested again too many times fail) & request next
+        for request in bundle.items[bundle.position:]:
+            if not self.retry_bundle_item(request): self.count_finished_item(False)
+        await self.request_next_queue_item()
+
+    def retry_bundle_item(self, request: Request) -> bool:
+        # Add item to the retry queue (returns False if it was requested again too many times)
+        retries: int = self.host.queue_retries.get(request.request_id, 0) + 1
+        self.host.queue_retries[request.request_id] = retries
+        if retries > SyncSession.max_part_retries: return False
+        self.host.queue_retry.append(request.request_id)
+        return True
+
+    # Actions (receive metadata)
+    async def action_received_metadata_info(self, message: dict):
+        # Check if last modified is valid (if client doesn't have the file it doesn't add it)
+        if 'lastModified' not in message:
+            # Not valid -> Request next
+            self.log_message('Client does not have the file', LogLevel.ERROR)
+            await self.request_next_queue_metadata()
+            return
+
+        # Create new request info
+        request = Request()
+        request.album_index = message['albumIndex']
+        request.last_modified = message['lastModified']
+        self.host.request = request
+
+        # Check if client sends metadata in parts
+        if self.client.has_feature(Feature.CHUNKED_METADATA):
+            # Supported -> Request parts
+            request.size = message['size']
+            request.part_max_size = message['maxPartSize']
+            request.parts = message['parts']
+            request.compression = message.get('compression', Protocol.compression_none)
+            await self.request_metadata_parts(request)
+            return
+
+        # Request data (old clients send the whole file at once)
+        await self.send(json.dumps({
+            'action': 'requestMetadataData',
+            'albumIndex': request.album_index
+        }))
+
+    async def request_metadata_parts(self, request: Request):
+        # Request parts until the window is full
+        while len(request.parts_in_flight) < self.host.window.size and request.part_index < request.parts:
+            # Mark part as requested
+            part_index: int = request.part_index
+            request.part_index += 1
+            request.parts_in_flight.append(part_index)
+
+            # Request part
+            if self.client.has_frames():
+                await self.send(Protocol.pack_request_metadata_part(request.album_index, part_index))
+            else:
+                await self.send(json.dumps({
+                    'action': 'requestMetadataData',
+                    'albumIndex': request.album_index,
+                    'part': part_index
+                }))
+
+    async def action_received_metadata_data(self, request: Request, data: bytes, part_index: int = None):
+        # Get info
+        album_index: int = request.album_index
+        metadata_path: str = Library.links[album_index].metadata_path
+
+        # Check if part index is known
+        if part_index is not None:
+            # Check if part was requested (parts of failed requests are ignored)
+            if part_index not in request.parts_in_flight: return
+            request.parts_in_flight.remove(part_index)
+            self.host.window.on_part_received(len(data))
+
+            # Manage write data (parts may be compressed)
+            data = Protocol.decompress_part(data, request.compression)
+            finished: bool = await self.manage_write_data(request, part_index, data, metadata_path)
+
+            # Check if finished
+            if finished:
+                # Finished -> Ignore remaining parts, log progress & request next
+                if not request.is_complete(): request.failed = True
+                request.parts_in_flight.clear()
+                self.log_progress(self.host.queue_index + 1, len(self.host.queue), request.is_complete())
+                await self.request_next_queue_metadata()
+            else:
+                # Not finished -> Request more parts
+                await self.request_metadata_parts(request)
+            return
+
+        # Manage write data
+        finished: bool = await self.manage_write_data(request, request.part_index, data, metadata_path)
+        request.part_index += 1
+
+        # Check if finished
+        if finished:
+            # Finished -> Log progress & request next
+            self.log_progress(self.host.queue_index + 1, len(self.host.queue), request.is_complete())
+            await self.request_next_queue_metadata()
+        else:
+            # Not finished -> Request next part
+            await self.send(json.dumps({
+                'action': 'requestMetadataData',
+                'albumIndex': album_index
+            }))
+
+    # Actions (send metadata)
+    async def action_send_metadata_info(self, message: dict):
+        # Get info
+        album_index: int = message['albumIndex']
+        metadata_path: str = Library.links[album_index].metadata_path
+
+        # Log
+        self.log_message(f'- Sending metadata for album {album_index}...')
+
+        # Create info
+        info: dict = {
+            'action': 'metadataInfo',
+            'albumIndex': album_index,
+            'lastModified': Util.get_last_modified(metadata_path)
+        }
+
+        # Add parts info (clients that support it request the file in parts)
+        if self.client.has_feature(Feature.CHUNKED_METADATA):
+            size: int = Path(metadata_path).stat().st_size
+            info['size'] = size
+            info['maxPartSize'] = Protocol.metadata_part_size
+            info['parts'] = Protocol.count_parts(size, Protocol.metadata_part_size)
+            info['compression'] = Protocol.compression_zlib if Config.get('sync_metadata_compression') else Protocol.compression_none
+
+        # Send info
+        await self.send(json.dumps(info))
+
+    async def action_send_metadata_data(self, message: dict):
+        # Get info
+        album_index: int = message['albumIndex']
+        metadata_path: str = Library.links[album_index].metadata_path
+
+        # Check if client requested a part
+        if self.client.has_feature(Feature.CHUNKED_METADATA):
+            # Requested a part -> Send it
+            await self.send_metadata_part(album_index, message['part'])
+            return
+
+        # Send whole file (old clients)
+        await self.send(Path(metadata_path).read_bytes())
+
+    async def send_metadata_part(self, album_index: int, part_index: int):
+        # Read part from disk (in the writer thread)
+        metadata_path: str = Library.links[album_index].metadata_path
+        compression: str = Protocol.compression_zlib if Config.get('sync_metadata_compression') else Protocol.compression_none
+        data: bytes = await self.writer.run_task(Protocol.read_part, metadata_path, part_index, Protocol.metadata_part_size, compression)
+
+        # Send it with its header
+        if self.client.has_frames():
+            await self.send(Protocol.pack_metadata_part(album_index, part_index, data))
+        else:
+            await self.send(Protocol.pack_part(album_index, part_index, data))
+
+    # Actions (merge metadata)
+    async def action_received_metadata_digest(self, message: dict):
+        # Check if digest is for the current album
+        album_index: int = message['albumIndex']
+        if album_index != self.host.queue_index: return
+        album: Album = self.host.albums[album_index]
+
+        # Compare digests (host digest is created in the writer thread)
+        host_digest: dict[str, str] = await self.writer.run_task(MetadataDelta.get_digest, album.metadata)
+        (needed, missing) = MetadataDelta.compare_digests(host_digest, message['digest'])
+
+        # Reset merge info
+        self.host.merge_send = set(missing)
+        self.host.merge_received = 0
+        self.host.merge_changed = 0
+        self.host.merge_conflicts = 0
+
+        # Check if items are needed from the client
+        batches: list[list[str]] = MetadataDelta.split_names(needed)
+        self.host.merge_batches = len(batches)
+        if len(batches) == 0:
+            # Not needed -> Finish album
+            await self.finish_merge_album()
+            return
+
+        # Request items
+        for item_names in batches:
+            await self.send(json.dumps({
+                'action': 'requestMetadataItems',
+                'albumIndex': album_index,
+                'items': item_names
+            }))
+
+    async def action_received_metadata_items(self, message: dict):
+        # Check if items are for the current album
+        album_index: int = message['albumIndex']
+        if album_index != self.host.queue_index or self.host.merge_batches <= 0: return
+        album: Album = self.host.albums[album_index]
+
+        # Merge items
+        for item_name, client_item in message['items'].items():
+            # Keep the more complete item metadata
+            host_item = album.metadata.get(item_name)
+            merged_item = MetadataDelta.merge_item(host_item, client_item)
+            self.host.merge_received += 1
+
+            # Check if both items are as complete (the host one is kept)
+            if MetadataDelta.is_conflict(host_item, client_item):
+                self.host.merge_conflicts += 1
+                self.host.merge_conflicts_total += 1
+                self.log_message(f'Album {album_index}: "{item_name}" is different with the same fields in both devices, kept the one in this computer', LogLevel.DEBUG)
+
+            # Check if host item changed
+            if merged_item is not host_item:
+                album.set_item_metadata(item_name, merged_item)
+                self.host.merge_changed += 1
+
+            # Check if client item needs to change
+            if merged_item != client_item: self.host.merge_send.add(item_name)
+
+        # Check if all batches were received
+        self.host.merge_batches -= 1
+        if self.host.merge_batches > 0: return
+
+        # Finish album
+        await self.finish_merge_album()
+
+    async def finish_merge_album(self):
+        # Get album
+        album_index: int = self.host.queue_index
+        album: Album = self.host.albums[album_index]
+
+        # Save metadata if it changed
+        if self.host.merge_changed > 0: await self.writer.run_task(album.save_metadata, False) # No backup (every merge would add one)
+
+        # Send items the client needs
+        for items in MetadataDelta.split_items(album.metadata, sorted(self.host.merge_send)):
+            await self.send(json.dumps({
+                'action': 'metadataItems',
+                'albumIndex': album_index,
+                'items': items
+            }))
+
+        # Log & merge next
+        self.log_message(f'Album {album_index}: {self.host.merge_received} items received, {self.host.merge_changed} updated & {len(self.host.merge_send)} sent')
+        if self.host.merge_conflicts > 0: self.log_message(f'Album {album_index}: {self.host.merge_conflicts} items were different with the same fields in both devices, kept the ones in this computer', LogLevel.WARNING)
+        await self.request_next_merge_album()
+
+    # Helpers
+    def get_request(self, message: dict) -> Request:
+        # Get item request (old clients only request one item at a time & don't send its id)
+        if 'requestId' in message: return self.host.requests.get(message['requestId'])
+        return next(iter(self.host.requests.values()), None)
+
+    def get_item_path(self, album_index: int, item_index: int) -> str:
+        item_name: str = self.client.albums[album_index][item_index]
+        return Util.join_path(Library.links[album_index].album_path, item_name)
+
+    async def manage_write_data(self, request: Request, part_index: int, data: bytes, file_path: str, crc: int = None) -> bool:
+        # Get info
+        size: int = max(request.size, len(data)) # Use data length in case size was not determined (metadata doesn't)
+
+        part_max_size: int = request.part_max_size
+        parts: int = request.parts
+
+        is_valid: bool = len(data) > 0
+        is_last: bool = len(request.parts_received | { part_index }) == parts # Parts may arrive out of order
+
+        # Write file
+        if is_valid:
+            # Write data on part offset (in the writer thread, the file is created with its full size on the first part)
+            offset = part_index * part_max_size
+            await self.writer.write(file_path, size, offset, data, part_index, crc)
+
+            # Mark part as complete
+            request.parts_received.add(part_index)
+
+            # Check if is the last part 
+            if is_last:
+                # Is the last part -> Verify file, rename it & update last modified timestamp
+                await self.finish_item_file(request, file_path)
+            else:
+                # Not the last part -> Log progress
+                self.log_message(f'Received part {len(request.parts_received)}/{parts}', LogLevel.DEBUG)
+
+                # Mark as not finished
+                return False
+        else:
+            # Log error & close file (kept if it can be resumed)
+            self.log_message(f'Invalid data', LogLevel.ERROR)
+            await self.writer.abort(file_path)
+
+        # Mark as finished
+        return True
+
+    async def finish_item_file(self, request: Request, file_path: str):
+        # Check whole file checksum
+        if request.can_verify():
+            if not request.is_crc_valid():
+                # Corrupted -> Delete file (received parts can't be trusted)
+                self.host.corrupted_items += 1
+                self.log_message('File checksum does not match', LogLevel.ERROR)
+                await self.writer.abort(file_path, False)
+                request.failed = True
+                return
+            self.host.verified_items += 1
+
+        # Rename file & update last modified timestamp
+        error: str = await self.writer.finish(file_path, request.last_modified)
+        if error is not None:
+            self.log_message(f'Failed to write file: {error}', LogLevel.ERROR)
+            request.failed = True
+
+    def on_disk_write(self, seconds: float, size: int):
+        # Update stats
+        if self.stats is not None: self.stats.on_disk_write(seconds, size)
+
+    def has_part_header(self) -> bool:
+        # Parts have a header with their request id
+        return self.client.has_feature(Feature.CONCURRENT_ITEMS) or self.client.has_feature(Feature.CHECKSUMS)
+
+    def log_progress(self, progress_current: int, progress_size: int, success: bool):
+        # Log progress
+        percent = round(progress_current / progress_size * 100, 2)
+        self.log_message(f'({progress_current}/{progress_size}, {percent}%) {'Success' if success else 'Error, data is invalid'}', LogLevel.INFO if success else LogLevel.ERROR)
+
+    async def request_next_queue_item(self):
+        # Check if still connected
+        if not self.is_connected: return
+
+        # Get items that can be requested at once (old clients only support one)
+        max_requests: int = max(Config.get('sync_concurrent_items'), 1) if self.client.has_feature(Feature.CONCURRENT_ITEMS) else 1
+        queue_size = len(self.host.queue)
+
+        # Request items until the limit (a bundle counts as one item)
+        while len(self.host.requests) + len(self.host.bundles) < max_requests and (len(self.host.queue_retry) > 0 or self.host.queue_index + 1 < queue_size):
+            # Check if an item has to be requested again (on its own, so it can be checked part by part)
+            if len(self.host.queue_retry) > 0:
+                queue_index = self.host.queue_retry.popleft()
+            else:
+                # Check if the next items can be requested in a bundle
+                if self.client.has_feature(Feature.BUNDLES):
+                    bundle_items: list[int] = self.get_bundle_items(self.host.queue_index + 1)
+                    if len(bundle_items) > 0:
+                        await self.request_bundle(bundle_items)
+                        continue
+
+                # Update queue index
+                self.host.queue_index += 1
+                queue_index = self.host.queue_index
+
+            # Get next item & create its request
+            next = self.host.queue[queue_index]
+            request = Request(request_id=queue_index, album_index=next.album_index, item_index=next.item_index)
+            self.host.requests[queue_index] = request
+
+            # Create message
+            message: dict = {
+                'action': 'requestItemInfo',
+                'albumIndex': next.album_index,
+                'itemIndex': next.item_index,
+                'requestIndex': queue_index,
+                'requestCount': queue_size
+            }
+            if self.has_part_header(): message['requestId'] = queue_index
+
+            # Request next
+            self.log_message(f'- Requesting item "{self.client.albums[next.album_index][next.item_index]}"...')
+            await self.send(json.dumps(message))
+
+        # Check if queue has remaining items
+        if len(self.host.requests) <= 0 and len(self.host.bundles) <= 0 and len(self.host.queue_retry) <= 0 and self.host.queue_index + 1 >= queue_size:
+            # No items left -> Finished sync
+            self.set_syncing(False)
+            if self.client.has_feature(Feature.CHECKSUMS): self.log_message(f'Verified {self.host.verified_items} items & {self.host.verified_parts} parts, {self.host.corrupted_parts} corrupted parts were requested again & {self.host.corrupted_items} items failed verification')
+            self.log_message(f'Finished downloading albums ({self.host.queue_failed} failed)' if self.host.queue_failed > 0 else 'Finished downloading albums')
+
+            # Save & log stats (saved in the writer thread, failing to save them doesn't fail the sync)
+            self.stats.finish()
+            try:
+                await self.writer.run_task(self.stats.save)
+            except OSError as e:
+                self.log_message(f'Failed to save sync stats: {e}', LogLevel.WARNING)
+            for line in self.stats.get_report(): self.log_message(line)
+            await self.send(json.dumps({
+                'action': 'endSync'
+            }))
+
+    def get_bundle_items(self, queue_index: int) -> list[int]:
+        # Get queue indexes of the next items that fit in a bundle (small items that aren't partially downloaded)
+        max_item_size: int = Config.get('sync_bundle_item_size') * 1024 * 1024
+        max_size: int = Config.get('sync_bundle_size') * 1024 * 1024
+        items: list[int] = []
+        size: int = 0
+        while queue_index < len(self.host.queue) and len(items) < SyncSession.max_bundle_items:
+            # Check if item is small enough
+            item: QueueItem = self.host.queue[queue_index]
+            item_name: str = self.client.albums[item.album_index][item.item_index]
+            item_size: int = self.client.manifests[item.album_index][item_name].size
+            if item_size is None or item_size > max_item_size or size + item_size > max_size: break
+
+            # Check if item can be resumed (partial files are downloaded in parts)
+            if Util.exists_path(SyncWriter.get_temp_path(self.get_item_path(item.album_index, item.item_index))): break
+
+            # Add item
+            items.append(queue_index)
+            size += item_size
+            queue_index += 1
+        return items
+
+    async def request_bundle(self, queue_indexes: list[int]):
+        # Create bundle (its id is the queue index of the first item)
+        bundle: Bundle = Bundle(bundle_id=queue_indexes[0])
+        for queue_index in queue_indexes:
+            item: QueueItem = self.host.queue[queue_index]
+            bundle.items.append(Request(request_id=queue_index, album_index=item.album_index, item_index=item.item_index))
+        self.host.bundles[bundle.bundle_id] = bundle
+        self.host.queue_index = queue_indexes[-1]
+
+        # Request bundle
+        self.log_message(f'- Requesting {len(queue_indexes)} items in a bundle...')
+        if self.stats is not None: self.stats.on_part_requested(bundle.bundle_id, 0)
+        await self.send(json.dumps({
+            'action': 'requestItemBundle',
+            'bundleId': bundle.bundle_id,
+            'items': [[request.album_index, request.item_index] for request in bundle.items],
+            'requestIndex': bundle.bundle_id,
+            'requestCount': len(self.host.queue)
+        }))
+
+    async def request_next_queue_metadata(self):
+        # Check if still connected
+        if not self.is_connected: return
+
+        # Update queue index
+        self.host.queue_index += 1
+        queue_index = self.host.queue_index
+        queue_size = len(self.host.queue)
+
+        # Check if queue has remaining items
+        if queue_index >= queue_size:
+            # No items left -> Finished sync
+            self.set_syncing(False)
+            self.log_message('Finished downloading metadata')
+            await self.send(json.dumps({
+                'action': 'endSync'
+            }))
+        else:
+            # Items left -> Get next item
+            next = self.host.queue[queue_index]
+
+            # Request next
+            self.log_message(f'- Requesting metadata for album {next.album_index}...')
+            await self.send(json.dumps({
+                'action': 'requestMetadataInfo',
+                'albumIndex': next.album_index
+            }))
+
+    async def request_next_merge_album(self):
+        # Check if still connected
+        if not self.is_connected: return
+
+        # Update queue index
+        self.host.queue_index += 1
+        album_index: int = self.host.queue_index
+
+        # Check if albums are left
+        if album_index >= len(self.host.albums):
+            # No albums left -> Finished sync
+            self.set_syncing(False)
+            self.log_message(f'Finished merging metadata ({self.host.merge_conflicts_total} conflicts kept from this computer)' if self.host.merge_conflicts_total > 0 else 'Finished merging metadata')
+            await self.send(json.dumps({
+                'action': 'endSync'
+            }))
+        else:
+            # Albums left -> Request digest of the next one
+            self.log_message(f'- Merging metadata for album {album_index}...')
+            await self.send(json.dumps({
+                'action': 'requestMetadataDigest',
+                'albumIndex': album_index
+            }))
+
+    def can_use(self) -> bool:
+        # Check if client is still connected
+        if not self.is_connected: return False
+
+        # Check if client is syncing
+        if self.is_syncing: 
+            self.log_message('A sync is in progress', LogLevel.WARNING)
+            return False
+        
+        # Is free to use
+        return True
+
+    # Options
+    async def download_albums(self):
+        # Check if can use
+        if not self.can_use(): return
+
+        # Start syncing
+        self.set_syncing(True)
+        self.log_message('Starting to download albums...')
+
+        # Plan download & lock the albums that change (planned again if another client wrote them while waiting)
+        plan: SyncPlan
+        locked: set[str] = set()
+        while True:
+            # Load albums (in the writer thread, so the server keeps answering every client while a big library loads)
+            success: bool
+            (success, self.host.albums) = await self.writer.run_task(Library.load_albums, Filter.all, False)
+
+            # Check if albums were loaded
+            if not success:
+                # Failed to load albums -> Stop syncing
+                self.set_syncing(False)
+                self.log_message('Download cancelled, make sure all link album folders exist', LogLevel.ERROR)
+                return
+
+            # Check albums sizes
+            host_albums_count = len(self.host.albums)
+            client_albums_count = len(self.client.albums)
+            if host_albums_count is not client_albums_count:
+                # Different album sizes -> Stop syncing
+                self.set_syncing(False)
+                self.log_message(f'Download cancelled, make sure both apps have the same amount of links (host: {host_albums_count}, client: {client_albums_count})', LogLevel.ERROR)
+                return
+
+            # Plan download (compares host & client album manifests)
+            plan_start: float = time.perf_counter()
+            plan = await self.writer.run_task(SyncPlanner.plan, self.host.albums, self.client.manifests)
+            self.log_message(f'Planned download in {time.perf_counter() - plan_start:.2f}s: {plan.get_summary()}')
+
+            # Check if albums that change are already locked
+            paths: set[str] = { self.host.albums[album_plan.album_index].album_path for album_plan in plan.albums if not album_plan.is_empty() or len(album_plan.partials) > 0 }
+            if paths <= locked: break
+
+            # Lock them (all at once, so locks held from a previous plan are released first)
+            self.server.locks.release(self)
+            waited: bool = not self.server.locks.is_free(paths, self)
+            if not await self.lock_paths(paths): return
+            locked = paths
+            if not waited: break
+
+        # Create empty queue
+        queue = []
+
+        # Check if item hashes can be compared
+        check_hashes: bool = Config.get('sync_hash_check') and self.client.has_feature(Feature.SAMPLED_HASHES)
+        hash_checks: set[tuple[int, int]] = set()
+
+        # Delete files deleted in the client & partial files of deleted items (in the writer thread)
+        await self.writer.run_task(self.delete_planned_files, plan)
+
+        # Check albums
+        album_plan: AlbumPlan
+        for album_plan in plan.albums:
+            # Log album changes
+            if album_plan.is_empty(): continue
+            album_path: str = self.host.albums[album_plan.album_index].album_path
+            self.log_message(f'Album "{album_path}": {len(album_plan.adds)} new, {len(album_plan.changes)} changed, {len(album_plan.suspects)} with a different date & {len(album_plan.deletes)} deleted')
+
+            # Add new & changed files to the queue (files with a different date too if hashes can't be compared)
+            for item_index in album_plan.adds + album_plan.changes + ([] if check_hashes else album_plan.suspects):
+                item = QueueItem()
+                item.album_index = album_plan.album_index
+                item.item_index = item_index
+                queue.append(item)
+
+            # Check hashes of files with a different date
+            if check_hashes:
+                hash_checks.update((album_plan.album_index, item_index) for item_index in album_plan.suspects)
+
+        # Update queue
+        self.host.queue = queue
+
+        # Check if hashes need to be compared
+        self.host.hash_checks = hash_checks
+        self.host.hash_changed = 0
+        self.host.hash_comparing = 0
+        if self.host.hash_watch is not None: self.host.hash_watch.cancel()
+        if len(hash_checks) > 0:
+            # Request hashes (the queue starts when all are checked)
+            self.log_message(f'Comparing hashes of {len(hash_checks)} items...')
+            for (album_index, item_index) in hash_checks:
+                await self.send(json.dumps({
+                    'action': 'requestItemHash',
+                    'albumIndex': album_index,
+                    'itemIndex': item_index
+                }))
+
+            # Download items whose hash doesn't arrive in time
+            self.host.hash_last_time = time.monotonic()
+            self.host.hash_watch = asyncio.create_task(self.watch_hash_checks())
+            return
+
+        # Start queue
+        await self.start_download_queue()
+
+    def delete_planned_files(self, plan: SyncPlan):
+        album_plan: AlbumPlan
+        for album_plan in plan.albums:
+            # Delete partial files of deleted items & their progress
+            album_path: str = self.host.albums[album_plan.album_index].album_path
+            for item_name in album_plan.partials:
+                item_path: str = Util.join_path(album_path, item_name)
+                Util.delete_path(SyncWriter.get_temp_path(item_path))
+                Util.delete_path(SyncWriter.get_progress_path(item_path))
+
+            # Delete files deleted in the client
+            for item_name in album_plan.deletes:
+                Util.delete_path(Util.join_path(album_path, item_name))
+
+    async def start_download_queue(self):
+        # Create parts window
+        self.host.window = SyncWindow(Config.get('sync_window_initial'), Config.get('sync_window_max'))
+
+        # Request first
+        self.host.requests = {}
+        self.host.bundles = {}
+        self.host.queue_index = -1
+        self.host.queue_done = 0
+        self.host.queue_failed = 0
+        self.host.queue_retry = deque()
+        self.host.queue_retries = {}
+        self.host.verified_parts = 0
+        self.host.verified_items = 0
+        self.host.corrupted_parts = 0
+        self.host.corrupted_items = 0
+
+        # Create stats (total size is known if the client sent item sizes)
+        sizes: list[int] = [self.client.manifests[item.album_index][self.client.albums[item.album_index][item.item_index]].size for item in self.host.queue]
+        self.stats = SyncStats(f'sync_client{self.session_id}', len(self.host.queue), None if None in sizes else sum(sizes))
+        await self.request_next_queue_item()
+
+    async def download_metadata(self):
+        # Check if can use
+        if not self.can_use(): return
+
+        # Start syncing
+        self.set_syncing(True)
+        self.log_message('Starting to download metadata...')
+
+        # Create empty queue
+        queue = []
+
+        # Check metadata files
+        link: Link
+        for index, link in enumerate(Library.links):
+            # Get metadata path
+            metadata_path = link.metadata_path
+
+            # Check if metadata exists
+            if not Util.exists_path(metadata_path):
+                # Path does not exist -> Stop syncing
+                self.set_syncing(False)
+                self.log_message('Download cancelled, make sure all link metadata files exist', LogLevel.ERROR)
+                return
+
+            # Create item & add it to the queue
+            item = QueueItem()
+            item.album_index = index
+            queue.append(item)
+
+        # Lock metadata files (other clients can't write them at the same time)
+        if not await self.lock_paths({ link.metadata_path for link in Library.links }): return
+
+        # Update queue
+        self.host.queue = queue
+
+        # Create parts window
+        self.host.window = SyncWindow(Config.get('sync_window_initial'), Config.get('sync_window_max'))
+
+        # Request first
+        self.host.queue_index = -1
+        await self.request_next_queue_metadata()
+
+    async def upload_metadata(self):
+        # Check if can use
+        if not self.can_use(): return
+
+        # Start syncing
+        self.set_syncing(True)
+        self.log_message('Starting to upload metadata...')
+
+        # Check metadata files
+        link: Link
+        for link in Library.links:
+            # Get metadata path
+            metadata_path = link.metadata_path
+
+            # Check if metadata exists
+            if not Util.exists_path(metadata_path):
+                # Path does not exist -> Stop syncing
+                self.set_syncing(False)
+                self.log_message('Upload cancelled, make sure all link metadata files exist', LogLevel.ERROR)
+                return
+
+        # Start metadata request
+        await self.send(json.dumps({
+            'action': 'startMetadataRequest'
+        }))
+
+    async def merge_metadata(self):
+        # Check if can use
+        if not self.can_use(): return
+
+        # Check if client supports merging
+        if not self.client.has_feature(Feature.DELTA_METADATA):
+            self.log_message('Merging metadata needs a newer version of the phone app', LogLevel.WARNING)
+            return
+
+        # Start syncing
+        self.set_syncing(True)
+        self.log_message('Starting to merge metadata...')
+
+        # Lock metadata files (other clients can't write them at the same time)
+        if not await self.lock_paths({ link.metadata_path for link in Library.links }): return
+
+        # Load albums (with metadata, in the writer thread)
+        success: bool
+        (success, self.host.albums) = await self.writer.run_task(Library.load_albums)
+
+        # Check if albums were loaded
+        if not success:
+            # Failed to load albums -> Stop syncing
+            self.set_syncing(False)
+            self.log_message('Merge cancelled, make sure all link album folders & metadata files exist', LogLevel.ERROR)
+            return
+
+        # Merge first
+        self.host.queue_index = -1
+        self.host.merge_conflicts_total = 0
+        await self.request_next_merge_album()
@@ -0,0 +1,184 @@
+from util.util import Util
+from util.timings import TimingReport
+from collections import deque
+from datetime import datetime
+import threading
+import json
+import time
+
+# Rolling stat (recent samples of a value & totals of all of them)
+class RollingStat:
+
+    # Constructor
+    def __init__(self, size: int = 256):
+        self.samples: deque[float] = deque(maxlen=size)
+        self.total: float = 0
+        self.count: int = 0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.total += value
+        self.count += 1
+
+    def get_average(self) -> float:
+        return (sum(self.samples) / len(self.samples)) if len(self.samples) > 0 else 0
+
+    def get_total_average(self) -> float:
+        return (self.total / self.count) if self.count > 0 else 0
+
+    def get_percentile(self, percent: float) -> float:
+        if len(self.samples) == 0: return 0
+        samples: list[float] = sorted(self.samples)
+        return samples[min(int(len(samples) * percent / 100), len(samples) - 1)]
+
+# Sync stats (throughput, part round trip & disk write times of a sync)
+class SyncStats:
+
+    # Seconds used to calculate the current throughput
+    throughput_seconds: float = 5
+
+    # Recent round trips & disk writes used for percentiles
+    samples: int = 256
+
+
+    # Constructor
+    def __init__(self, name: str, total_items: int, total_bytes: int = None):
+        # Info
+        self.name: str = name
+        self.run_id: str = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.start_time: float = time.perf_counter()
+        self.end_time: float = None
+
+        # Progress (total bytes are unknown if the client doesn't send item sizes)
+        self.total_items: int = total_items
+        self.total_bytes: int = total_bytes
+        self.items_done: int = 0
+        self.items_failed: int = 0
+        self.parts_received: int = 0
+        self.bytes_received: int = 0
+
+        # Throughput (recent received parts & fastest throughput)
+        self.recent: deque[tuple[float, int]] = deque()
+        self.peak_throughput: float = 0
+
+        # Part round trips (time a part was requested by request id & part index) & disk writes
+        self.part_times: dict[tuple[int, int], float] = {}
+        self.round_trips: RollingStat = RollingStat(SyncStats.samples)
+        self.disk_writes: RollingStat = RollingStat(SyncStats.samples)
+
+        # Stats are read by the screen thread
+        self.lock: threading.Lock = threading.Lock()
+
+    # Recording
+    def on_part_requested(self, request_id: int, part_index: int):
+        self.part_times[(request_id, part_index)] = time.perf_counter()
+
+    def on_part_received(self, request_id: int, part_index: int, size: int):
+        now: float = time.perf_counter()
+        with self.lock:
+            # Add round trip
+            requested_time: float = self.part_times.pop((request_id, part_index), None)
+            if requested_time is not None: self.round_trips.add(now - requested_time)
+
+            # Add received data
+            self.parts_received += 1
+            self.bytes_received += size
+            self.recent.append((now, size))
+            while now - self.recent[0][0] > SyncStats.throughput_seconds: self.recent.popleft()
+
+            # Update fastest throughput (once there are enough seconds to measure it)
+            if now - self.recent[0][0] >= 1: self.peak_throughput = max(self.peak_throughput, self.get_throughput(now))
+
+    def on_disk_write(self, seconds: float, size: int):
+        with self.lock:
+            self.disk_writes.add(seconds)
+
+    def on_item_finished(self, success: bool):
+        self.items_done += 1
+        if not success: self.items_failed += 1
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+        self.part_times.clear()
+
+    # Info
+    def get_elapsed(self) -> float:
+        return (self.end_time if self.end_time is not None else time.perf_counter()) - self.start_time
+
+    def get_throughput(self, now: float = None) -> float:
+        # Bytes per second of the recent parts
+        if now is None: now = time.perf_counter()
+        if len(self.recent) == 0: return 0
+        elapsed: float = max(now - self.recent[0][0], 0.001)
+        return sum(size for _, size in self.recent) / elapsed
+
+    def get_average_throughput(self) -> float:
+        elapsed: float = self.get_elapsed()
+        return (self.bytes_received / elapsed) if elapsed > 0 else 0
+
+    def get_eta(self) -> float:
+        # Use bytes if item sizes are known (items otherwise)
+        elapsed: float = self.get_elapsed()
+        if self.total_bytes is not None and self.bytes_received > 0:
+            return max(self.total_bytes - self.bytes_received, 0) / (self.bytes_received / elapsed)
+        if self.items_done > 0:
+            return max(self.total_items - self.items_done, 0) / (self.items_done / elapsed)
+        return 0
+
+    def get_peak_throughput(self) -> float:
+        # Short syncs don't last enough to measure it
+        return max(self.peak_throughput, self.get_average_throughput())
+
+    def get_disk_busy(self) -> float:
+        # Percent of the time the disk was writing
+        elapsed: float = self.get_elapsed()
+        return (self.disk_writes.total / elapsed * 100) if elapsed > 0 else 0
+
+    @staticmethod
+    def format_bytes(size: float) -> str:
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024: return f'{size:.1f} {unit}'
+            size /= 1024
+        return f'{size:.1f} TB'
+
+    def get_info(self) -> str:
+        with self.lock:
+            # Progress
+            progress: str = f'{self.items_done}/{self.total_items} items'
+            if self.total_bytes is not None: progress += f' ({SyncStats.format_bytes(self.bytes_received)}/{SyncStats.format_bytes(self.total_bytes)})'
+            if self.end_time is None: progress += f', ETA {TimingReport.format_seconds(self.get_eta())}'
+
+            # Create info text
+            return (
+                f'· Progress: {progress}\n'
+                f'· Speed: {SyncStats.format_bytes(self.get_throughput() if self.end_time is None else self.get_average_throughput())}/s\n'
+                f'· Part round trip: {self.round_trips.get_average() * 1000:.0f} ms (p95 {self.round_trips.get_percentile(95) * 1000:.0f} ms)\n'
+                f'· Disk write: {self.disk_writes.get_average() * 1000:.1f} ms per part (busy {self.get_disk_busy():.0f}%)'
+            )
+
+    def get_report(self) -> list[str]:
+        with self.lock:
+            return [
+                f'Time: {TimingReport.format_seconds(self.get_elapsed())} · {self.items_done} items ({self.items_failed} failed) · {SyncStats.format_bytes(self.bytes_received)} in {self.parts_received} parts',
+                f'· Speed: {SyncStats.format_bytes(self.get_average_throughput())}/s avg, {SyncStats.format_bytes(self.get_peak_throughput())}/s peak',
+                f'· Part round trip: {self.round_trips.get_total_average() * 1000:.0f} ms avg, {self.round_trips.get_percentile(95) * 1000:.0f} ms p95 (recent)',
+                f'· Disk write: {self.disk_writes.get_total_average() * 1000:.1f} ms avg per part, busy {self.get_disk_busy():.0f}% of the time',
+            ]
+
+    def save(self):
+        # Save summary next to the fix timings
+        Util.create_folder(TimingReport.folder_path)
+        with open(Util.join_path(TimingReport.folder_path, f'{self.name}_{self.run_id}.json'), 'w', encoding='utf-8') as file:
+            json.dump({
+                'type': 'summary',
+                'run': self.run_id,
+                'elapsed': round(self.get_elapsed(), 4),
+                'items': self.items_done,
+                'itemsFailed': self.items_failed,
+                'parts': self.parts_received,
+                'bytes': self.bytes_received,
+                'throughput': round(self.get_average_throughput(), 1),
+                'throughputPeak': round(self.get_peak_throughput(), 1),
+                'roundTrip': { 'average': round(self.round_trips.get_total_average(), 6), 'p50': round(self.round_trips.get_percentile(50), 6), 'p95': round(self.round_trips.get_percentile(95), 6) },
+                'diskWrite': { 'average': round(self.disk_writes.get_total_average(), 6), 'p95': round(self.disk_writes.get_percentile(95), 6), 'total': round(self.disk_writes.total, 4) },
+            }, file, ensure_ascii=False, indent=4)
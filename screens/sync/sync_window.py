@@ -0,0 +1,48 @@
+import time
+
+# Sync window (number of part requests in flight, grows while throughput improves)
+class SyncWindow:
+
+    # Constructor
+    def __init__(self, size: int, max_size: int):
+        # Window size
+        self.size: int = max(size, 1)
+        self.max_size: int = max(max_size, self.size)
+
+        # Current round (a window worth of parts)
+        self.round_start: float = None
+        self.round_bytes: int = 0
+        self.round_parts: int = 0
+
+        # Throughput of the last round (bytes per second)
+        self.last_throughput: float = 0
+
+    # Rounds
+    def start_round(self):
+        self.round_start = time.perf_counter()
+        self.round_bytes = 0
+        self.round_parts = 0
+
+    def on_part_received(self, size: int):
+        # Check if round started
+        if self.round_start is None: self.start_round()
+
+        # Add part to round
+        self.round_bytes += size
+        self.round_parts += 1
+        if self.round_parts < self.size: return
+
+        # Round finished -> Check throughput
+        elapsed: float = time.perf_counter() - self.round_start
+        if elapsed <= 0: return
+        throughput: float = self.round_bytes / elapsed
+
+        # Grow while improving & shrink if it got a lot worse
+        if throughput > self.last_throughput * 1.05:
+            self.size = min(self.size * 2, self.max_size)
+        elif throughput < self.last_throughput * 0.8:
+            self.size = max(self.size * 3 // 4, 1)
+        self.last_throughput = throughput
+
+        # Start next round
+        self.start_round()
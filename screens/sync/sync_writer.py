@@ -0,0 +1,210 @@
+from util.util import Util
+from screens.sync.sync_scheduler import SyncScheduler
+from collections.abc import Callable
+import asyncio
+import time
+import os
+
+# Sync writer (writes received data in the scheduler thread so the server never waits for the disk)
+class SyncWriter:
+
+    # Files are written with a temporary name & renamed when finished
+    temp_extension: str = '.coonpart'
+
+    # Parts on disk are saved next to the temporary file so downloads can be resumed
+    progress_extension: str = '.coonpart.json'
+    progress_save_every: int = 32
+
+
+    # Constructor
+    def __init__(self, max_buffered: int, scheduler: SyncScheduler):
+        # Buffer (bytes waiting to be written)
+        self.max_buffered: int = max_buffered
+        self.buffered: int = 0
+        self.has_room: asyncio.Event = None
+
+        # Called with the seconds & bytes of each write (in the event loop)
+        self.on_write: Callable[[float, int], None] = None
+
+        # Open files (only used by the scheduler thread), their write errors & their progress
+        self.files: dict[str, int] = {}
+        self.errors: dict[str, str] = {}
+        self.progress: dict[str, dict] = {}
+        self.progress_unsaved: dict[str, int] = {}
+
+        # Scheduler (its thread is shared with other writers, tasks of each writer run in order)
+        self.scheduler: SyncScheduler = scheduler
+
+    @staticmethod
+    def get_temp_path(path: str) -> str:
+        return path + SyncWriter.temp_extension
+
+    @staticmethod
+    def get_progress_path(path: str) -> str:
+        return path + SyncWriter.progress_extension
+
+    # Tasks
+    def add_task(self, task: Callable, args: tuple, callback: Callable = None):
+        self.scheduler.add_task(self, task, args, asyncio.get_running_loop(), callback)
+
+    def run_task(self, task: Callable, *args) -> asyncio.Future:
+        # Create future that is resolved when the task finishes
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        def on_result(result, error: Exception):
+            if future.done(): return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        # Add task
+        self.add_task(task, args, on_result)
+        return future
+
+    # Scheduler thread tasks
+    def open_file(self, path: str, size: int) -> int:
+        # Open temporary file (without truncating it)
+        fd: int = os.open(SyncWriter.get_temp_path(path), os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        self.files[path] = fd
+
+        # Resize it to full size (preallocated where supported so it isn't fragmented)
+        if os.fstat(fd).st_size != size:
+            os.ftruncate(fd, size)
+            if hasattr(os, 'posix_fallocate') and size > 0:
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    pass # Not supported by the file system
+        return fd
+
+    def write_file(self, path: str, size: int, offset: int, data: bytes, part_index: int, crc: int) -> float:
+        # Check if a previous write failed
+        if path in self.errors: return None
+
+        # Write data on offset
+        write_start: float = time.perf_counter()
+        try:
+            fd: int = self.files.get(path)
+            if fd is None: fd = self.open_file(path, size)
+            os.lseek(fd, offset, os.SEEK_SET)
+            view = memoryview(data)
+            while len(view) > 0:
+                view = view[os.write(fd, view):]
+        except OSError as e:
+            self.errors[path] = str(e)
+            return None
+        write_time: float = time.perf_counter() - write_start
+
+        # Update progress (saved every few parts)
+        progress: dict = self.progress.get(path)
+        if progress is None: return write_time
+        progress['received'].add(part_index)
+        if crc is not None: progress['crcs'][part_index] = crc
+        self.progress_unsaved[path] = self.progress_unsaved.get(path, 0) + 1
+        if self.progress_unsaved[path] >= SyncWriter.progress_save_every: self.save_progress(path)
+        return write_time
+
+    def close_file(self, path: str):
+        fd: int = self.files.pop(path, None)
+        if fd is not None: os.close(fd)
+
+    def resume_file(self, path: str, info: dict, resumable: bool) -> dict[int, int]:
+        # Check if saved progress belongs to the same file
+        saved: dict = Util.load_json(SyncWriter.get_progress_path(path))
+        received: set[int] = set()
+        crcs: dict[int, int] = {}
+        if resumable and Util.exists_path(SyncWriter.get_temp_path(path)) and all(saved.get(key) == value for key, value in info.items()):
+            # Same file -> Resume it
+            received = set(saved.get('received', []))
+            crcs = { int(part_index): crc for part_index, crc in saved.get('crcs', {}).items() }
+        else:
+            # Different file -> Start again
+            Util.delete_path(SyncWriter.get_temp_path(path))
+            Util.delete_path(SyncWriter.get_progress_path(path))
+
+        # Track progress
+        self.progress[path] = { **info, 'received': received, 'crcs': crcs }
+        return { part_index: crcs.get(part_index) for part_index in received }
+
+    def save_progress(self, path: str):
+        # Save parts on disk (& their checksums if known)
+        progress: dict = self.progress[path]
+        Util.save_json(SyncWriter.get_progress_path(path), { **progress, 'received': sorted(progress['received']), 'crcs': { str(part_index): crc for part_index, crc in progress['crcs'].items() } })
+        self.progress_unsaved[path] = 0
+
+    def finish_file(self, path: str, last_modified: int):
+        # Close file & forget progress
+        self.close_file(path)
+        self.progress.pop(path, None)
+        self.progress_unsaved.pop(path, None)
+        Util.delete_path(SyncWriter.get_progress_path(path))
+
+        # Check if a write failed
+        error: str = self.errors.pop(path, None)
+        if error is not None: raise OSError(error)
+
+        # Replace final file & update last modified timestamp
+        os.replace(SyncWriter.get_temp_path(path), path)
+        Util.set_last_modified(path, last_modified)
+
+    def abort_file(self, path: str, keep: bool):
+        # Close file
+        self.close_file(path)
+        self.errors.pop(path, None)
+
+        # Check if file can be resumed
+        if keep and path in self.progress:
+            # Has progress -> Keep it to resume later
+            self.save_progress(path)
+            self.progress.pop(path)
+            self.progress_unsaved.pop(path, None)
+        else:
+            # No progress -> Delete file
+            self.progress.pop(path, None)
+            self.progress_unsaved.pop(path, None)
+            Util.delete_path(SyncWriter.get_temp_path(path))
+            Util.delete_path(SyncWriter.get_progress_path(path))
+
+    # Writing
+    async def resume(self, path: str, size: int, last_modified: int, part_max_size: int, parts: int, resumable: bool = True) -> dict[int, int]:
+        # Track progress of a file & get parts already on disk from a previous sync (part index -> checksum or None)
+        info: dict = { 'size': size, 'lastModified': last_modified, 'partMaxSize': part_max_size, 'parts': parts }
+        return await self.run_task(self.resume_file, path, info, resumable)
+
+    async def write(self, path: str, size: int, offset: int, data: bytes, part_index: int = 0, crc: int = None):
+        # Wait until the buffer has room (backpressure)
+        if self.has_room is None: self.has_room = asyncio.Event()
+        while self.buffered > 0 and self.buffered + len(data) > self.max_buffered:
+            self.has_room.clear()
+            await self.has_room.wait()
+
+        # Add data to the buffer
+        length: int = len(data)
+        self.buffered += length
+
+        # Write data in the scheduler thread (without waiting for it)
+        def on_written(result, error: Exception):
+            self.buffered -= length
+            self.has_room.set()
+            if self.on_write is not None and result is not None: self.on_write(result, length)
+        self.add_task(self.write_file, (path, size, offset, data, part_index, crc), on_written)
+
+    async def finish(self, path: str, last_modified: int) -> str:
+        # Wait for all writes, close & rename file (returns the error if one happened)
+        try:
+            await self.run_task(self.finish_file, path, last_modified)
+            return None
+        except OSError as e:
+            await self.abort(path)
+            return str(e)
+
+    async def abort(self, path: str, keep: bool = True):
+        # Close file (deleted unless it can be resumed & should be kept)
+        await self.run_task(self.abort_file, path, keep)
+
+    def abort_all(self):
+        # Close all open files (without waiting)
+        def abort_all_files():
+            for path in set(self.files) | set(self.progress):
+                self.abort_file(path, True)
+        self.scheduler.add_task(self, abort_all_files, ())
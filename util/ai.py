@@ -1,10 +1,40 @@
 from util.util import Util
-from PIL import ImageFile
+from util.config import Config
+from util.timings import StageTimer
+from contextlib import nullcontext
+from collections.abc import Callable
+import itertools
+import threading
+import time
+import gc
+
+# Measure a stage if a timer is given
+def measure(timer: StageTimer, stage: str):
+    return timer.measure(stage) if timer is not None else nullcontext()
+
+# Memory used by a torch module (weights & buffers, like batch norm statistics)
+def get_module_size(module) -> int:
+    tensors = itertools.chain(module.parameters(), module.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
 
 # Description generation model
 class DescriptionModel:
 
-    def __init__(self):
+    # Info (changing any of these makes generated fields stale)
+    model_id: str = 'microsoft/Florence-2-large'
+    caption_prompt: str = '<MORE_DETAILED_CAPTION>' # <CAPTION> <DETAILED_CAPTION>
+    labels_prompt: str = '<OD>'
+
+    # Generation profiles
+    profiles: dict[str, dict] = {
+        'quality': { 'max_new_tokens': 1024, 'num_beams': 3 },
+        'fast': { 'max_new_tokens': 256, 'num_beams': 1 },
+    }
+
+    def __init__(self, timer: StageTimer = None):
+        # Start measuring load time
+        load_start = time.perf_counter()
+
         # Import libraries
         import torch
         from transformers import AutoProcessor, AutoModelForCausalLM
@@ -18,29 +48,49 @@ class DescriptionModel:
         self.model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=self.torch_dtype, trust_remote_code=True).to(self.device)
         self.processor = AutoProcessor.from_pretrained(model_path, trust_remote_code=True)
 
-    def run(self, image: ImageFile, prompt: str) -> str:
+        # Save load time
+        if timer is not None: timer.add('description_model_load', time.perf_counter() - load_start)
+
+    def run(self, image: "ImageFile", prompt: str, timer: StageTimer = None, stage: str = 'description') -> str:
+        # Prepare inputs
+        with measure(timer, f'{stage}_preprocess'):
+            inputs = self.processor(text=prompt, images=image, return_tensors='pt').to(self.device, self.torch_dtype)
+
         # Run prompt
-        inputs = self.processor(text=prompt, images=image, return_tensors='pt').to(self.device, self.torch_dtype)
-        generated_ids = self.model.generate(
-            input_ids=inputs['input_ids'],
-            pixel_values=inputs['pixel_values'],
-            max_new_tokens=1024,
-            num_beams=3
-        )
-        generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-        parsed_answer = self.processor.post_process_generation(generated_text, task=prompt, image_size=(image.width, image.height))
+        profile: dict = DescriptionModel.profiles.get(Config.get('model_profile'), DescriptionModel.profiles['quality'])
+        with measure(timer, f'{stage}_generate'):
+            generated_ids = self.model.generate(
+                input_ids=inputs['input_ids'],
+                pixel_values=inputs['pixel_values'],
+                max_new_tokens=profile['max_new_tokens'],
+                num_beams=profile['num_beams']
+            )
+
+        # Parse answer
+        with measure(timer, f'{stage}_postprocess'):
+            generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+            parsed_answer = self.processor.post_process_generation(generated_text, task=prompt, image_size=(image.width, image.height))
         return parsed_answer[prompt]
 
-    def generate_caption(self, image: ImageFile) -> str:
-        return self.run(image, '<MORE_DETAILED_CAPTION>').strip() # <CAPTION> <DETAILED_CAPTION>
+    def get_memory_size(self) -> int:
+        return get_module_size(self.model)
 
-    def generate_labels(self, image: ImageFile) -> list[str]:
-        return list(set(self.run(image, '<OD>')['labels'])) # list(set()) removes 
+    def generate_caption(self, image: "ImageFile", timer: StageTimer = None) -> str:
+        return self.run(image, DescriptionModel.caption_prompt, timer, 'caption').strip()
+
+    def generate_labels(self, image: "ImageFile", timer: StageTimer = None) -> list[str]:
+        return list(set(self.run(image, DescriptionModel.labels_prompt, timer, 'labels')['labels'])) # list(set()) removes 
 
 # Text detection model
 class TextModel:
 
-    def __init__(self):
+    # Info (changing it makes generated fields stale)
+    model_id: str = 'doctr/db_resnet50+crnn_vgg16_bn'
+
+    def __init__(self, timer: StageTimer = None):
+        # Start measuring load time
+        load_start = time.perf_counter()
+
         # Import libraries
         import torch
         from doctr.models import ocr_predictor
@@ -58,12 +108,197 @@ class TextModel:
         # Enable cuda if available
         if torch.cuda.is_available(): self.model.cuda()
 
-    def detect_text(self, image_path: str) -> list[str]:
+        # Save load time
+        if timer is not None: timer.add('text_model_load', time.perf_counter() - load_start)
+
+    def get_memory_size(self) -> int:
+        return get_module_size(self.model)
+
+    def detect_text(self, image_path: str, timer: StageTimer = None) -> list[str]:
         from doctr.io import DocumentFile
 
+        # Load the document
+        with measure(timer, 'text_decode'):
+            document = DocumentFile.from_images(image_path)
+
         # Analyze the document
-        result = self.model(DocumentFile.from_images(image_path))
+        with measure(timer, 'text_ocr'):
+            result = self.model(document)
 
         # Parse text
         full_text = result.render() # human-readable string of all text found
-        return [line.strip() for line in full_text.split('\n') if line.strip()] # Split by newlines to return a list of strings
\ No newline at end of file
+        return [line.strip() for line in full_text.split('\n') if line.strip()] # Split by newlines to return a list of strings
+
+# Model provenance (what generates each metadata field with the current config)
+class Provenance:
+
+    # Version of the generated fields format
+    schema_version: int = 1
+
+    @staticmethod
+    def get_current() -> dict[str, list]:
+        # Create records (model id, prompt, profile & schema version)
+        profile: str = Config.get('model_profile')
+        return {
+            'caption': [DescriptionModel.model_id, DescriptionModel.caption_prompt, profile, Provenance.schema_version],
+            'labels': [DescriptionModel.model_id, DescriptionModel.labels_prompt, profile, Provenance.schema_version],
+            'text': [TextModel.model_id, '', 'default', Provenance.schema_version],
+        }
+
+# Model manager (keeps models loaded between runs & unloads them when idle)
+class ModelManager:
+
+    # Models
+    factories: dict[str, Callable] = { 'description': DescriptionModel, 'text': TextModel }
+    models: dict[str, object] = {}
+    sizes: dict[str, int] = {}
+    last_used: dict[str, float] = {}
+    locks: dict[str, threading.Lock] = { name: threading.Lock() for name in factories }
+
+    # Usage (models are never unloaded for being idle while in use, the lock is held while checking it)
+    users: int = 0
+    users_lock: threading.Lock = threading.Lock()
+
+    # Idle watcher
+    watcher: threading.Thread = None
+    watcher_interval: int = 10
+
+    # Loading
+    @staticmethod
+    def is_loaded(name: str) -> bool:
+        return name in ModelManager.models
+
+    @staticmethod
+    def get_model(name: str, timer: StageTimer = None):
+        # Only load each model once at the same time
+        loaded: bool = False
+        with ModelManager.locks[name]:
+            # Load model if needed
+            if name not in ModelManager.models:
+                model = ModelManager.factories[name](timer)
+                ModelManager.models[name] = model
+                ModelManager.sizes[name] = ModelManager.get_memory_size(model)
+                loaded = True
+
+            # Mark as used
+            ModelManager.last_used[name] = time.monotonic()
+            model = ModelManager.models[name]
+
+        # Make room for the new model & watch for idle models
+        if loaded: ModelManager.check_memory_budget(name)
+        ModelManager.start_watcher()
+        return model
+
+    @staticmethod
+    def get_description_model(timer: StageTimer = None) -> DescriptionModel:
+        return ModelManager.get_model('description', timer)
+
+    @staticmethod
+    def get_text_model(timer: StageTimer = None) -> TextModel:
+        return ModelManager.get_model('text', timer)
+
+    @staticmethod
+    def preload(names: list[str], on_log: Callable[[str], None] = None):
+        # Load models in a background thread
+        def load():
+            for name in names:
+                # Check if already loaded
+                if ModelManager.is_loaded(name): continue
+
+                # Load model
+                if on_log: on_log(f'Preloading {name} model...')
+                try:
+                    ModelManager.get_model(name)
+                    if on_log: on_log(f'Preloaded {name} model')
+                except Exception as e:
+                    if on_log: on_log(f'Failed to preload {name} model: {e}')
+        threading.Thread(target=load, daemon=True).start()
+
+    # Usage
+    @staticmethod
+    def acquire():
+        with ModelManager.users_lock:
+            ModelManager.users += 1
+
+    @staticmethod
+    def release():
+        with ModelManager.users_lock:
+            ModelManager.users = max(ModelManager.users - 1, 0)
+
+        # Restart idle time from now
+        for name in ModelManager.models:
+            ModelManager.last_used[name] = time.monotonic()
+
+    # Unloading
+    @staticmethod
+    def get_memory_size(model) -> int:
+        # Estimate model size (weights & buffers, memory used while running it isn't counted)
+        try:
+            return model.get_memory_size()
+        except Exception:
+            return 0
+
+    @staticmethod
+    def unload(name: str, idle_time: float = 0):
+        # Remove model (only if it wasn't used for the idle time, it may have been used since it was checked)
+        with ModelManager.locks[name]:
+            if name not in ModelManager.models: return
+            if time.monotonic() - ModelManager.last_used.get(name, 0) < idle_time: return
+            del ModelManager.models[name]
+            ModelManager.sizes.pop(name, None)
+            ModelManager.last_used.pop(name, None)
+
+        # Free memory
+        ModelManager.free_memory()
+
+    @staticmethod
+    def free_memory():
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available(): torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    @staticmethod
+    def unload_all():
+        for name in list(ModelManager.models):
+            ModelManager.unload(name)
+
+    @staticmethod
+    def check_memory_budget(keep: str = None):
+        # Check if there is a budget
+        budget: int = Config.get('model_memory_budget') * 1024 * 1024
+        if budget <= 0: return
+
+        # Unload least recently used models until loaded models fit in the budget (also while fixing, when memory peaks, a
+        # stage using an unloaded model keeps it until its item finishes & loads it again for the next one)
+        while sum(ModelManager.sizes.values()) > budget:
+            candidates = [ name for name in ModelManager.models if name != keep ]
+            if len(candidates) <= 0: break
+            ModelManager.unload(min(candidates, key=lambda name: ModelManager.last_used.get(name, 0)))
+
+    @staticmethod
+    def check_idle():
+        # Check if there is a timeout
+        timeout: int = Config.get('model_idle_timeout')
+        if timeout <= 0: return
+
+        # Unload models that have not been used for a while (holding the usage lock, so a run can't start in the middle)
+        with ModelManager.users_lock:
+            if ModelManager.users > 0: return
+            for name in list(ModelManager.models):
+                ModelManager.unload(name, timeout)
+
+    @staticmethod
+    def start_watcher():
+        # Check if already watching
+        if ModelManager.watcher is not None and ModelManager.watcher.is_alive(): return
+
+        # Check for idle models until all are unloaded
+        def watch():
+            while len(ModelManager.models) > 0:
+                time.sleep(ModelManager.watcher_interval)
+                ModelManager.check_idle()
+        ModelManager.watcher = threading.Thread(target=watch, daemon=True)
+        ModelManager.watcher.start()
@@ -0,0 +1,50 @@
+from util.util import Util
+
+# App config
+class Config:
+
+    # Config
+    configPath: str = Util.join_path(Util.get_data_path(), 'config.json')
+    defaults: dict = {
+        # Models
+        'model_preload': True,        # Load models in the background when opening the metadata menu
+        'model_idle_timeout': 600,    # Seconds without use before models are unloaded (0 = never)
+        'model_memory_budget': 0,     # MB that loaded models can use before unloading the oldest (0 = no limit)
+        'model_profile': 'quality',   # Description generation profile ("quality" or "fast")
+
+        # Logs
+        'log_level': 'info',          # Lowest level of the logs shown ("debug", "info", "warning" or "error")
+        'log_max_lines': 5000,        # Logs kept by each menu (older ones are removed)
+
+        # Sync
+        'sync_max_clients': 4,        # Phones that can be connected at once (each one syncs on its own)
+        'sync_window_initial': 4,     # Item parts requested at once when a sync starts (clients that support it)
+        'sync_window_max': 64,        # Max item parts requested at once
+        'sync_concurrent_items': 4,   # Items requested at once (clients that support it)
+        'sync_write_buffer': 64,      # MB of received data of each phone that can wait to be written before receiving more
+        'sync_bundle_size': 32,       # MB of small items requested at once in a bundle (clients that support it, 0 = no bundles)
+        'sync_bundle_item_size': 8,   # MB of the biggest item that can be requested in a bundle
+        'sync_hash_check': True,      # Compare sampled hashes of items with the same size but a different date before downloading them again
+        'sync_metadata_compression': True, # Compress metadata parts sent to clients that support it
+    }
+    values: dict = dict(defaults)
+
+    @staticmethod
+    def load_config():
+        # Load config save from file (missing keys use defaults)
+        save = Util.load_json(Config.configPath)
+        Config.values = dict(Config.defaults)
+        Config.values.update({ key: value for key, value in save.items() if key in Config.defaults })
+
+        # Save config only if keys are missing (so new keys appear in the file)
+        if any(key not in save for key in Config.defaults): Config.save_config()
+
+    @staticmethod
+    def save_config():
+        # Save config into file
+        Util.create_folder(Util.get_data_path())
+        Util.save_json(Config.configPath, Config.values, True)
+
+    @staticmethod
+    def get(key: str):
+        return Config.values.get(key, Config.defaults[key])
@@ -1,8 +1,8 @@
 from util.util import Util
-from os import listdir
-from os.path import isfile
 from collections.abc import Callable
+import threading
 import shutil
+import os
 
 # Link
 class Link:
@@ -41,6 +41,38 @@ class MetadataUtil:
         # Check if item metadata has text
         return ('text' in item_metadata) and (type(item_metadata['text']) is list)
 
+    @staticmethod
+    def has_valid_field(item_metadata: dict, field: str) -> bool:
+        # Check if item metadata has a generated field
+        match field:
+            case 'caption': return MetadataUtil.has_valid_caption(item_metadata)
+            case 'labels': return MetadataUtil.has_valid_labels(item_metadata)
+            case 'text': return MetadataUtil.has_valid_text(item_metadata)
+        return False
+
+    # Provenance (what generated each field)
+    @staticmethod
+    def get_provenance(item_metadata: dict, field: str) -> list:
+        # Check if item metadata has provenance
+        provenance = item_metadata.get('provenance')
+        if type(provenance) is not dict: return None
+
+        # Get field provenance
+        return provenance.get(field)
+
+    @staticmethod
+    def set_provenance(item_metadata: dict, field: str, record: list):
+        # Make sure item metadata has provenance
+        if type(item_metadata.get('provenance')) is not dict: item_metadata['provenance'] = {}
+
+        # Update field provenance
+        item_metadata['provenance'][field] = record
+
+    @staticmethod
+    def is_stale(item_metadata: dict, field: str, record: list) -> bool:
+        # Fields without provenance were generated before it existed, so they are stale too
+        return MetadataUtil.get_provenance(item_metadata, field) != record
+
 # Album items
 class Item:
 
@@ -71,6 +103,9 @@ class Album:
         self.items_with_metadata: int = 0
         self.items_without_metadata: int = 0
 
+        # Metadata changed since it was loaded or saved (cached albums with changes are loaded again)
+        self.has_unsaved_changes: bool = False
+
         # Load metadata
         self.load_metadata()
 
@@ -101,6 +136,10 @@ class Album:
 
         # Save metadata
         Util.save_json(self.metadata_path, self.metadata)
+        self.has_unsaved_changes = False
+
+        # Keep cached album (it already has the saved metadata)
+        AlbumCache.update(self)
 
     def item_has_metadata(self, item_name: str) -> bool:
         # Check if item has metadata
@@ -116,6 +155,7 @@ class Album:
     def set_item_metadata(self, item_name: str, item_metadata: dict):
         # Update item metadata
         self.metadata[item_name] = item_metadata
+        self.has_unsaved_changes = True
 
     def clean_metadata(self):
         # Create new metadata
@@ -134,6 +174,7 @@ class Album:
 
         # Replace old metadata with the new one
         self.metadata = new_metadata
+        self.has_unsaved_changes = True
 
     # Album items
     def load_items(self, filter: list[str]):
@@ -145,33 +186,27 @@ class Album:
         self.items_with_metadata: int = 0
         self.items_without_metadata: int = 0
 
-        # Load album items
-        unfiltered_items = listdir(self.album_path)
-        for item_name in unfiltered_items:
-            # Create item path
-            item_path = Util.join_path(self.album_path, item_name)
-
-            # Check if item is a file
-            if not isfile(item_path): continue
+        # Load album items (scandir knows if an entry is a file without reading its info)
+        formats: tuple[str] = tuple(filter)
+        with os.scandir(self.album_path) as entries:
+            for entry in entries:
+                # Check if item is a file
+                item_name: str = entry.name
+                if not entry.is_file(): continue
 
-            # Check if item has a valid format
-            is_valid = False
-            for format in filter:
-                if item_name.lower().endswith(format):
-                    is_valid = True
-                    break
-            if not is_valid: continue
+                # Check if item has a valid format
+                if not item_name.lower().endswith(formats): continue
 
-            # Save item
-            self.items.append(Item(item_path, item_name))
+                # Save item
+                self.items.append(Item(Util.join_path(self.album_path, item_name), item_name))
 
-            # Check if item has metadata
-            if self.item_has_metadata(item_name):
-                # Has metadata -> Increase "with" count
-                self.items_with_metadata += 1
-            else:
-                # No metadata -> Increase "without" count
-                self.items_without_metadata += 1
+                # Check if item has metadata
+                if self.item_has_metadata(item_name):
+                    # Has metadata -> Increase "with" count
+                    self.items_with_metadata += 1
+                else:
+                    # No metadata -> Increase "without" count
+                    self.items_without_metadata += 1
 
         # Sort items
         self.sort_items()
@@ -195,7 +230,7 @@ class Album:
                 # No metadata -> Increase "without" count
                 self.items_without_metadata += 1
 
-    def search(self, search: str, on_result: Callable[[str], None]):
+    def search(self, search: str, on_result: Callable[[Item, int], None]):
         # Ignore case
         search = search.casefold()
 
@@ -208,15 +243,73 @@ class Album:
             # Get metadata key
             item_metadata = self.get_item_metadata(item.name)
 
-            # Check if metadata contains search
-            if (
-                (search in item.name) or
-                (MetadataUtil.has_valid_caption(item_metadata) and search in item_metadata['caption'].casefold()) or 
-                (MetadataUtil.has_valid_labels(item_metadata) and any(search in item.casefold() for item in item_metadata['labels'])) or 
-                (MetadataUtil.has_valid_text(item_metadata) and any(search in item.casefold() for item in item_metadata['text']))
-            ): 
-                # Metadata contains search -> Call on result with item path
-                on_result(item.path)
+            # Score item by where the search was found (name, caption, each label & each text)
+            score: int = 0
+            if search in item.name.casefold(): score += 8
+            if MetadataUtil.has_valid_caption(item_metadata) and search in item_metadata['caption'].casefold(): score += 4
+            if MetadataUtil.has_valid_labels(item_metadata): score += 2 * sum(1 for label in item_metadata['labels'] if search in label.casefold())
+            if MetadataUtil.has_valid_text(item_metadata): score += sum(1 for text in item_metadata['text'] if search in text.casefold())
+
+            # Metadata contains search -> Call on result with item & score
+            if score > 0: on_result(item, score)
+
+# Album cache (albums loaded while the app runs, reused until their folder or metadata file change or they have unsaved changes)
+class AlbumCache:
+
+    # Album & stamp of its files when loaded (link paths & filter -> entry)
+    albums: dict[tuple, tuple[Album, tuple]] = {}
+
+    # Lock (albums are loaded from worker threads)
+    lock: threading.Lock = threading.Lock()
+
+
+    # Stamps
+    @staticmethod
+    def get_file_stamp(path: str) -> tuple:
+        # Modified time & size of a file or folder (None if it doesn't exist)
+        try:
+            stat: os.stat_result = os.stat(path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    @staticmethod
+    def get_stamp(album_path: str, metadata_path: str) -> tuple:
+        # A folder changes when items are added, removed or renamed (items edited in place keep their cached order)
+        return (AlbumCache.get_file_stamp(album_path), AlbumCache.get_file_stamp(metadata_path))
+
+    # Albums
+    @staticmethod
+    def load(link: Link, filter: list[str]) -> Album:
+        # Get stamp before loading (so changes made while loading are found next time)
+        key: tuple = (link.album_path, link.metadata_path, tuple(filter))
+        stamp: tuple = AlbumCache.get_stamp(link.album_path, link.metadata_path)
+
+        # Check if cached album is up to date (albums are shared, so one changed by a fix that failed before saving is loaded again)
+        with AlbumCache.lock:
+            cached: tuple[Album, tuple] = AlbumCache.albums.get(key)
+        if cached is not None and cached[1] == stamp and not cached[0].has_unsaved_changes: return cached[0]
+
+        # Load & cache album
+        album: Album = Album(link, filter)
+        with AlbumCache.lock:
+            AlbumCache.albums[key] = (album, stamp)
+        return album
+
+    @staticmethod
+    def update(album: Album):
+        # Update stamp of a cached album after saving it (other albums with the same paths are found outdated by their stamp)
+        with AlbumCache.lock:
+            for key, (cached_album, _) in AlbumCache.albums.items():
+                if cached_album is album: AlbumCache.albums[key] = (album, AlbumCache.get_stamp(album.album_path, album.metadata_path))
+
+    @staticmethod
+    def remove_unlinked(links: list[Link]):
+        # Remove albums of links that no longer exist
+        linked: set[tuple[str, str]] = { (link.album_path, link.metadata_path) for link in links }
+        with AlbumCache.lock:
+            for key in [key for key in AlbumCache.albums if (key[0], key[1]) not in linked]:
+                AlbumCache.albums.pop(key)
 
 # Library
 class Library:
@@ -261,20 +354,27 @@ class Library:
         Library.save_links()
 
     # Albums
-    def load_albums(filter: list[str] = Filter.all, validate_metadata: bool = True):
+    def load_albums(filter: list[str] = Filter.all, validate_metadata: bool = True, use_cache: bool = False, on_progress: Callable[[int, int], None] = None):
         # Create albums list
         albums = []
 
         # Create albums from links
-        for link in Library.links:
+        links: list[Link] = list(Library.links)
+        for link_index, link in enumerate(links):
             # Check if link is valid
             if (validate_metadata and not link.is_valid()) or (not validate_metadata and not link.is_album_valid()): 
                 # Not valid -> Stop loading
                 return (False, [])
 
-            # Create & add album
-            album = Album(link, filter)
+            # Create & add album (cached albums are shared, so only use them if changes are saved)
+            album = AlbumCache.load(link, filter) if use_cache else Album(link, filter)
             albums.append(album)
 
+            # Report progress (loaded albums & total)
+            if on_progress is not None: on_progress(link_index + 1, len(links))
+
+        # Forget albums of removed links
+        if use_cache: AlbumCache.remove_unlinked(links)
+
         # Finish loading
         return (True, albums)
@@ -0,0 +1,39 @@
+from util.logs import LogLevel, LogEntry, LogStore
+from textual.widgets import RichLog
+from rich.text import Text
+
+# Log view (shows the logs of a store, new logs are added in batches)
+class LogView(RichLog):
+
+    # Seconds between checks for new logs
+    refresh_seconds: float = 0.1
+
+
+    # Constructor
+    def __init__(self, store: LogStore, **kwargs):
+        # Store & sequence number of the next log to show
+        self.store: LogStore = store
+        self.sequence: int = 0
+
+        # Init parent (only the logs the store keeps are shown)
+        super().__init__(max_lines=store.entries.maxlen, wrap=True, markup=False, highlight=False, auto_scroll=False, **kwargs)
+
+    # State
+    def on_mount(self):
+        # Show logs already in the store & check for new ones on an interval
+        self.show_new_logs()
+        self.set_interval(LogView.refresh_seconds, self.show_new_logs)
+
+    # Logs
+    def show_new_logs(self):
+        # Get new logs
+        (entries, self.sequence) = self.store.get_since(self.sequence)
+        if len(entries) == 0: return
+
+        # Only follow new logs if already at the bottom
+        follow: bool = self.is_vertical_scroll_end
+
+        # Add logs (scrolling once after the last one)
+        last: LogEntry = entries[-1]
+        for entry in entries:
+            self.write(Text(entry.message, style=LogLevel.styles.get(entry.level, '')), scroll_end=follow and entry is last)
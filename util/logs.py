@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from collections import deque
+from itertools import islice
+from datetime import datetime
+import threading
+
+# Log levels (no UI imports, so any module can log without loading textual)
+class LogLevel:
+    DEBUG: int = 10
+    INFO: int = 20
+    WARNING: int = 30
+    ERROR: int = 40
+
+    # Names used in the config
+    names: dict[str, int] = { 'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR }
+
+    # Styles used when showing logs
+    styles: dict[int, str] = { DEBUG: 'dim', WARNING: 'yellow', ERROR: 'bold red' }
+
+    @staticmethod
+    def parse(name: str) -> int:
+        return LogLevel.names.get(str(name).lower(), LogLevel.INFO)
+
+# Log entry
+@dataclass
+class LogEntry:
+    time: datetime
+    level: int
+    message: str
+
+# Log store (ring buffer of the last logs, can be written from any thread)
+class LogStore:
+
+    # Logs kept by each store (older ones are dropped)
+    max_entries: int = 5000
+
+    # Logs below this level are ignored
+    min_level: int = LogLevel.INFO
+
+
+    # Constructor
+    def __init__(self, max_entries: int = None):
+        # Entries & total entries added (used as the sequence number of the next entry)
+        self.entries: deque[LogEntry] = deque(maxlen=max_entries if max_entries is not None else LogStore.max_entries)
+        self.count: int = 0
+
+        # Lock (logs are added from worker threads & read from the UI thread)
+        self.lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # Logs
+    def add(self, message: str, level: int = LogLevel.INFO):
+        # Check level
+        if level < LogStore.min_level: return
+
+        # Add entry
+        entry: LogEntry = LogEntry(datetime.now(), level, message)
+        with self.lock:
+            self.entries.append(entry)
+            self.count += 1
+
+    def get_since(self, sequence: int) -> tuple[list[LogEntry], int]:
+        # Get entries added after a sequence number & the new sequence number (dropped entries are skipped)
+        with self.lock:
+            first: int = self.count - len(self.entries)
+            start: int = max(sequence - first, 0)
+            return (list(islice(self.entries, start, None)), self.count)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
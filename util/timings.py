@@ -0,0 +1,137 @@
+from util.util import Util
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import time
+
+# Stage timer (wall time spent in each stage of an item or run)
+class StageTimer:
+
+    # Constructor
+    def __init__(self):
+        # Seconds spent in each stage & times each stage was measured
+        self.stages: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    # Measuring
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+# Timing report (per stage totals, throughput & raw per item timings of a run)
+class TimingReport:
+
+    # Paths
+    folder_path: str = Util.join_path(Util.get_data_path(), 'timings')
+
+
+    # Constructor
+    def __init__(self, name: str, total_items: int):
+        # Info
+        self.total_items: int = total_items
+        self.items_done: int = 0
+
+        # Stage totals (seconds & times measured)
+        self.stage_seconds: dict[str, float] = {}
+        self.stage_counts: dict[str, int] = {}
+
+        # Active time (pauses are not counted)
+        self.start_time: float = time.perf_counter()
+        self.paused_time: float = None
+        self.paused_seconds: float = 0
+
+        # Raw timings file
+        Util.create_folder(TimingReport.folder_path)
+        self.run_id: str = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.path: str = Util.join_path(TimingReport.folder_path, f'{name}_{self.run_id}.jsonl')
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    # Recording
+    def add_stages(self, timer: StageTimer):
+        for stage, seconds in timer.stages.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + seconds
+            self.stage_counts[stage] = self.stage_counts.get(stage, 0) + timer.counts[stage]
+
+    def add_item(self, album_index: int, item_name: str, timer: StageTimer):
+        # Update totals
+        self.items_done += 1
+        self.add_stages(timer)
+
+        # Write raw timings
+        self.write({
+            'type': 'item',
+            'run': self.run_id,
+            'album': album_index,
+            'item': item_name,
+            'total': round(timer.total(), 4),
+            'stages': { stage: round(seconds, 4) for stage, seconds in timer.stages.items() }
+        })
+
+    def write(self, line: dict):
+        self.file.write(json.dumps(line, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    # Pausing
+    def pause(self):
+        if self.paused_time is None: self.paused_time = time.perf_counter()
+
+    def resume(self):
+        if self.paused_time is None: return
+        self.paused_seconds += time.perf_counter() - self.paused_time
+        self.paused_time = None
+
+    # Throughput
+    def get_elapsed(self) -> float:
+        end = self.paused_time if self.paused_time is not None else time.perf_counter()
+        return end - self.start_time - self.paused_seconds
+
+    def get_items_per_minute(self) -> float:
+        elapsed = self.get_elapsed()
+        return (self.items_done / elapsed * 60) if elapsed > 0 else 0
+
+    def get_eta(self) -> float:
+        items_per_minute = self.get_items_per_minute()
+        remaining = max(self.total_items - self.items_done, 0)
+        return (remaining / items_per_minute * 60) if items_per_minute > 0 else 0
+
+    # Reports
+    @staticmethod
+    def format_seconds(seconds: float) -> str:
+        seconds = int(seconds)
+        return f'{seconds // 3600}h {seconds % 3600 // 60:02d}m {seconds % 60:02d}s'
+
+    def get_summary(self) -> str:
+        return f'{self.items_done}/{self.total_items} items · {self.get_items_per_minute():.1f} items/min · ETA {TimingReport.format_seconds(self.get_eta())}'
+
+    def get_report(self) -> list[str]:
+        # Create report lines
+        lines = [ f'Time: {TimingReport.format_seconds(self.get_elapsed())} · {self.items_done} items · {self.get_items_per_minute():.1f} items/min' ]
+        total_seconds = sum(self.stage_seconds.values())
+        for stage, seconds in sorted(self.stage_seconds.items(), key=lambda stage: stage[1], reverse=True):
+            average = seconds / self.stage_counts[stage]
+            percent = (seconds / total_seconds * 100) if total_seconds > 0 else 0
+            lines.append(f'· {stage}: {seconds:.1f}s total, {average:.3f}s avg, {percent:.1f}%')
+        return lines
+
+    def close(self):
+        # Write summary & close raw timings file
+        self.write({
+            'type': 'summary',
+            'run': self.run_id,
+            'items': self.items_done,
+            'elapsed': round(self.get_elapsed(), 4),
+            'itemsPerMinute': round(self.get_items_per_minute(), 4),
+            'stages': { stage: { 'total': round(seconds, 4), 'count': self.stage_counts[stage] } for stage, seconds in self.stage_seconds.items() }
+        })
+        self.file.close()
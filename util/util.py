@@ -1,10 +1,9 @@
+from util.logs import LogLevel, LogStore
 import json
+import asyncio
 import pathlib
 import os
-import websockets
 import socket
-import tkinter as tk
-from tkinter import filedialog
 
 # Util functions
 class Util:
@@ -35,6 +34,14 @@ class Util:
     def exists_path(path: str) -> bool:
         return os.path.exists(path)
 
+    @staticmethod
+    def create_folder(path: str):
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def delete_path(path: str):
+        pathlib.Path(path).unlink(missing_ok=True)
+
     @staticmethod
     def get_last_modified(path: str) -> float:
         return os.path.getmtime(path)
@@ -50,6 +57,9 @@ class Util:
     # Explorer
     @staticmethod
     def ask_for_folder(title: str = None) -> str:
+        # Import tkinter when first used (so it doesn't slow down startup)
+        import tkinter as tk
+        from tkinter import filedialog
         root = tk.Tk()
         root.withdraw()
         root.attributes('-topmost', True) # Bring to front
@@ -59,6 +69,9 @@ class Util:
 
     @staticmethod
     def ask_for_file(title: str = None) -> str:
+        # Import tkinter when first used (so it doesn't slow down startup)
+        import tkinter as tk
+        from tkinter import filedialog
         root = tk.Tk()
         root.withdraw()
         root.attributes('-topmost', True) # Bring to front
@@ -84,13 +97,18 @@ class Util:
 # WebSocket server
 class Server:
 
+    # Connections allowed at once
+    max_connections: int = 1
+
+
     # Constructor
     def __init__(self):
         # Server
-        self.logs = []
+        self.logs = LogStore()
         self.is_running = False
         self.is_connected = False
-        self.connection: websockets.ServerConnection = None
+        self.connections: set["websockets.ServerConnection"] = set()
+        self.loop: asyncio.AbstractEventLoop = None
 
     # Server logic
     async def start(self, HOST: str = '0.0.0.0', PORT: int = 6969):
@@ -99,9 +117,13 @@ class Server:
             self.log_message('Server is already running')
             return
 
-        # Save connection address
+        # Import websockets when the server starts (so it doesn't slow down startup)
+        import websockets
+
+        # Save connection address & event loop (connections can only be used from it)
         self.IP = Util.get_local_ip()
         self.PORT = PORT
+        self.loop = asyncio.get_running_loop()
 
         # Log starting
         self.log_message(f'Starting server in {self.IP}:{self.PORT}...')
@@ -123,7 +145,7 @@ class Server:
 
         # Error
         except Exception as e:
-            self.log_message(f"Internal error: {e}")
+            self.log_message(f"Internal error: {e}", LogLevel.ERROR)
 
         # Finished
         finally:
@@ -131,47 +153,50 @@ class Server:
             self.is_running = False
             self.on_server_state_changed(self.is_running)
 
-    async def handler(self, websocket: websockets.ServerConnection):
+    async def handler(self, websocket: "websockets.ServerConnection"):
+        # Websockets (already imported when the server started)
+        import websockets
+
         # Get IP
         client_ip = websocket.remote_address[0]
 
-        # Only allow 1 connection
-        if self.is_connected:
-            self.log_message(f'Connection from {client_ip} refused, only 1 connection is allowed')
+        # Check connections limit
+        if len(self.connections) >= self.max_connections:
+            self.log_message(f'Connection from {client_ip} refused, only {self.max_connections} connection{"s are" if self.max_connections != 1 else " is"} allowed', LogLevel.WARNING)
             await websocket.close()
             return
 
         # Save connection
+        self.connections.add(websocket)
         self.is_connected = True
-        self.connection = websocket
-        self.on_connection_state_changed(True, client_ip)
+        self.on_connection_state_changed(True, websocket)
 
         # Listen for messages
         try:
             # Wait for data received
             async for message in websocket:
                 if isinstance(message, str):
-                    await self.on_received_string(message)
+                    await self.on_received_string(websocket, message)
                 else:
-                    await self.on_received_binary(message)
+                    await self.on_received_binary(websocket, message)
 
         # Errors
         except websockets.ConnectionClosed as e:
             self.log_message(f"Connection closed: {e}")
         except Exception as e:
-            self.log_message(f"Internal error: {e}")
+            self.log_message(f"Internal error: {e}", LogLevel.ERROR)
 
         # Finished
         finally:
             # Free connection
-            self.is_connected = False
-            self.connection = None
-            self.on_connection_state_changed(False, client_ip)
+            self.connections.discard(websocket)
+            self.is_connected = len(self.connections) > 0
+            self.on_connection_state_changed(False, websocket)
 
     # Logs
-    def log_message(self, message: str):
+    def log_message(self, message: str, level: int = LogLevel.INFO):
         # Log
-        self.logs.append(message)
+        self.logs.add(message, level)
 
     # State
     def on_server_state_changed(self, is_running: bool):
@@ -181,24 +206,25 @@ class Server:
         else:
             self.log_message(f'Server is now not running')
 
-    def on_connection_state_changed(self, is_open: bool, client_ip: str):
+    def on_connection_state_changed(self, is_open: bool, connection: "websockets.ServerConnection"):
         # Log
+        client_ip = connection.remote_address[0]
         if is_open:
             self.log_message(f'Connected to client with IP {client_ip}')
         else:
             self.log_message(f'Disconnected from client with IP {client_ip}')
 
     # Data
-    async def on_received_string(self, message: str):
+    async def on_received_string(self, connection: "websockets.ServerConnection", message: str):
         # Log
         self.log_message(f'Received string: {len(message)} chars')
 
-    async def on_received_binary(self, data: bytes):
+    async def on_received_binary(self, connection: "websockets.ServerConnection", data: bytes):
         # Log
         self.log_message(f'Received bytes: {len(data)} bytes')
 
     # Helpers
-    async def send(self, data):
+    async def send(self, connection: "websockets.ServerConnection", data):
         # Send data to client
-        if self.is_connected:
-            await self.connection.send(data)
+        if connection in self.connections:
+            await connection.send(data)